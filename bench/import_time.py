@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+'''Usage:
+          import_time.py [--runs=<n>] [--budget=<seconds>]
+
+Measures how long a fresh interpreter takes to import the listener runtime,
+and fails (exit status 1) if the median exceeds the budget or if the import
+drags in any of the authoring modules the listen path must not load.
+Each run is a new subprocess, so nothing is cached in sys.modules.
+'''
+
+import sys
+import json
+import getopt
+import subprocess
+
+
+RUNTIME_MODULE = 'eavesdroppr.runtime'
+
+DEFAULT_RUNS = 15
+DEFAULT_BUDGET_SECONDS = 0.25
+
+# modules which only the authoring CLI, code generation or optional
+# channel features need
+FORBIDDEN_MODULES = ['cmd',
+                     'docopt',
+                     'jinja2',
+                     'numpy',
+                     'snap.common',
+                     'snap.cli_tools',
+                     'eavesdroppr.core',
+                     'eavesdroppr.metaobjects',
+                     'eavesdroppr.codegen',
+                     'eavesdroppr.config_templates',
+                     'eavesdroppr.bootstrap',
+                     'eavesdroppr.columnar']
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules.keys())}))
+''' % RUNTIME_MODULE
+
+
+def probe():
+    output = subprocess.check_output([sys.executable, '-c', PROBE])
+    return json.loads(output.decode('utf-8').strip().split('\n')[-1])
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main(argv):
+    opts, _ = getopt.getopt(argv, '', ['runs=', 'budget='])
+    options = dict(opts)
+    runs = int(options.get('--runs') or DEFAULT_RUNS)
+    budget = float(options.get('--budget') or DEFAULT_BUDGET_SECONDS)
+
+    results = [probe() for i in range(runs)]
+    elapsed = median([r['elapsed'] for r in results])
+    loaded = [m for m in FORBIDDEN_MODULES if m in results[0]['modules']]
+
+    print('import %s: median %.1f ms over %d runs (budget %.1f ms), %d modules loaded' \
+          % (RUNTIME_MODULE, elapsed * 1000, runs, budget * 1000, len(results[0]['modules'])))
+
+    failed = False
+    if loaded:
+        print('FAIL: the runtime imports authoring modules: %s' % ', '.join(loaded))
+        failed = True
+    if elapsed > budget:
+        print('FAIL: median import time is over budget')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
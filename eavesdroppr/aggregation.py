@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import time
+import numbers
+from collections import deque
+
+
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_MAX_GROUPS = 10000
+
+SUPPORTED_METRICS = ['count', 'sum', 'min', 'max']
+
+OVERFLOW_GROUP = ('__overflow__',)
+
+
+class UnsupportedAggregateMetric(Exception):
+    def __init__(self, metric):
+        Exception.__init__(self,
+                           'The aggregate metric "%s" is not supported. Supported metrics are: %s' \
+                           % (metric, ', '.join(SUPPORTED_METRICS)))
+
+
+class InvalidAggregateWindow(Exception):
+    def __init__(self, window, slide):
+        Exception.__init__(self,
+                           'An aggregate window of %s seconds cannot slide by %s seconds; '
+                           'the slide must evenly divide the window.' % (window, slide))
+
+
+def parse_metrics(metric_configs):
+    '''Turns entries such as "count" or {"sum": "amount"} into a list of
+    (metric, field_name) pairs.
+    '''
+    metrics = []
+    for mc in metric_configs or ['count']:
+        if isinstance(mc, dict):
+            for metric, field_name in mc.items():
+                metrics.append((metric, field_name))
+        else:
+            metrics.append((mc, None))
+
+    for metric, field_name in metrics:
+        if metric not in SUPPORTED_METRICS:
+            raise UnsupportedAggregateMetric(metric)
+    return metrics
+
+
+def metric_name(metric, field_name):
+    if field_name is None:
+        return metric
+    return '%s_%s' % (metric, field_name)
+
+
+def combine(metric, current, value):
+    if current is None:
+        return value
+    if metric == 'min':
+        return min(current, value)
+    if metric == 'max':
+        return max(current, value)
+    return current + value
+
+
+
+class Pane(object):
+    '''Partial aggregates for one slice of time, capped at max_groups
+    groups; events for further groups are folded into OVERFLOW_GROUP.
+    '''
+
+    def __init__(self, start, max_groups):
+        self.start = start
+        self.groups = {}
+        self._max_groups = max_groups
+
+
+    def add(self, group_key, data, metrics):
+        aggregates = self.groups.get(group_key)
+        if aggregates is None:
+            if len(self.groups) >= self._max_groups:
+                group_key = OVERFLOW_GROUP
+                aggregates = self.groups.setdefault(group_key, {})
+            else:
+                aggregates = self.groups[group_key] = {}
+
+        for metric, field_name in metrics:
+            name = metric_name(metric, field_name)
+            if metric == 'count':
+                aggregates[name] = aggregates.get(name, 0) + 1
+                continue
+            value = data.get(field_name)
+            if isinstance(value, numbers.Number) and not isinstance(value, bool):
+                aggregates[name] = combine(metric, aggregates.get(name), value)
+
+
+
+class WindowAggregator(object):
+    '''Aggregates a channel's events into tumbling or sliding windows of
+    processing time and calls the handler once per window as
+    handler(window, svc_object_registry), where window is a dict with
+    "channel", "start", "end" and "groups", the last mapping each group-by
+    key tuple to its aggregates (count, sum_<field>, ...).
+
+    Sliding windows are assembled from panes of "slide" seconds, so memory
+    is bounded by max_groups per pane times window/slide panes.
+    '''
+
+    def __init__(self, channel_id, handler_function, **kwargs):
+        self._channel_id = channel_id
+        self._handler = handler_function
+        self._group_by = list(kwargs.get('group_by') or [])
+        self._metrics = parse_metrics(kwargs.get('metrics'))
+        self._window = float(kwargs.get('window') or DEFAULT_WINDOW_SECONDS)
+        self._slide = float(kwargs.get('slide') or self._window)
+        self._max_groups = int(kwargs.get('max_groups') or DEFAULT_MAX_GROUPS)
+
+        num_panes = self._window / self._slide
+        if num_panes < 1 or num_panes != int(num_panes):
+            raise InvalidAggregateWindow(self._window, self._slide)
+        self._panes = deque()
+        self._next_emit = None
+
+
+    def _pane_start(self, now):
+        return int(now / self._slide) * self._slide
+
+
+    @property
+    def has_pending(self):
+        return len(self._panes) > 0
+
+
+    @property
+    def flush_interval(self):
+        if self._next_emit is None:
+            return self._slide
+        return max(0.0, self._next_emit - time.time())
+
+
+    def expired(self, now):
+        return self._next_emit is not None and now >= self._next_emit
+
+
+    def add(self, event, svc_object_registry):
+        now = time.time()
+        if self.expired(now):
+            self.flush(svc_object_registry)
+
+        pane_start = self._pane_start(now)
+        if not self._panes or self._panes[-1].start != pane_start:
+            self._panes.append(Pane(pane_start, self._max_groups))
+            if self._next_emit is None:
+                self._next_emit = pane_start + self._slide
+
+        data = event.data()
+        group_key = tuple([data.get(f) for f in self._group_by])
+        self._panes[-1].add(group_key, data, self._metrics)
+
+
+    def flush(self, svc_object_registry):
+        '''Emits every window which has closed; open windows are kept, so an
+        idle flush never delivers a partial window.
+        '''
+        now = time.time()
+        while self._next_emit is not None and now >= self._next_emit:
+            self._emit_next(svc_object_registry)
+
+
+    def drain(self, svc_object_registry):
+        '''Emits every window holding data, including those still open,
+        which are delivered early with "partial" set. Used when the channel
+        is about to be replaced, so that no aggregated event is lost.
+        '''
+        now = time.time()
+        while self._next_emit is not None:
+            self._emit_next(svc_object_registry, partial=now < self._next_emit)
+
+
+    def _emit_next(self, svc_object_registry, partial=False):
+        window_end = self._next_emit
+        window_start = window_end - self._window
+        panes = [p for p in self._panes if window_start <= p.start < window_end]
+        if panes:
+            window = self._merge(panes, window_start, window_end)
+            if partial:
+                window['partial'] = True
+            self._handler(window, svc_object_registry)
+
+        # drop panes which can no longer contribute to a later window
+        while self._panes and self._panes[0].start < window_end + self._slide - self._window:
+            self._panes.popleft()
+
+        if self._panes:
+            self._next_emit = window_end + self._slide
+        else:
+            self._next_emit = None
+
+
+    def _merge(self, panes, window_start, window_end):
+        groups = {}
+        for pane in panes:
+            for group_key, aggregates in pane.groups.items():
+                merged = groups.setdefault(group_key, {})
+                for name, value in aggregates.items():
+                    metric = name.split('_', 1)[0]
+                    merged[name] = combine(metric, merged.get(name), value)
+
+        return {'channel': self._channel_id,
+                'start': window_start,
+                'end': window_end,
+                'group_by': self._group_by,
+                'groups': groups}
+
+
+
+def create_window_aggregator(channel_id, channel_config, handler_function):
+    '''Returns a WindowAggregator if the channel declares an "aggregate"
+    section in the initfile, otherwise None:
+
+        aggregate:
+            group_by: [type, region]
+            metrics:
+                - count
+                - sum: amount
+                - max: amount
+            window: 60         # seconds
+            slide: 10          # optional; omit for tumbling windows
+            max_groups: 10000  # per pane
+    '''
+    agg_config = channel_config.get('aggregate')
+    if not agg_config:
+        return None
+    return WindowAggregator(channel_id, handler_function, **agg_config)
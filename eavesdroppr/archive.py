@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+import os
+import io
+import gzip
+import time
+import atexit
+import socket
+import logging
+import threading
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_MAX_FILE_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_FILE_AGE = 3600
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_FSYNC_INTERVAL = 5.0
+DEFAULT_MAX_PENDING = 100000
+
+COMPRESSION_TYPES = ['none', 'gzip', 'zstd']
+COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+IN_PROGRESS_SUFFIX = '.inprogress'
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class UnsupportedCompression(Exception):
+    def __init__(self, compression):
+        Exception.__init__(self,
+                           'The archive compression "%s" is not supported. Supported types are: %s' \
+                           % (compression, ', '.join(COMPRESSION_TYPES)))
+
+
+class ZstandardNotInstalled(Exception):
+    def __init__(self):
+        Exception.__init__(self, 'zstd archive compression requires the zstandard package.')
+
+
+def partition_path(channel_id, table, timestamp):
+    '''<channel>/<table>/<YYYY-MM-DD>/<HH>, from the UTC hour the event arrived in.'''
+    return os.path.join(channel_id, table or '_unknown', time.strftime('%Y-%m-%d/%H', time.gmtime(timestamp)))
+
+
+
+class ArchiveFile(object):
+    '''One open NDJSON file of a partition, written through a large buffer
+    and an optional streaming compressor. It is named with IN_PROGRESS_SUFFIX
+    while open and renamed to its final name on close, so readers only ever
+    see complete files.
+    '''
+
+    def __init__(self, path, compression, buffer_size):
+        self.path = path
+        self.opened = time.time()
+        self.bytes_written = 0
+        self._raw = io.open(path + IN_PROGRESS_SUFFIX, 'ab', buffering=buffer_size)
+        if compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='ab')
+        elif compression == 'zstd':
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+
+    def write(self, data):
+        self._stream.write(data)
+        self.bytes_written += len(data)
+
+
+    def sync(self):
+        '''Pushes everything written so far to disk. Compressed streams are
+        flushed at a block boundary, so a synced file can be read up to here.
+        '''
+        if self._stream is not self._raw:
+            self._stream.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+
+
+    def close(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.rename(self.path + IN_PROGRESS_SUFFIX, self.path)
+
+
+
+class EventArchive(object):
+    '''Archives every event it receives as one NDJSON line (the raw payload)
+    in files partitioned by channel, table and UTC hour. Declare it as a
+    service object and list it under the channels' "sinks" in the initfile:
+
+        service_objects:
+            audit_archive:
+                class: EventArchive
+                init_params:
+                    - name: directory
+                      value: /var/lib/eavesdrop/archive
+                    - name: compression
+                      value: gzip          # none, gzip or zstd
+                    - name: max_file_bytes
+                      value: 268435456     # rotate by size (uncompressed)...
+                    - name: max_file_age
+                      value: 3600          # ...or by age, in seconds
+                    - name: fsync_interval
+                      value: 5
+
+    receive() only queues the event; a background thread groups queued
+    events by partition and writes each group with one large buffered write
+    every flush_interval seconds, and fsyncs open files every
+    fsync_interval seconds. If more than max_pending events are queued,
+    receive() waits for the writer rather than lose events.
+    '''
+
+    def __init__(self, log=None, **kwargs):
+        self._log = log or logger
+        self.directory = kwargs['directory']
+        self.compression = (kwargs.get('compression') or 'none').lower()
+        if self.compression not in COMPRESSION_TYPES:
+            raise UnsupportedCompression(self.compression)
+        if self.compression == 'zstd' and zstandard is None:
+            raise ZstandardNotInstalled()
+
+        self.buffer_size = int(kwargs.get('buffer_size') or DEFAULT_BUFFER_SIZE)
+        self.max_file_bytes = int(kwargs.get('max_file_bytes') or DEFAULT_MAX_FILE_BYTES)
+        self.max_file_age = float(kwargs.get('max_file_age') or DEFAULT_MAX_FILE_AGE)
+        self.flush_interval = float(kwargs.get('flush_interval') or DEFAULT_FLUSH_INTERVAL)
+        self.fsync_interval = float(kwargs.get('fsync_interval') or DEFAULT_FSYNC_INTERVAL)
+        self.max_pending = int(kwargs.get('max_pending') or DEFAULT_MAX_PENDING)
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._files = {}
+        self._file_seq = 0
+        # names carry the host and pid, so listeners sharing a directory never share a file
+        self._file_owner = '%s-%d' % (socket.gethostname(), os.getpid())
+        self._running = True
+        self.events_written = 0
+        self.events_failed = 0
+        self.files_closed = 0
+
+        self._writer = threading.Thread(target=self._write_loop, name='eavesdrop-archive-writer')
+        self._writer.daemon = True
+        self._writer.start()
+        atexit.register(self.close)
+
+
+    def receive(self, event):
+        with self._cond:
+            while len(self._pending) >= self.max_pending and self._running:
+                self._cond.notify_all()
+                self._cond.wait()
+            self._pending.append((time.time(), event))
+
+
+    def close(self):
+        '''Writes out every queued event and closes all files. Called at exit.'''
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        self._writer.join()
+
+
+    def _write_loop(self):
+        next_sync = time.time() + self.fsync_interval
+        while True:
+            with self._cond:
+                if self._running and len(self._pending) < self.max_pending:
+                    self._cond.wait(self.flush_interval)
+                batch = self._pending
+                self._pending = deque()
+                running = self._running
+                self._cond.notify_all()
+
+            try:
+                self._write_batch(batch)
+                now = time.time()
+                self._rotate(now)
+                if now >= next_sync:
+                    for f in self._files.values():
+                        f.sync()
+                    next_sync = now + self.fsync_interval
+            except Exception:
+                self._log.exception('event archive failed writing %d events' % len(batch))
+
+            if not running:
+                break
+
+        for partition in list(self._files.keys()):
+            self._close_file(partition)
+
+
+    def _write_batch(self, batch):
+        lines_by_partition = {}
+        for received, event in batch:
+            try:
+                table = event.table
+            except Exception:
+                # still archived, under the _unknown table
+                table = None
+            try:
+                partition = partition_path(event.channel, table, received)
+                line = event.payload.encode('utf-8')
+            except Exception:
+                self._log.exception('event archive cannot write an event on channel "%s"' % event.channel)
+                self.events_failed += 1
+                continue
+            lines_by_partition.setdefault(partition, []).append(line)
+
+        for partition, lines in lines_by_partition.items():
+            data = b'\n'.join(lines) + b'\n'
+            f = self._files.get(partition)
+            if f is None:
+                f = self._open_file(partition)
+            f.write(data)
+            self.events_written += len(lines)
+
+
+    def _open_file(self, partition):
+        dirname = os.path.join(self.directory, partition)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._file_seq += 1
+        filename = 'events-%d-%s-%06d.ndjson%s' % (int(time.time()),
+                                                    self._file_owner,
+                                                    self._file_seq,
+                                                    COMPRESSION_SUFFIXES[self.compression])
+        f = ArchiveFile(os.path.join(dirname, filename), self.compression, self.buffer_size)
+        self._files[partition] = f
+        return f
+
+
+    def _close_file(self, partition):
+        f = self._files.pop(partition)
+        f.close()
+        self.files_closed += 1
+
+
+    def _rotate(self, now):
+        '''Closes files which are too big or too old, and files of partitions
+        whose hour has passed; the next event for a partition opens a new file.
+        '''
+        current_hour = time.strftime('%Y-%m-%d/%H', time.gmtime(now))
+        for partition, f in list(self._files.items()):
+            if f.bytes_written >= self.max_file_bytes \
+               or now - f.opened >= self.max_file_age \
+               or not partition.endswith(current_hour):
+                self._close_file(partition)
+
+
+    def stats(self):
+        return {'pending': len(self._pending),
+                'open_files': len(self._files),
+                'files_closed': self.files_closed,
+                'events_written': self.events_written,
+                'events_failed': self.events_failed}
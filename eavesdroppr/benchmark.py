@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+import os
+import time
+import random
+import string
+import psycopg2
+from psycopg2.extras import execute_values
+from eavesdroppr import code_templates as code
+from eavesdroppr.codegen import CodeGenerator
+from eavesdroppr.multiplex import database_targets
+
+
+BENCH_SCHEMA = 'eavesdrop_bench'
+BENCH_TABLE = 'bench_events'
+BENCH_CHANNEL = 'eavesdrop_bench'
+BENCH_PROC = 'bench_events_notify'
+BENCH_STATEMENT_PROC = 'bench_events_stmt_notify'
+BENCH_TRIGGER = 'trg_bench_events'
+
+TRIGGER_MODES = ['none', 'row', 'statement', 'filtered']
+BENCH_OPERATIONS = ['INSERT', 'UPDATE']
+
+DEFAULT_BENCH_ROWS = 20000
+DEFAULT_BENCH_FIELDS = 4
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000]
+FIELD_VALUE_LENGTH = 32
+
+# the filtered trigger notifies for one row in ten
+FILTER_CONDITION = 'NEW.id % 10 = 0'
+
+
+class UnsafeBenchmarkTarget(Exception):
+    def __init__(self, target_name):
+        Exception.__init__(self,
+                           'The benchmark database is the initfile\'s "%s" database target. '
+                           'Point it at a throwaway database, or pass --allow-initfile-database.' % target_name)
+
+
+class BenchSchemaExists(Exception):
+    def __init__(self, schema):
+        Exception.__init__(self,
+                           'The schema "%s" already exists in the benchmark database; '
+                           'drop it yourself if it is left over from an earlier run.' % schema)
+
+
+def benchmark_target(yaml_config, host, database, port=None, allow_initfile_database=False):
+    '''Returns connection parameters for the throwaway benchmark database.
+    Refuses any database declared as a target in the initfile, unless
+    allow_initfile_database is set.
+    '''
+    if not allow_initfile_database:
+        for target_name, params in database_targets(yaml_config).items():
+            if params.get('host') == host and params.get('database') == database:
+                raise UnsafeBenchmarkTarget(target_name)
+    params = {'host': host,
+              'database': database,
+              'user': os.environ.get('PGSQL_USER'),
+              'password': os.environ.get('PGSQL_PASSWORD')}
+    if port:
+        params['port'] = int(port)
+    return params
+
+
+
+class BenchmarkResult(object):
+    def __init__(self, operation, mode, batch_size, rows, elapsed, latencies):
+        self.operation = operation
+        self.mode = mode
+        self.batch_size = batch_size
+        self.rows = rows
+        self.elapsed = elapsed
+        self.latencies = sorted(latencies)
+
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+    def latency_percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        index = min(len(self.latencies) - 1, int(len(self.latencies) * pct / 100.0))
+        return self.latencies[index]
+
+
+
+class TriggerBenchmark(object):
+    '''Measures the write-path cost of the generated triggers. Everything is
+    created in a scratch schema, which is dropped when the run finishes, so
+    point it at a throwaway database. The run fails rather than touch a
+    scratch schema which already exists.
+    '''
+
+    def __init__(self, connect_params, **kwargs):
+        self._connect_params = connect_params
+        self.num_rows = int(kwargs.get('rows') or DEFAULT_BENCH_ROWS)
+        self.num_fields = int(kwargs.get('fields') or DEFAULT_BENCH_FIELDS)
+        self.batch_sizes = kwargs.get('batch_sizes') or DEFAULT_BATCH_SIZES
+        self.field_names = ['f%d' % i for i in range(self.num_fields)]
+        self._generator = CodeGenerator()
+        self._created_schema = False
+
+
+    def channel_config(self, operation):
+        return {'db_table_name': BENCH_TABLE,
+                'db_schema': BENCH_SCHEMA,
+                'db_operation': operation,
+                'db_proc_name': BENCH_PROC,
+                'db_trigger_name': BENCH_TRIGGER,
+                'pk_field_name': 'id',
+                'pk_field_type': 'bigint',
+                'payload_fields': self.field_names}
+
+
+    def setup(self, cursor):
+        cursor.execute('SELECT 1 FROM pg_namespace WHERE nspname = %s', (BENCH_SCHEMA,))
+        if cursor.fetchone():
+            raise BenchSchemaExists(BENCH_SCHEMA)
+        cursor.execute('CREATE SCHEMA %s' % BENCH_SCHEMA)
+        self._created_schema = True
+        columns = ', '.join(['%s text' % f for f in self.field_names])
+        cursor.execute('CREATE TABLE %s.%s (id bigint PRIMARY KEY, %s)' % (BENCH_SCHEMA, BENCH_TABLE, columns))
+        cursor.execute(self._generator.generate(BENCH_CHANNEL, self.channel_config('INSERT')).procedure_sql)
+        cursor.execute(code.STATEMENT_PROC_TEMPLATE.format(schema=BENCH_SCHEMA,
+                                                           proc_name=BENCH_STATEMENT_PROC,
+                                                           channel_name=BENCH_CHANNEL))
+
+
+    def install_trigger(self, cursor, operation, mode):
+        cursor.execute('DROP TRIGGER IF EXISTS %s ON %s.%s' % (BENCH_TRIGGER, BENCH_SCHEMA, BENCH_TABLE))
+        names = dict(schema=BENCH_SCHEMA,
+                     table_name=BENCH_TABLE,
+                     trigger_name=BENCH_TRIGGER,
+                     db_op=operation)
+        if mode == 'row':
+            cursor.execute(self._generator.generate(BENCH_CHANNEL, self.channel_config(operation)).trigger_sql)
+        elif mode == 'statement':
+            cursor.execute(code.STATEMENT_TRIGGER_TEMPLATE.format(db_proc_name=BENCH_STATEMENT_PROC, **names))
+        elif mode == 'filtered':
+            cursor.execute(code.FILTERED_TRIGGER_TEMPLATE.format(db_proc_name=BENCH_PROC,
+                                                                 condition=FILTER_CONDITION,
+                                                                 **names))
+
+
+    def random_row(self, row_id):
+        return tuple([row_id] + [''.join(random.choice(string.ascii_letters) for i in range(FIELD_VALUE_LENGTH))
+                                 for f in self.field_names])
+
+
+    def run_batches(self, conn, operation, batch_size):
+        cursor = conn.cursor()
+        latencies = []
+        batches = [range(first_id, min(first_id + batch_size, self.num_rows))
+                   for first_id in range(0, self.num_rows, batch_size)]
+        # rows are built up front, so the timings are of the database alone
+        rows = None
+        if operation == 'INSERT':
+            rows = [[self.random_row(i) for i in ids] for ids in batches]
+        start = time.time()
+        for n, ids in enumerate(batches):
+            batch_start = time.time()
+            if operation == 'INSERT':
+                execute_values(cursor,
+                               'INSERT INTO %s.%s VALUES %%s' % (BENCH_SCHEMA, BENCH_TABLE),
+                               rows[n],
+                               page_size=batch_size)
+            else:
+                cursor.execute('UPDATE %s.%s SET %s = md5(%s) WHERE id >= %%s AND id < %%s' \
+                               % (BENCH_SCHEMA, BENCH_TABLE, self.field_names[0], self.field_names[0]),
+                               (ids[0], ids[-1] + 1))
+            conn.commit()
+            latencies.append(time.time() - batch_start)
+        return (time.time() - start, latencies)
+
+
+    def drain(self, listen_conn):
+        listen_conn.poll()
+        del listen_conn.notifies[:]
+
+
+    def run(self):
+        conn = psycopg2.connect(**self._connect_params)
+        listen_conn = psycopg2.connect(**self._connect_params)
+        listen_conn.autocommit = True
+        results = []
+        try:
+            cursor = conn.cursor()
+            self.setup(cursor)
+            conn.commit()
+            # a listening session, so that NOTIFY does the work it would in production
+            listen_conn.cursor().execute('LISTEN %s' % BENCH_CHANNEL)
+
+            for operation in BENCH_OPERATIONS:
+                for batch_size in self.batch_sizes:
+                    for mode in TRIGGER_MODES:
+                        cursor.execute('DROP TRIGGER IF EXISTS %s ON %s.%s' % (BENCH_TRIGGER, BENCH_SCHEMA, BENCH_TABLE))
+                        cursor.execute('TRUNCATE %s.%s' % (BENCH_SCHEMA, BENCH_TABLE))
+                        if operation == 'UPDATE':
+                            execute_values(cursor,
+                                           'INSERT INTO %s.%s VALUES %%s' % (BENCH_SCHEMA, BENCH_TABLE),
+                                           [self.random_row(i) for i in range(self.num_rows)],
+                                           page_size=1000)
+                        self.install_trigger(cursor, operation, mode)
+                        conn.commit()
+
+                        elapsed, latencies = self.run_batches(conn, operation, batch_size)
+                        self.drain(listen_conn)
+                        results.append(BenchmarkResult(operation, mode, batch_size,
+                                                       self.num_rows, elapsed, latencies))
+        finally:
+            conn.rollback()
+            if self._created_schema:
+                conn.cursor().execute('DROP SCHEMA IF EXISTS %s CASCADE' % BENCH_SCHEMA)
+                conn.commit()
+                self._created_schema = False
+            conn.close()
+            listen_conn.close()
+        return results
+
+
+
+def format_report(results):
+    '''One line per (operation, batch size, trigger mode), with throughput
+    relative to the same run without a trigger.
+    '''
+    baselines = {}
+    for r in results:
+        if r.mode == 'none':
+            baselines[(r.operation, r.batch_size)] = r.rows_per_second
+
+    lines = ['%-7s %6s %-10s %12s %10s %10s %9s' \
+             % ('op', 'batch', 'trigger', 'rows/s', 'p50 ms', 'p99 ms', 'vs none')]
+    for r in results:
+        baseline = baselines.get((r.operation, r.batch_size))
+        relative = '%.1f%%' % (100.0 * r.rows_per_second / baseline) if baseline else '-'
+        lines.append('%-7s %6d %-10s %12.0f %10.3f %10.3f %9s' \
+                     % (r.operation,
+                        r.batch_size,
+                        r.mode,
+                        r.rows_per_second,
+                        r.latency_percentile(50) * 1000,
+                        r.latency_percentile(99) * 1000,
+                        relative))
+    return '\n'.join(lines)
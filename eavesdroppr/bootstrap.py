@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import jinja2
+import psycopg2
+from eavesdroppr import code_templates as code
+from eavesdroppr.events import ChannelEvent
+
+
+DEFAULT_BOOTSTRAP_CHUNK_SIZE = 10000
+
+
+class Snapshot(object):
+    '''A parsed txid_current_snapshot() value: xmin:xmax:xip_list.'''
+
+    def __init__(self, xmin, xmax, xip):
+        self.xmin = xmin
+        self.xmax = xmax
+        self.xip = set(xip)
+
+
+    @classmethod
+    def parse(cls, snapshot_text):
+        xmin, xmax, xip_list = snapshot_text.split(':')
+        xip = [int(x) for x in xip_list.split(',') if x]
+        return Snapshot(int(xmin), int(xmax), xip)
+
+
+    def is_visible(self, txid):
+        '''Mirrors txid_visible_in_snapshot(): True if the transaction had
+        committed when the snapshot was taken, so its rows were read.
+        '''
+        if txid < self.xmin:
+            return True
+        if txid >= self.xmax:
+            return False
+        return txid not in self.xip
+
+
+
+class SnapshotFilter(object):
+    '''Rejects live events whose transaction is already reflected in the
+    bootstrap snapshot of their channel on the given database target.
+    '''
+
+    def __init__(self, snapshot, source=None):
+        self._snapshot = snapshot
+        self._source = source
+        self.dropped = 0
+
+
+    def accept(self, event):
+        txid = event.txid
+        if txid is None or event.data().get('snapshot'):
+            return True
+        if event.source != self._source:
+            return True
+        if self._snapshot.is_visible(txid):
+            self.dropped += 1
+            return False
+        return True
+
+
+
+def snapshot_query(channel_config):
+    j2env = jinja2.Environment()
+    template = j2env.from_string(code.SNAPSHOT_SELECT_TEMPLATE)
+    return template.render(table_name=channel_config['db_table_name'],
+                           schema=channel_config.get('db_schema') or 'public',
+                           pk_field=channel_config['pk_field_name'],
+                           payload_fields=channel_config['payload_fields'])
+
+
+def read_snapshot(channel_id, channel_config, connect_params, chunk_size=DEFAULT_BOOTSTRAP_CHUNK_SIZE, source=None):
+    '''Returns (snapshot, chunks), where chunks is a generator yielding lists
+    of synthetic INSERT events for the rows of the channel's table, read
+    through a server-side cursor in a single REPEATABLE READ transaction.
+    The caller must already be LISTENing on the channel, so that every
+    change not covered by the snapshot is waiting in the notification queue.
+    '''
+    conn = psycopg2.connect(**connect_params)
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+
+    # the first statement of the transaction fixes its snapshot
+    cursor = conn.cursor()
+    cursor.execute('SELECT txid_current_snapshot()::text')
+    snapshot = Snapshot.parse(cursor.fetchone()[0])
+    cursor.close()
+
+    def chunks():
+        try:
+            named_cursor = conn.cursor(name='eavesdrop_bootstrap_%s' % channel_id)
+            named_cursor.itersize = chunk_size
+            named_cursor.execute(snapshot_query(channel_config))
+            while True:
+                rows = named_cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [ChannelEvent(channel_id, r[0], source=source) for r in rows]
+            named_cursor.close()
+        finally:
+            conn.rollback()
+            conn.close()
+
+    return (snapshot, chunks())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import psycopg2
+from eavesdroppr import code_templates as code
+from eavesdroppr.codegen import default_proc_name, default_trigger_name
+from eavesdroppr.multiplex import database_targets, channel_targets, DEFAULT_DATABASE_TARGET
+
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 8000
+
+# worst-case width, in characters of JSON text, of fixed-size column types
+FIXED_TYPE_WIDTHS = {
+    'smallint': 6,
+    'integer': 11,
+    'bigint': 20,
+    'real': 15,
+    'double precision': 24,
+    'boolean': 5,
+    'date': 12,
+    'time without time zone': 17,
+    'time with time zone': 23,
+    'timestamp without time zone': 28,
+    'timestamp with time zone': 34,
+    'uuid': 38,
+    'money': 24,
+    'inet': 45,
+}
+
+# generous bound on the JSON escaping of character data
+JSON_ESCAPE_FACTOR = 2
+
+# table, type, txid and primary_key keys plus braces and separators
+PAYLOAD_OVERHEAD = 96
+
+
+class ColumnInfo(object):
+    def __init__(self, name, data_type, max_length=None, numeric_precision=None):
+        self.name = name
+        self.data_type = data_type
+        self.max_length = max_length
+        self.numeric_precision = numeric_precision
+
+
+    def max_json_width(self):
+        '''The widest this column can render as a JSON value, or None if the
+        type is unbounded (text, json, arrays, unconstrained numeric...).
+        '''
+        if self.data_type in FIXED_TYPE_WIDTHS:
+            return FIXED_TYPE_WIDTHS[self.data_type]
+        if self.data_type == 'numeric' and self.numeric_precision:
+            return self.numeric_precision + 2
+        if self.data_type in ('character varying', 'character') and self.max_length:
+            return self.max_length * JSON_ESCAPE_FACTOR + 2
+        return None
+
+
+    def data(self):
+        return {'name': self.name,
+                'data_type': self.data_type,
+                'max_length': self.max_length,
+                'numeric_precision': self.numeric_precision}
+
+
+
+class TableInfo(object):
+    def __init__(self, schema, name):
+        self.schema = schema
+        self.name = name
+        self.columns = []
+        self.primary_key = []
+
+
+    def column(self, name):
+        for c in self.columns:
+            if c.name == name:
+                return c
+        return None
+
+
+    @property
+    def column_names(self):
+        return [c.name for c in self.columns]
+
+
+
+class SchemaCatalog(object):
+    '''Tables, columns and primary keys for a set of schemas, read with one
+    query for the columns and one for the primary keys, whatever the number
+    of tables. Can be saved to and loaded from a JSON cache file.
+    '''
+
+    def __init__(self):
+        self.tables = {}
+
+
+    @classmethod
+    def read(cls, cursor, schemas):
+        catalog = SchemaCatalog()
+        cursor.execute(code.COLUMN_CATALOG_QUERY, (list(schemas),))
+        for schema, table_name, column_name, data_type, max_length, precision in cursor.fetchall():
+            table = catalog.tables.setdefault((schema, table_name), TableInfo(schema, table_name))
+            table.columns.append(ColumnInfo(column_name, data_type, max_length, precision))
+
+        cursor.execute(code.PRIMARY_KEY_CATALOG_QUERY, (list(schemas),))
+        for schema, table_name, column_name in cursor.fetchall():
+            table = catalog.tables.get((schema, table_name))
+            if table:
+                table.primary_key.append(column_name)
+        return catalog
+
+
+    @classmethod
+    def load(cls, path):
+        catalog = SchemaCatalog()
+        with open(path) as f:
+            for td in json.load(f):
+                table = TableInfo(td['schema'], td['name'])
+                table.primary_key = td['primary_key']
+                table.columns = [ColumnInfo(**cd) for cd in td['columns']]
+                catalog.tables[(table.schema, table.name)] = table
+        return catalog
+
+
+    def save(self, path):
+        tables = []
+        for table in self.tables.values():
+            tables.append({'schema': table.schema,
+                           'name': table.name,
+                           'primary_key': table.primary_key,
+                           'columns': [c.data() for c in table.columns]})
+        with open(path, 'w') as f:
+            json.dump(tables, f)
+
+
+    def get_table(self, schema, table_name):
+        return self.tables.get((schema, table_name))
+
+
+    def table_names(self, schema):
+        return sorted([t.name for t in self.tables.values() if t.schema == schema])
+
+
+
+def read_catalog(connect_params, schemas):
+    conn = psycopg2.connect(**connect_params)
+    try:
+        return SchemaCatalog.read(conn.cursor(), schemas)
+    finally:
+        conn.close()
+
+
+def estimate_payload_width(table, pk_field, payload_fields):
+    '''Returns (width, unbounded_fields): the largest payload the channel can
+    produce, counting only bounded columns, and the fields with no bound.
+    '''
+    width = PAYLOAD_OVERHEAD + len(table.name)
+    unbounded = []
+    for field_name in [pk_field] + list(payload_fields):
+        column = table.column(field_name)
+        if column is None:
+            continue
+        field_width = column.max_json_width()
+        if field_width is None:
+            unbounded.append(field_name)
+            continue
+        width += len(field_name) + 4 + field_width
+    return (width, unbounded)
+
+
+def validate_channel(channel_id, channel_config, catalog):
+    '''Returns a list of (level, message) pairs describing problems with a
+    channel definition; level is "error" or "warning".
+    '''
+    problems = []
+    schema = channel_config.get('db_schema') or 'public'
+    table = catalog.get_table(schema, channel_config['db_table_name'])
+    if table is None:
+        return [('error', 'channel "%s": table %s.%s does not exist' \
+                 % (channel_id, schema, channel_config['db_table_name']))]
+
+    pk_field = channel_config['pk_field_name']
+    payload_fields = channel_config.get('payload_fields') or []
+    for field_name in [pk_field] + list(payload_fields):
+        if table.column(field_name) is None:
+            problems.append(('error', 'channel "%s": column "%s" does not exist in %s.%s' \
+                             % (channel_id, field_name, schema, table.name)))
+
+    pk_column = table.column(pk_field)
+    if pk_column and channel_config.get('pk_field_type') \
+       and channel_config['pk_field_type'] != pk_column.data_type:
+        problems.append(('warning', 'channel "%s": pk_field_type is "%s" but column "%s" is %s' \
+                         % (channel_id, channel_config['pk_field_type'], pk_field, pk_column.data_type)))
+
+    width, unbounded = estimate_payload_width(table, pk_field, payload_fields)
+    if width >= NOTIFY_PAYLOAD_LIMIT:
+        problems.append(('warning', 'channel "%s": payload may reach %d bytes, over the NOTIFY limit of %d' \
+                         % (channel_id, width, NOTIFY_PAYLOAD_LIMIT)))
+    elif unbounded:
+        problems.append(('warning', 'channel "%s": unbounded fields %s may push the payload past the NOTIFY limit' \
+                         % (channel_id, ', '.join(unbounded))))
+    return problems
+
+
+def channel_config_for_table(table, operation, handler_function=None):
+    '''A channel definition watching every column of the table, keyed on its
+    (single-column) primary key; None if the table has no such key.
+    '''
+    if len(table.primary_key) != 1:
+        return None
+    pk_field = table.primary_key[0]
+    return {'handler_function': handler_function,
+            'db_table_name': table.name,
+            'db_operation': operation,
+            'pk_field_name': pk_field,
+            'pk_field_type': table.column(pk_field).data_type,
+            'db_schema': table.schema,
+            'db_proc_name': default_proc_name(table.name, operation),
+            'db_trigger_name': default_trigger_name(table.name, operation),
+            'payload_fields': [c for c in table.column_names if c != pk_field]}
+
+
+def generate_channels(yaml_config, schema, operation, target_name=None):
+    '''Returns channel definitions, keyed by channel name, for every table in
+    the schema which has a single-column primary key.
+    '''
+    targets = database_targets(yaml_config)
+    catalog = read_catalog(targets[target_name or DEFAULT_DATABASE_TARGET], [schema])
+    channels = {}
+    for table_name in catalog.table_names(schema):
+        channel_config = channel_config_for_table(catalog.get_table(schema, table_name), operation)
+        if channel_config:
+            channels['%s_%s' % (table_name, operation.lower())] = channel_config
+    return channels
+
+
+def validate_channels(yaml_config):
+    '''Checks every channel in the initfile against the catalog of each
+    database it targets, reading each catalog once. Returns the list of
+    (level, message) problems found.
+    '''
+    channels_by_target = {}
+    for channel_id, channel_config in yaml_config['channels'].items():
+        for target_name in channel_targets(channel_config):
+            channels_by_target.setdefault(target_name, []).append(channel_id)
+
+    targets = database_targets(yaml_config)
+    problems = []
+    for target_name, channel_ids in channels_by_target.items():
+        schemas = set([yaml_config['channels'][c].get('db_schema') or 'public' for c in channel_ids])
+        catalog = read_catalog(targets[target_name], schemas)
+        for channel_id in channel_ids:
+            problems.extend(validate_channel(channel_id, yaml_config['channels'][channel_id], catalog))
+    return problems
+
+
+def report_problems(problems, out=None):
+    '''Prints each (level, message) problem and returns the exit status for
+    "eavesdrop validate": 1 if any problem is an error, otherwise 0, so that
+    the command can gate a deploy.
+    '''
+    out = out or sys.stdout
+    for level, message in problems:
+        out.write('%s: %s\n' % (level, message))
+    return 1 if [p for p in problems if p[0] == 'error'] else 0
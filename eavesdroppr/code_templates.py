@@ -5,7 +5,8 @@ JSON_BUILD_FUNC_TEMPLATE = '''
 json_build_object('table', TG_TABLE_NAME,
                   'primary_key', {{pk_field}},
                   {% for field in payload_fields %}'{{field}}', NEW.{{field}},
-                  {% endfor %}'type', TG_OP)
+                  {% endfor %}'type', TG_OP,
+                  'txid', txid_current())
 '''
 
 PROC_TEMPLATE = '''
@@ -32,3 +33,161 @@ CREATE TRIGGER {trigger_name} AFTER {db_op} ON {schema}.{table_name}
 FOR EACH ROW 
 EXECUTE PROCEDURE {schema}.{db_proc_name}();
 '''
+
+
+SNAPSHOT_SELECT_TEMPLATE = '''
+SELECT json_build_object('table', '{{table_name}}',
+                         'primary_key', {{pk_field}},
+                         {% for field in payload_fields %}'{{field}}', {{field}},
+                         {% endfor %}'type', 'INSERT',
+                         'txid', NULL,
+                         'snapshot', true)::text
+FROM {{schema}}.{{table_name}}
+'''
+
+
+PROC_CATALOG_QUERY = '''
+SELECT n.nspname, p.proname, p.prosrc
+FROM pg_proc p
+JOIN pg_namespace n ON n.oid = p.pronamespace
+WHERE n.nspname = ANY(%s)
+'''
+
+
+TRIGGER_CATALOG_QUERY = '''
+SELECT n.nspname, c.relname, t.tgname, pn.nspname, p.proname, t.tgtype
+FROM pg_trigger t
+JOIN pg_class c ON c.oid = t.tgrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_proc p ON p.oid = t.tgfoid
+JOIN pg_namespace pn ON pn.oid = p.pronamespace
+WHERE NOT t.tgisinternal AND n.nspname = ANY(%s)
+'''
+
+
+COLUMN_CATALOG_QUERY = '''
+SELECT table_schema, table_name, column_name, data_type,
+       character_maximum_length, numeric_precision
+FROM information_schema.columns
+WHERE table_schema = ANY(%s)
+ORDER BY table_schema, table_name, ordinal_position
+'''
+
+
+PRIMARY_KEY_CATALOG_QUERY = '''
+SELECT n.nspname, c.relname, a.attname
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = ANY(i.indkey)
+WHERE i.indisprimary AND n.nspname = ANY(%s)
+'''
+
+
+STATEMENT_PROC_TEMPLATE = '''
+CREATE OR REPLACE FUNCTION {schema}.{proc_name}() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('{channel_name}',
+                    json_build_object('table', TG_TABLE_NAME,
+                                      'type', TG_OP,
+                                      'txid', txid_current())::text);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+STATEMENT_TRIGGER_TEMPLATE = '''
+DROP TRIGGER IF EXISTS {trigger_name} ON {schema}.{table_name};
+CREATE TRIGGER {trigger_name} AFTER {db_op} ON {schema}.{table_name}
+FOR EACH STATEMENT
+EXECUTE PROCEDURE {schema}.{db_proc_name}();
+'''
+
+
+FILTERED_TRIGGER_TEMPLATE = '''
+DROP TRIGGER IF EXISTS {trigger_name} ON {schema}.{table_name};
+CREATE TRIGGER {trigger_name} AFTER {db_op} ON {schema}.{table_name}
+FOR EACH ROW
+WHEN ({condition})
+EXECUTE PROCEDURE {schema}.{db_proc_name}();
+'''
+
+
+CONTROLLED_PROC_TEMPLATE = '''
+CREATE OR REPLACE FUNCTION {schema}.{proc_name}() RETURNS trigger AS $$
+DECLARE
+  {pk_field_name} {pk_field_type};
+  control jsonb;
+  now_epoch double precision;
+BEGIN
+  now_epoch = extract(epoch FROM clock_timestamp());
+  IF now_epoch - coalesce(nullif(current_setting('{cache_setting}_at', true), ''), '0')::double precision > {cache_seconds} THEN
+    SELECT to_jsonb(c) INTO control FROM {control_schema}.{control_table} c WHERE c.channel = '{channel_name}';
+    PERFORM set_config('{cache_setting}', coalesce(control::text, ''), false);
+    PERFORM set_config('{cache_setting}_at', now_epoch::text, false);
+  ELSE
+    control = nullif(current_setting('{cache_setting}', true), '')::jsonb;
+  END IF;
+  IF control IS NOT NULL THEN
+    IF NOT (control->>'enabled')::boolean
+       OR random() >= (control->>'sample_rate')::double precision
+       OR NOT to_jsonb(NEW) @> (control->'predicates') THEN
+      RETURN NEW;
+    END IF;
+  END IF;
+  IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+    {pk_field_name} = NEW.{pk_field_name};
+  ELSE
+    {pk_field_name} = OLD.{pk_field_name};
+  END IF;
+  PERFORM pg_notify('{channel_name}',
+                    {json_build_func}::text);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+CONTROL_TABLE_TEMPLATE = '''
+CREATE TABLE IF NOT EXISTS {schema}.{table_name} (
+  channel varchar(63) PRIMARY KEY,
+  enabled boolean NOT NULL DEFAULT true,
+  sample_rate double precision NOT NULL DEFAULT 1.0 CHECK (sample_rate >= 0 AND sample_rate <= 1),
+  predicates jsonb NOT NULL DEFAULT '{{}}',
+  updated_at timestamp with time zone NOT NULL DEFAULT now()
+);
+'''
+
+
+CONTROL_UPSERT_TEMPLATE = '''
+INSERT INTO {schema}.{table_name} AS c (channel, enabled, sample_rate, predicates)
+VALUES (%(channel)s,
+        coalesce(%(enabled)s, true),
+        coalesce(%(sample_rate)s, 1.0),
+        coalesce(%(predicates)s::jsonb, '{{}}'))
+ON CONFLICT (channel) DO UPDATE
+SET enabled = coalesce(%(enabled)s, c.enabled),
+    sample_rate = coalesce(%(sample_rate)s, c.sample_rate),
+    predicates = coalesce(%(predicates)s::jsonb, c.predicates),
+    updated_at = now()
+'''
+
+
+CONTROL_DELETE_TEMPLATE = '''
+DELETE FROM {schema}.{table_name} WHERE channel = %s
+'''
+
+
+CONTROL_SELECT_TEMPLATE = '''
+SELECT channel, enabled, sample_rate, predicates::text, updated_at
+FROM {schema}.{table_name}
+WHERE channel = ANY(%s)
+'''
+
+
+TABLE_CATALOG_QUERY = '''
+SELECT table_schema, table_name
+FROM information_schema.tables
+WHERE table_schema = ANY(%s)
+'''
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import re
+import jinja2
+from eavesdroppr import code_templates as code
+
+
+SUPPORTED_DB_OPS = ['INSERT', 'UPDATE']
+
+DEFAULT_CONTROL_SCHEMA = 'public'
+DEFAULT_CONTROL_TABLE = 'eavesdrop_control'
+DEFAULT_CONTROL_CACHE_SECONDS = 5
+CONTROL_CACHE_SETTING_PREFIX = 'eavesdroppr.control_'
+
+
+class UnsupportedDBOperation(Exception):
+    def __init__(self, operation):
+        Exception.__init__(self, 'The database operation "%s" is not supported.' % operation)
+
+
+def default_proc_name(table_name, operation):
+    return '%s_%s_notify' % (table_name, operation.lower())
+
+
+def default_trigger_name(table_name, operation):
+    return 'trg_%s_%s' % (table_name, operation.lower())
+
+
+def control_settings(channel_config):
+    '''Returns the channel's control table settings if it declares a
+    "control" section in the initfile, otherwise None. "control: True"
+    takes the defaults:
+
+        control:
+            schema: public              # where the control table lives
+            table: eavesdrop_control
+            cache_seconds: 5            # how long a session reuses what it read
+    '''
+    control_config = channel_config.get('control')
+    if not control_config:
+        return None
+    if not isinstance(control_config, dict):
+        control_config = {}
+    cache_seconds = control_config.get('cache_seconds')
+    return {'schema': control_config.get('schema') or DEFAULT_CONTROL_SCHEMA,
+            'table': control_config.get('table') or DEFAULT_CONTROL_TABLE,
+            'cache_seconds': DEFAULT_CONTROL_CACHE_SECONDS if cache_seconds is None else float(cache_seconds)}
+
+
+def control_cache_setting(channel_id):
+    '''The session setting under which a controlled procedure caches its
+    channel's control row.
+    '''
+    return CONTROL_CACHE_SETTING_PREFIX + re.sub(r'\W', '_', channel_id).lower()
+
+
+
+class ChannelCode(object):
+    '''The names and generated SQL for one event channel.'''
+
+    def __init__(self, channel_id, **kwargs):
+        self.channel_id = channel_id
+        self.schema = kwargs['schema']
+        self.table_name = kwargs['table_name']
+        self.operation = kwargs['operation']
+        self.procedure_name = kwargs['procedure_name']
+        self.trigger_name = kwargs['trigger_name']
+        self.procedure_sql = kwargs['procedure_sql']
+        self.trigger_sql = kwargs['trigger_sql']
+        self.control_table = kwargs.get('control_table')
+
+
+    @property
+    def procedure_body(self):
+        '''The function body between the $$ quotes, as pg_proc.prosrc holds it.'''
+        return self.procedure_sql.split('$$')[1]
+
+
+
+class CodeGenerator(object):
+    '''Renders the procedure and trigger SQL for event channels. The Jinja
+    environment and the json_build_object template are compiled once and
+    reused for every channel.
+    '''
+
+    def __init__(self):
+        self._j2env = jinja2.Environment()
+        self._json_func_template = self._j2env.from_string(code.JSON_BUILD_FUNC_TEMPLATE)
+
+
+    def generate(self, channel_id, channel_config):
+        operation = channel_config['db_operation']
+        if not operation in SUPPORTED_DB_OPS:
+            raise UnsupportedDBOperation(operation)
+
+        table_name = channel_config['db_table_name']
+        db_schema = channel_config.get('db_schema') or 'public'
+        procedure_name = channel_config.get('db_proc_name') or default_proc_name(table_name, operation)
+        trigger_name = channel_config.get('db_trigger_name') or default_trigger_name(table_name,
+                                                                                     operation)
+        primary_key_field = channel_config['pk_field_name']
+        primary_key_type = channel_config['pk_field_type']
+
+        json_func = self._json_func_template.render(payload_fields=channel_config['payload_fields'],
+                                                    pk_field=primary_key_field)
+
+        control = control_settings(channel_config)
+        if control:
+            control_table = (control['schema'], control['table'])
+            procedure_sql = code.CONTROLLED_PROC_TEMPLATE.format(schema=db_schema,
+                                                                 proc_name=procedure_name,
+                                                                 pk_field_name=primary_key_field,
+                                                                 pk_field_type=primary_key_type,
+                                                                 channel_name=channel_id,
+                                                                 json_build_func=json_func,
+                                                                 control_schema=control['schema'],
+                                                                 control_table=control['table'],
+                                                                 cache_setting=control_cache_setting(channel_id),
+                                                                 cache_seconds=control['cache_seconds'])
+        else:
+            control_table = None
+            procedure_sql = code.PROC_TEMPLATE.format(schema=db_schema,
+                                                      proc_name=procedure_name,
+                                                      pk_field_name=primary_key_field,
+                                                      pk_field_type=primary_key_type,
+                                                      channel_name=channel_id,
+                                                      json_build_func=json_func)
+
+        trigger_sql = code.TRIGGER_TEMPLATE.format(schema=db_schema,
+                                                   table_name=table_name,
+                                                   trigger_name=trigger_name,
+                                                   db_proc_name=procedure_name,
+                                                   db_op=operation)
+
+        return ChannelCode(channel_id,
+                           schema=db_schema,
+                           table_name=table_name,
+                           operation=operation,
+                           procedure_name=procedure_name,
+                           trigger_name=trigger_name,
+                           procedure_sql=procedure_sql,
+                           trigger_sql=trigger_sql,
+                           control_table=control_table)
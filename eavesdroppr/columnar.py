@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import time
+import logging
+import numbers
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DEFAULT_COLUMNAR_BATCH_SIZE = 1000
+DEFAULT_COLUMNAR_MAX_WAIT = 1.0
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class NumpyNotInstalled(Exception):
+    def __init__(self, channel_id):
+        Exception.__init__(self,
+                           'Channel "%s" requests columnar batches, which require the numpy package.' \
+                           % channel_id)
+
+
+def is_numeric(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def coerce_numeric(value):
+    '''Returns value as a float, or None if it is NULL or not a number.'''
+    if value is None or is_numeric(value):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+def build_columns(events, field_names, channel_id=None):
+    '''Decodes a batch of events into one numpy masked array per numeric
+    field, that is, one holding any number in the batch. NULLs are masked,
+    and so are (with a warning) values which cannot be read as numbers. A
+    field with values but no numbers, such as a text field, is omitted. The
+    primary key is included as "primary_key".
+    '''
+    columns = {}
+    rows = [e.data() for e in events]
+    for field_name in ['primary_key'] + list(field_names):
+        values = [r.get(field_name) for r in rows]
+        if not any([is_numeric(v) for v in values]) and any([v is not None for v in values]):
+            continue
+
+        coerced = [coerce_numeric(v) for v in values]
+        failed = [v for v, c in zip(values, coerced) if c is None and v is not None]
+        if failed:
+            logger.warning('channel "%s": masked %d non-numeric value(s) in numeric field "%s", such as %r' \
+                           % (channel_id, len(failed), field_name, failed[0]))
+
+        mask = numpy.fromiter((c is None for c in coerced), dtype=bool, count=len(coerced))
+        data = numpy.fromiter((0 if c is None else c for c in coerced), dtype=numpy.float64, count=len(coerced))
+        columns[field_name] = numpy.ma.MaskedArray(data, mask=mask)
+
+    return columns
+
+
+
+class ColumnarBatcher(object):
+    '''Accumulates a channel's events and hands the handler a dict of
+    numpy arrays, one per numeric payload field, instead of single events.
+    The handler is called as handler(columns, svc_object_registry) when
+    batch_size events are waiting, when the oldest has waited max_wait
+    seconds, or when the socket goes quiet.
+    '''
+
+    def __init__(self, channel_id, handler_function, field_names, **kwargs):
+        if numpy is None:
+            raise NumpyNotInstalled(channel_id)
+
+        self.channel_id = channel_id
+        self._handler = handler_function
+        self._field_names = field_names
+        self._batch_size = int(kwargs.get('batch_size') or DEFAULT_COLUMNAR_BATCH_SIZE)
+        self._max_wait = float(kwargs.get('max_wait') or DEFAULT_COLUMNAR_MAX_WAIT)
+        self._events = []
+        self._first_event_time = None
+
+
+    @property
+    def has_pending(self):
+        return len(self._events) > 0
+
+
+    @property
+    def flush_interval(self):
+        return self._max_wait
+
+
+    def expired(self, now):
+        return self.has_pending and now - self._first_event_time >= self._max_wait
+
+
+    def add(self, event, svc_object_registry):
+        if not self._events:
+            self._first_event_time = time.time()
+        self._events.append(event)
+        if len(self._events) >= self._batch_size:
+            self.flush(svc_object_registry)
+
+
+    def flush(self, svc_object_registry):
+        if not self._events:
+            return
+        events = self._events
+        self._events = []
+        self._handler(build_columns(events, self._field_names, self.channel_id), svc_object_registry)
+
+
+
+def create_columnar_batcher(channel_id, channel_config, handler_function):
+    '''Returns a ColumnarBatcher if the channel opts in to columnar batches
+    in the initfile, otherwise None:
+
+        columnar:
+            batch_size: 5000
+            max_wait: 0.5
+    '''
+    columnar_config = channel_config.get('columnar')
+    if not columnar_config:
+        return None
+    if columnar_config is True:
+        columnar_config = {}
+
+    return ColumnarBatcher(channel_id,
+                           handler_function,
+                           channel_config.get('payload_fields') or [],
+                           **columnar_config)
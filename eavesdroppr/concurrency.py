@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+import time
+import logging
+import threading
+from collections import deque
+
+
+DEFAULT_MIN_WORKERS = 1
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TARGET_AGE = 0.5
+DEFAULT_ADJUST_INTERVAL = 5.0
+DEFAULT_LATENCY_TOLERANCE = 2.0
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_MAX_QUEUE = 10000
+DRAIN_POLL_INTERVAL = 0.05
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class WindowStats(object):
+    '''Measurements gathered by a worker pool between two adjustments.'''
+
+    def __init__(self):
+        self.completed = 0
+        self.total_latency = 0.0
+        self.total_age = 0.0
+
+
+    def record(self, age, latency):
+        self.completed += 1
+        self.total_age += age
+        self.total_latency += latency
+
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.completed if self.completed else 0.0
+
+
+    @property
+    def mean_age(self):
+        return self.total_age / self.completed if self.completed else 0.0
+
+
+
+class AIMDController(object):
+    '''Additive-increase/multiplicative-decrease control of a concurrency
+    limit. The limit grows by one while queued work waits longer than
+    target_age -- judged by the oldest item still queued as well as by the
+    items completed, so a pool whose workers are all stuck still grows --
+    and is cut by decrease_factor when handler latency rises
+    past latency_tolerance times the best latency seen -- the sign that
+    more concurrency is only loading the downstream system. With an empty
+    queue and idle workers the limit shrinks by one.
+    '''
+
+    def __init__(self, min_limit, max_limit, **kwargs):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_age = float(kwargs.get('target_age') or DEFAULT_TARGET_AGE)
+        self.latency_tolerance = float(kwargs.get('latency_tolerance') or DEFAULT_LATENCY_TOLERANCE)
+        self.decrease_factor = float(kwargs.get('decrease_factor') or DEFAULT_DECREASE_FACTOR)
+        self._baseline_latency = None
+
+
+    def adjust(self, limit, queue_depth, busy_workers, stats, oldest_age=0.0):
+        '''Returns (new_limit, reason); reason is None when nothing changed.
+        oldest_age is how long the item at the head of the queue has waited.
+        '''
+        age = max(stats.mean_age, oldest_age)
+        if stats.completed:
+            if self._baseline_latency is None or stats.mean_latency < self._baseline_latency:
+                self._baseline_latency = stats.mean_latency
+
+        if stats.completed and self._baseline_latency \
+           and stats.mean_latency > self._baseline_latency * self.latency_tolerance:
+            new_limit = max(self.min_limit, int(limit * self.decrease_factor))
+            reason = 'handler latency %.4fs exceeds %.1fx baseline %.4fs' \
+                     % (stats.mean_latency, self.latency_tolerance, self._baseline_latency)
+            # forget the baseline slowly, so a permanent shift is eventually accepted
+            self._baseline_latency *= 1.1
+
+        elif queue_depth and age > self.target_age:
+            new_limit = min(self.max_limit, limit + 1)
+            reason = 'queue depth %d, notification age %.4fs above target %.4fs' \
+                     % (queue_depth, age, self.target_age)
+
+        elif not queue_depth and busy_workers < limit / 2.0:
+            new_limit = max(self.min_limit, limit - 1)
+            reason = 'queue empty, %d of %d workers busy' % (busy_workers, limit)
+
+        else:
+            return (limit, None)
+
+        if new_limit == limit:
+            return (limit, None)
+        return (new_limit, reason)
+
+
+
+class AdaptiveWorkerPool(object):
+    '''Runs a handler function on a pool of worker threads whose size is
+    set by an AIMDController every adjust_interval seconds. Items are
+    handled concurrently, so handlers on such a channel must not rely on
+    the order of events.
+
+    At most max_queue items wait for a worker; submit() blocks while the
+    queue is full, which holds back the event loop -- and leaves further
+    notifications queued in Postgres -- rather than growing without bound.
+    An item's age is counted from when its event was received, if known.
+    '''
+
+    def __init__(self, name, handler_function, controller, adjust_interval=DEFAULT_ADJUST_INTERVAL,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.name = name
+        self._handler = handler_function
+        self._controller = controller
+        self._adjust_interval = adjust_interval
+        self._max_queue = max_queue
+        self._queue = deque()
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+        self._limit = controller.min_limit
+        self._num_workers = 0
+        self._busy = 0
+        self._stats = WindowStats()
+        self._running = True
+
+        for i in range(self._limit):
+            self._start_worker()
+
+        control_thread = threading.Thread(target=self._control_loop,
+                                          name='%s-controller' % name)
+        control_thread.daemon = True
+        control_thread.start()
+
+
+    @property
+    def limit(self):
+        return self._limit
+
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+
+    def submit(self, item, svc_object_registry):
+        received = getattr(item, 'received', None) or time.time()
+        with self._cond:
+            while self._running and len(self._queue) >= self._max_queue:
+                self._not_full.wait()
+            self._queue.append((received, item, svc_object_registry))
+            self._cond.notify()
+
+
+    def drain(self):
+        '''Waits until every submitted item has been handled, then stops
+        the workers.
+        '''
+        with self._cond:
+            while self._queue or self._busy:
+                self._cond.wait(DRAIN_POLL_INTERVAL)
+        self.shutdown()
+
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            self._not_full.notify_all()
+
+
+    def _start_worker(self):
+        self._num_workers += 1
+        worker = threading.Thread(target=self._work, name='%s-worker' % self.name)
+        worker.daemon = True
+        worker.start()
+
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue and self._num_workers <= self._limit:
+                    self._cond.wait()
+                if not self._running or self._num_workers > self._limit:
+                    # retire this worker to honour a lowered limit
+                    self._num_workers -= 1
+                    return
+                submitted, item, svc_object_registry = self._queue.popleft()
+                self._busy += 1
+                self._not_full.notify()
+
+            started = time.time()
+            try:
+                self._handler(item, svc_object_registry)
+            except Exception:
+                logger.exception('handler failed in worker pool "%s"' % self.name)
+            finished = time.time()
+
+            with self._cond:
+                self._busy -= 1
+                self._stats.record(started - submitted, finished - started)
+
+
+    def _control_loop(self):
+        while self._running:
+            time.sleep(self._adjust_interval)
+            with self._cond:
+                stats = self._stats
+                self._stats = WindowStats()
+                # the wait of the oldest queued item counts even when nothing
+                # completed in this window
+                oldest_age = time.time() - self._queue[0][0] if self._queue else 0.0
+                new_limit, reason = self._controller.adjust(self._limit,
+                                                            len(self._queue),
+                                                            self._busy,
+                                                            stats,
+                                                            oldest_age)
+                if reason is None:
+                    continue
+
+                logger.info('worker pool "%s": concurrency %d -> %d (%s)' \
+                            % (self.name, self._limit, new_limit, reason))
+                self._limit = new_limit
+                while self._num_workers < self._limit:
+                    self._start_worker()
+                self._cond.notify_all()
+
+
+
+def create_worker_pool(channel_id, channel_config, handler_function):
+    '''Returns an AdaptiveWorkerPool if the channel declares a "concurrency"
+    section in the initfile, otherwise None:
+
+        concurrency:
+            min: 1
+            max: 16
+            target_age: 0.5        # seconds an event may wait for a worker
+            adjust_interval: 5
+            max_queue: 10000       # events waiting for a worker before the listener waits
+    '''
+    cc_config = channel_config.get('concurrency')
+    if not cc_config:
+        return None
+    if cc_config is True:
+        cc_config = {}
+
+    min_workers = int(cc_config.get('min') or DEFAULT_MIN_WORKERS)
+    max_workers = int(cc_config.get('max') or max(min_workers, DEFAULT_MAX_WORKERS))
+    controller = AIMDController(min_workers,
+                                max_workers,
+                                target_age=cc_config.get('target_age'),
+                                latency_tolerance=cc_config.get('latency_tolerance'),
+                                decrease_factor=cc_config.get('decrease_factor'))
+
+    return AdaptiveWorkerPool(channel_id,
+                              handler_function,
+                              controller,
+                              float(cc_config.get('adjust_interval') or DEFAULT_ADJUST_INTERVAL),
+                              int(cc_config.get('max_queue') or DEFAULT_MAX_QUEUE))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+'''Initfile reading for the listener runtime. These are the few helpers the
+listen path used from snap.common, which imports jinja2 (and, in later snap
+releases, flask) on its own import; they behave the same way.
+'''
+
+import os
+import json
+import yaml
+
+
+class MissingEnvironmentVarException(Exception):
+    def __init__(self, env_var):
+        Exception.__init__(self, 'The following environment variables have not been set: %s' % env_var)
+
+
+class UnregisteredServiceObjectException(Exception):
+    def __init__(self, alias):
+        Exception.__init__(self, 'No ServiceObject registered under the alias "%s".' % alias)
+
+
+def read_config_file(filename):
+    '''Loads a YAML initfile, returning a dictionary of its contents.'''
+    with open(filename, 'r') as filehandle:
+        return yaml.safe_load(filehandle)
+
+
+def load_config_var(value):
+    '''Resolves an initfile value: "$NAME" is read from the environment and
+    "~/path" is expanded; anything else is returned as it is.
+    '''
+    if not value:
+        return None
+    if isinstance(value, str):
+        if value.startswith('$'):
+            var = os.environ.get(value[1:])
+            if not var:
+                raise MissingEnvironmentVarException(value[1:])
+            return var
+        if value.startswith('~%s' % os.path.sep):
+            return os.path.join(os.path.expanduser('~'), value[2:])
+    return value
+
+
+def environment_variables(*names):
+    '''Returns {name: value} for the environment variables, all of which
+    must be set.
+    '''
+    missing = [name for name in names if not os.getenv(name)]
+    if missing:
+        raise MissingEnvironmentVarException(', '.join(missing))
+    return dict([(name, os.getenv(name)) for name in names])
+
+
+def jsonpretty(data):
+    return json.dumps(data, indent=4, sort_keys=True)
+
+
+
+class ServiceObjectRegistry(object):
+    '''The service objects declared in the initfile, by name.'''
+
+    def __init__(self, service_object_dictionary):
+        self.services = service_object_dictionary
+
+
+    def lookup(self, service_object_name):
+        sobj = self.services.get(service_object_name)
+        if sobj is None:
+            raise UnregisteredServiceObjectException(service_object_name)
+        return sobj
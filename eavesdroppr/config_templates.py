@@ -1,46 +1,64 @@
 #!/usr/bin/env python
 
+# The initfile is emitted one section at a time, so that a writer can
+# re-render only the channels and service objects which have changed.
 
-INIT_FILE = """
-# 
+INIT_FILE_HEADER = """
+#
 # YAML init file for EavesdropPR listen/notify framework
 #
 #
 globals:
-        project_directory: {{ global_settings.data()['project_directory']}}
-        database_host: {{ global_settings.data()['database_host'] }}
-        database_name: {{ global_settings.data()['database_name'] }}
-        debug: {{ global_settings.data()['debug']}}
-        logfile: {{ global_settings.data()['logfile'] }}
-        handler_module: {{ global_settings.data()['handler_module'] }}
-        service_module: {{ global_settings.data()['service_module'] }} 
-        
+        project_directory: {{ global_settings.data()['project_directory'] | yaml }}
+        database_host: {{ global_settings.data()['database_host'] | yaml }}
+        database_name: {{ global_settings.data()['database_name'] | yaml }}
+        debug: {{ global_settings.data()['debug'] | yaml }}
+        logfile: {{ global_settings.data()['logfile'] | yaml }}
+        handler_module: {{ global_settings.data()['handler_module'] | yaml }}
+        service_module: {{ global_settings.data()['service_module'] | yaml }}
+{% if global_settings.extra_settings %}{{ global_settings.extra_settings | yaml_block(8) }}{% endif %}
+"""
+
+
+SERVICE_OBJECTS_HEADER = """
 
 service_objects:
-        {% for so in service_objects %}
-        {{ so.name }}:
+"""
+
+
+SERVICE_OBJECT_ENTRY = """        {{ so.name }}:
             class:
-                {{ so.classname }}
+                {{ so.classname | yaml }}
             init_params:
-                {% for p in so.init_params %}- name: {{ p['name'] }}
-                  value: {{ p['value'] }}
+                {% for p in so.init_params %}- name: {{ p['name'] | yaml }}
+                  value: {{ p['value'] | yaml }}
                 {% endfor %}
-        {% endfor %}
+"""
+
 
+CHANNELS_HEADER = """
 
 channels:
-        {% for ch in channels %}
-        {{ch.name}}:
-                handler_function: {{ch.handler_function}}
-                db_table_name: {{ch.table_name}}
-                db_operation: {{ch.operation}}
-                pk_field_name: {{ch.primary_key_field}}
-                pk_field_type: {{ch.primary_key_type}}
-                db_schema: {{ch.schemaa}}
-                db_proc_name: {{ch.procedure_name}}
-                db_trigger_name: {{ch.trigger_name}}
+"""
+
+
+CHANNEL_ENTRY = """        {{ch.name}}:
+                handler_function: {{ch.handler_function | yaml}}
+                db_table_name: {{ch.table_name | yaml}}
+                db_operation: {{ch.operation | yaml}}
+                pk_field_name: {{ch.primary_key_field | yaml}}
+                pk_field_type: {{ch.primary_key_type | yaml}}
+                db_schema: {{ch.schema | yaml}}
+                db_proc_name: {{ch.procedure_name | yaml}}
+                db_trigger_name: {{ch.trigger_name | yaml}}
                 payload_fields:
-                        {%for field in ch.payload_fields%}- {{field}}                        
+                        {% for field in ch.payload_fields %}- {{field | yaml}}
                         {% endfor %}
-        {% endfor %}
-"""
\ No newline at end of file
+{% if ch.extras %}{{ ch.extras | yaml_block(16) }}{% endif %}
+"""
+
+
+# sections of a loaded initfile which the CLI does not model, written back as read
+EXTRA_SECTIONS = """
+
+{{ sections | yaml_block(0) }}"""
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+'''Runtime switches for channels generated with a "control" section.
+
+The procedure of such a channel reads the channel's row in a control table
+(cached in the session for cache_seconds) before notifying, and skips the
+notification when the channel is disabled, when the row loses the draw
+against sample_rate, or when the row's columns do not match predicates --
+a JSON object of column values, compared by jsonb containment. A channel
+without a row in the table notifies for every row. Changes here take
+effect within cache_seconds, without any DDL.
+'''
+
+import json
+import math
+import logging
+import psycopg2
+from eavesdroppr import code_templates as code
+from eavesdroppr.codegen import control_settings
+from eavesdroppr.multiplex import database_targets, channel_targets
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class ChannelNotControlled(Exception):
+    def __init__(self, channel_id):
+        Exception.__init__(self, 'The event channel "%s" has no "control" section in the initfile.' % channel_id)
+
+
+class InvalidControlSetting(Exception):
+    def __init__(self, setting, value, reason):
+        Exception.__init__(self, 'Invalid control setting %s=%s: %s' % (setting, value, reason))
+
+
+def parse_sample_rate(value):
+    if value is None:
+        return None
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        raise InvalidControlSetting('sample', value, 'not a number.')
+    # float() accepts "nan" and "inf", and NaN compares false against both bounds
+    if not math.isfinite(rate):
+        raise InvalidControlSetting('sample', value, 'not a finite number.')
+    if not 0 <= rate <= 1:
+        raise InvalidControlSetting('sample', value, 'must be between 0 and 1.')
+    return rate
+
+
+def parse_predicates(value):
+    if value is None:
+        return None
+    try:
+        predicates = json.loads(value)
+    except ValueError:
+        raise InvalidControlSetting('where', value, 'not valid JSON.')
+    if not isinstance(predicates, dict):
+        raise InvalidControlSetting('where', value, 'must be a JSON object of column values.')
+    return predicates
+
+
+def controlled_channels(yaml_config, channel_ids=None):
+    '''Returns {(target_name, schema, table): [channel_id, ...]} for the
+    given channels, or for every controlled channel if none are given.
+    '''
+    channels = yaml_config['channels']
+    if not channel_ids:
+        channel_ids = [c for c in channels.keys() if control_settings(channels[c])]
+
+    tables = {}
+    for channel_id in channel_ids:
+        control = control_settings(channels[channel_id])
+        if not control:
+            raise ChannelNotControlled(channel_id)
+        for target_name in channel_targets(channels[channel_id]):
+            key = (target_name, control['schema'], control['table'])
+            tables.setdefault(key, []).append(channel_id)
+    return tables
+
+
+def _apply(yaml_config, channel_ids, execute):
+    targets = database_targets(yaml_config)
+    tables = controlled_channels(yaml_config, channel_ids)
+    for target_name in sorted(set([t[0] for t in tables.keys()])):
+        conn = psycopg2.connect(**targets[target_name])
+        try:
+            cursor = conn.cursor()
+            for (table_target, schema, table_name), table_channels in sorted(tables.items()):
+                if table_target == target_name:
+                    execute(cursor, target_name, schema, table_name, table_channels)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def set_channel_control(yaml_config, channel_ids, enabled=None, sample_rate=None, predicates=None):
+    '''Updates the control rows of the channels in every database they are
+    deployed to. Settings left as None keep their current value.
+    '''
+    params = {'enabled': enabled,
+              'sample_rate': sample_rate,
+              'predicates': json.dumps(predicates) if predicates is not None else None}
+
+    def execute(cursor, target_name, schema, table_name, table_channels):
+        upsert = code.CONTROL_UPSERT_TEMPLATE.format(schema=schema, table_name=table_name)
+        for channel_id in table_channels:
+            params['channel'] = channel_id
+            cursor.execute(upsert, params)
+            logger.info('database "%s": updated controls of channel "%s"' % (target_name, channel_id))
+
+    _apply(yaml_config, channel_ids, execute)
+
+
+def reset_channel_control(yaml_config, channel_ids):
+    '''Removes the channels' control rows, so they notify for every row.'''
+
+    def execute(cursor, target_name, schema, table_name, table_channels):
+        delete = code.CONTROL_DELETE_TEMPLATE.format(schema=schema, table_name=table_name)
+        for channel_id in table_channels:
+            cursor.execute(delete, (channel_id,))
+            logger.info('database "%s": reset controls of channel "%s"' % (target_name, channel_id))
+
+    _apply(yaml_config, channel_ids, execute)
+
+
+def channel_control_status(yaml_config, channel_ids=None):
+    '''Returns (target, channel, enabled, sample_rate, predicates, updated_at)
+    for each controlled channel; channels without a control row are reported
+    with the defaults and no update time.
+    '''
+    status = []
+
+    def execute(cursor, target_name, schema, table_name, table_channels):
+        cursor.execute(code.CONTROL_SELECT_TEMPLATE.format(schema=schema, table_name=table_name),
+                       (table_channels,))
+        rows = dict([(row[0], row) for row in cursor.fetchall()])
+        for channel_id in table_channels:
+            row = rows.get(channel_id) or (channel_id, True, 1.0, '{}', None)
+            status.append((target_name,) + tuple(row))
+
+    _apply(yaml_config, channel_ids, execute)
+    return status
+
+
+def format_status(status):
+    lines = []
+    for target_name, channel_id, enabled, sample_rate, predicates, updated_at in status:
+        lines.append('%s\t%s\t%s\tsample=%g\twhere=%s%s' \
+                     % (target_name,
+                        channel_id,
+                        'enabled' if enabled else 'disabled',
+                        sample_rate,
+                        predicates,
+                        '\tupdated %s' % updated_at if updated_at else ''))
+    return '\n'.join(lines)
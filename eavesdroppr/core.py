@@ -1,47 +1,54 @@
 #!/usr/bin/env python
 
 import os, sys
-import pgpubsub
-from snap import snap, common
+import re
+from snap import common
 from snap import cli_tools as cli
-from eavesdroppr import code_templates as code
+from eavesdroppr.codegen import CodeGenerator, UnsupportedDBOperation, SUPPORTED_DB_OPS
+from eavesdroppr.codegen import default_proc_name, default_trigger_name
 from eavesdroppr import config_templates as config
+# the listener runtime lives in its own module so that listening does not
+# import the authoring CLI; its names are re-exported here for existing callers
+from eavesdroppr.runtime import NoSuchEventChannel, NoSuchEventHandler, DEFAULT_SELECT_TIMEOUT
+from eavesdroppr.runtime import default_event_handler, load_event_handler
+from eavesdroppr.runtime import bootstrap, run_event_loop, listen
 from eavesdroppr.metaobjects import *
 import logging
+import shlex
 import jinja2
 import json
+import yaml
 from cmd import Cmd
 from docopt import docopt as docopt_func
 from docopt import DocoptExit
 
 
 
-SUPPORTED_DB_OPS = ['INSERT', 'UPDATE']
-
 OPERATION_OPTIONS = [{'value': 'INSERT', 'label': 'INSERT'}, {'value': 'UPDATE', 'label': 'UPDATE'}]
 
+CHSO_OPTIONS = [{'value': 'add_params', 'label': 'add init params'},
+                {'value': 'remove_params', 'label': 'remove init params'}]
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger('eavesdroppr')
+# initfile sections the CLI models; any others are written back as read
+MODELED_SECTIONS = ['globals', 'service_objects', 'channels']
 
+# strings which safe_dump would write as they are; checked first, as most
+# values in an initfile are names
+PLAIN_SCALAR_PATTERN = re.compile(r'^[A-Za-z_$][\w.\-/$]*$')
+YAML_STR_TAG = 'tag:yaml.org,2002:str'
+yaml_resolver = yaml.resolver.Resolver()
 
-class NoSuchEventChannel(Exception):
-    def __init__(self, channel_id):
-        Exception.__init__(self,
-                           'No event channel registered under the name "%s". Please check your initfile.' \
-                           % channel_id)
+# the commands which never prompt, and so can run from a batch edit file
+BATCH_COMMANDS = ['set', 'add', 'remove', 'rename', 'globals', 'catalog', 'save', 'list', 'show', 'preview']
 
 
-class NoSuchEventHandler(Exception):
-    def __init__(self, handler_func_name, handler_module):
-        Exception.__init__(self,
-                           'No event handler function "%s" exists in event handler module "%s".' \
-                           % (handler_func_name, handler_module))
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('eavesdroppr')
 
 
-class UnsupportedDBOperation(Exception):
-    def __init__(self, operation):
-        Exception.__init__(self, 'The database operation "%s" is not supported.' % operation)
+class ConfigEditError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
 
 
 
@@ -52,11 +59,17 @@ def docopt_cmd(func):
     """
     def fn(self, arg):
         try:
-            opt = docopt_func(fn.__doc__, arg)
+            opt = docopt_func(fn.__doc__, shlex.split(arg))
+
+        except ValueError as e:
+            # unbalanced quotes
+            raise ConfigEditError('cannot parse "%s": %s' % (arg, e))
 
         except DocoptExit as e:
             # The DocoptExit is thrown when the args do not match.
             # We print a message to the user and the usage block.
+            if self.batch_mode:
+                raise ConfigEditError('invalid command parameters.\n%s' % e)
 
             print('\nPlease specify one or more valid command parameters.')
             print(e)
@@ -76,95 +89,63 @@ def docopt_cmd(func):
     return fn
 
 
-def default_proc_name(table_name, operation):
-    return '%s_%s_notify' % (table_name, operation.lower())
-
-
-def default_trigger_name(table_name, operation):
-    return 'trg_%s_%s' % (table_name, operation.lower())
-
-
 def generate_code(event_channel, channel_config, **kwargs):
-    operation = channel_config['db_operation']
-    if not operation in SUPPORTED_DB_OPS:
-        raise UnsupportedDBOperation(operation)
-
-    table_name = channel_config['db_table_name']
-    db_schema = channel_config.get('db_schema') or 'public'
-    procedure_name = channel_config.get('db_proc_name') or default_proc_name(table_name, operation)
-    trigger_name = channel_config.get('db_trigger_name') or default_trigger_name(table_name,
-                                                                                 operation)
-    source_fields = channel_config['payload_fields']
-    primary_key_field = channel_config['pk_field_name']
-    primary_key_type = channel_config['pk_field_type']
-
-    j2env = jinja2.Environment()
-    template_mgr = common.JinjaTemplateManager(j2env)
-    json_func_template = j2env.from_string(code.JSON_BUILD_FUNC_TEMPLATE)
-    json_func = json_func_template.render(payload_fields=source_fields,
-                                          pk_field=primary_key_field)
-
+    channel_code = CodeGenerator().generate(event_channel, channel_config)
     if kwargs['procedure']:
-        print(code.PROC_TEMPLATE.format(schema=db_schema,
-                                        proc_name=procedure_name,
-                                        pk_field_name=primary_key_field,
-                                        pk_field_type=primary_key_type,
-                                        channel_name=event_channel,
-                                        json_build_func=json_func))
+        print(channel_code.procedure_sql)
 
     elif kwargs['trigger']:
-        print(code.TRIGGER_TEMPLATE.format(schema=db_schema,
-                                      table_name=table_name,
-                                      trigger_name=trigger_name,
-                                      db_proc_name=procedure_name,
-                                      db_op=operation))
-
+        print(channel_code.trigger_sql)
 
-def default_event_handler(event, svc_object_registry):
-    print(common.jsonpretty(json.loads(event.payload)))
 
+def yaml_scalar(value):
+    '''Renders a value as inline YAML; None renders as nothing.'''
+    if value is None:
+        return ''
+    if isinstance(value, str) and PLAIN_SCALAR_PATTERN.match(value) \
+       and yaml_resolver.resolve(yaml.ScalarNode, value, (True, False)) == YAML_STR_TAG:
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    text = yaml.safe_dump(value, default_flow_style=True, width=float('inf'))
+    if text.endswith('\n...\n'):
+        text = text[:-len('\n...\n')]
+    return text.strip()
 
-def listen(channel_id, yaml_config, **kwargs):
-    local_env = common.LocalEnvironment('PGSQL_USER', 'PGSQL_PASSWORD')
-    local_env.init()
 
-    pgsql_user = local_env.get_variable('PGSQL_USER')
-    pgsql_password = local_env.get_variable('PGSQL_PASSWORD')
-    db_host = yaml_config['globals']['database_host']
-    db_name = yaml_config['globals']['database_name']
-
-    pubsub = pgpubsub.connect(host=db_host,
-                              user=pgsql_user,
-                              password=pgsql_password,
-                              database=db_name)
-    handler_module_name = yaml_config['globals']['handler_module']
-
-    project_dir = common.load_config_var(yaml_config['globals']['project_directory'])
-    sys.path.append(project_dir)
-    handlers = __import__(handler_module_name)
-    handler_function_name = yaml_config['channels'][channel_id].get('handler_function') or 'default_handler'
-
-    if handler_function_name != 'default_handler':
-        if not hasattr(handlers, handler_function_name):
-            raise NoSuchEventHandler(handler_function_name, handler_module_name)
-
-        handler_function = getattr(handlers, handler_function_name)
-    else:
-        handler_function = default_event_handler
-
-    service_objects = common.ServiceObjectRegistry(snap.initialize_services(yaml_config))
-
-    pubsub.listen(channel_id)
-    print('listening on channel "%s"...' % channel_id)
-    for event in pubsub.events():
-        handler_function(event, service_objects)
+def yaml_block(value, indent):
+    '''Renders a dict as block YAML, indented by indent spaces.'''
+    text = yaml.safe_dump(value, default_flow_style=False, sort_keys=False)
+    return '\n'.join([' ' * indent + line if line else line for line in text.splitlines()]) + '\n'
 
 
 
 class EavesdropConfigWriter(object):
+    '''Renders the initfile. Each service object and channel section is
+    rendered once and cached against the meta object it came from; meta
+    objects are immutable, so after an edit only the changed sections are
+    rendered again and the rest of the file is reassembled from the cache.
+    '''
 
     def __init__(self):
-        pass
+        self._j2env = jinja2.Environment()
+        self._j2env.filters['yaml'] = yaml_scalar
+        self._j2env.filters['yaml_block'] = yaml_block
+        self._header_template = self._j2env.from_string(config.INIT_FILE_HEADER)
+        self._svcobject_template = self._j2env.from_string(config.SERVICE_OBJECT_ENTRY)
+        self._channel_template = self._j2env.from_string(config.CHANNEL_ENTRY)
+        self._extras_template = self._j2env.from_string(config.EXTRA_SECTIONS)
+        self._sections = {}
+
+
+    def _render_section(self, key, template, **kwargs):
+        item = list(kwargs.values())[0]
+        cached = self._sections.get(key)
+        if cached is not None and cached[0] is item:
+            return cached[1]
+        text = template.render(**kwargs) + '\n'
+        self._sections[key] = (item, text)
+        return text
 
 
     def write(self, **kwargs):
@@ -172,11 +153,27 @@ class EavesdropConfigWriter(object):
                                            'channels')
 
         kwreader.read(**kwargs)
-        j2env = jinja2.Environment()
-        template = j2env.from_string(config.INIT_FILE)
-        return template.render(global_settings=kwreader.get_value('settings'),
-                               channels=kwreader.get_value('channels') or [],
-                               service_objects=kwargs.get('services', []))
+        parts = [self._header_template.render(global_settings=kwreader.get_value('settings'))]
+        live_keys = set()
+
+        parts.append(config.SERVICE_OBJECTS_HEADER)
+        for so in kwargs.get('services', []):
+            key = ('svcobj', so.name)
+            live_keys.add(key)
+            parts.append(self._render_section(key, self._svcobject_template, so=so))
+
+        parts.append(config.CHANNELS_HEADER)
+        for ch in kwreader.get_value('channels') or []:
+            key = ('channel', ch.name)
+            live_keys.add(key)
+            parts.append(self._render_section(key, self._channel_template, ch=ch))
+
+        if kwargs.get('sections'):
+            parts.append(self._extras_template.render(sections=kwargs['sections']))
+
+        if len(self._sections) > len(live_keys):
+            self._sections = dict([(k, v) for k, v in self._sections.items() if k in live_keys])
+        return ''.join(parts)
 
 
 
@@ -189,27 +186,30 @@ class EavesdropCLI(Cmd):
 
         globals = kwreader.get_value('globals') or {}
         self.global_settings = GlobalSettingsMeta(**globals)
-        self.channels = kwreader.get_value('channels') or []
-        self.service_objects = kwreader.get_value('service_objects') or []
+        self.channels = MetaIndex(kwreader.get_value('channels'))
+        self.service_objects = MetaIndex(kwreader.get_value('service_objects'))
+        self.extra_sections = kwreader.get_value('sections') or {}
+        self.catalog = None
+        self.batch_mode = False
+        self._config_writer = EavesdropConfigWriter()
+
+
+    @classmethod
+    def from_config(cls, yaml_config):
+        '''Returns a CLI holding the contents of a loaded initfile.'''
+        service_objects = [ServiceObjectMeta.from_config(name, so_config or {})
+                           for name, so_config in (yaml_config.get('service_objects') or {}).items()]
+        channels = [ChannelMeta.from_config(name, channel_config or {})
+                    for name, channel_config in (yaml_config.get('channels') or {}).items()]
+        sections = dict([(k, v) for k, v in yaml_config.items() if k not in MODELED_SECTIONS])
+        return cls(globals=yaml_config.get('globals') or {},
+                   channels=channels,
+                   service_objects=service_objects,
+                   sections=sections)
 
 
     def find_channel(self, name):
-        result = None
-        for s in self.channels:
-            if s.name == name:
-                result = s
-                break
-
-        return result
-
-
-    def get_channel_index(self, name):
-        result = -1
-        for i in range(0, len(self.channels)):
-            if self.channels[i].name == name:
-                result = i
-                break
-        return result
+        return self.channels.get(name)
 
 
     def select_channel(self):
@@ -229,17 +229,11 @@ class EavesdropCLI(Cmd):
 
     def edit_channel(self, name):
         print('+++ Updating event channel')
-        channel_index = self.get_channel_index(name)
-        if channel_index < 0:
+        current_channel = self.find_channel(name)
+        if current_channel is None:
             print('No event channel registered under the name %s.' % name)
             return
 
-        current_channel = self.channels[channel_index]
-        '''
-        channel_name = cli.InputPrompt('change name to', current_channel.name).show()
-        self.channels[channel_index] = current_channel.rename(channel_name)
-        '''
-
         while True:
             property_options = [{'value': pn, 'label': pn} for pn in current_channel.property_names()]
             target_property_name = cli.MenuPrompt('event channel property to update',
@@ -248,48 +242,48 @@ class EavesdropCLI(Cmd):
             if target_property_name == 'handler_function':
                 handler_func = cli.InputPrompt('change handler function to',
                                                current_channel.handler_function).show()
-                self.channels[channel_index] = current_channel.set_property('handler_function',
+                current_channel = current_channel.set_property('handler_function',
                                                                             handler_func)
 
             elif target_property_name == 'table_name':
                 db_table_name = cli.InputPrompt('change table name to',
                                                 current_channel.table_name).show()
-                self.channels[channel_index] = current_channel.set_property('table_name',
+                current_channel = current_channel.set_property('table_name',
                                                                             db_table_name)
 
             elif target_property_name == 'operation':
                 db_operation = cli.InputPrompt('change operation to',
                                                current_channel.operation).show()
-                self.channels[channel_index] = current_channel.set_property('operation',
+                current_channel = current_channel.set_property('operation',
                                                                             db_operation)
 
             elif target_property_name == 'primary_key_field':
                 pk_field = cli.InputPrompt('change primary key field to',
                                            current_channel.primary_key_field).show()
-                self.channels[channel_index] = current_channel.set_property('primary_key_field',
+                current_channel = current_channel.set_property('primary_key_field',
                                                                             pk_field)
 
             elif target_property_name == 'primary_key_type':
                 pk_type = cli.InputPrompt('change primary key type to',
                                           current_channel.primary_key_type).show()
-                self.channels[channel_index] = current_channel.set_property('primary_key_type',
+                current_channel = current_channel.set_property('primary_key_type',
                                                                             pk_type)
 
             elif target_property_name == 'schema':
                 db_schema = cli.InputPrompt('change schema to',
                                             current_channel.schema).show()
-                self.channels[channel_index] = current_channel.set_property('schema', db_schema)
+                current_channel = current_channel.set_property('schema', db_schema)
 
             elif target_property_name == 'procedure_name':
                 procname = cli.InputPrompt('change stored procedure name to',
                                            current_channel.procedure_name).show()
-                self.channels[channel_index] = current_channel.set_property('procedure_name',
+                current_channel = current_channel.set_property('procedure_name',
                                                                             procname)
 
             elif target_property_name == 'trigger_name':
                 trigger = cli.InputPrompt('change trigger name to',
                                           current_channel.trigger_name).show()
-                self.channels[channel_index] = current_channel.set_property('trigger_name', trigger)
+                current_channel = current_channel.set_property('trigger_name', trigger)
 
             elif target_property_name == 'payload_fields':
                 while True:
@@ -306,7 +300,7 @@ class EavesdropCLI(Cmd):
                         if num_new_fields == 0:
                             print('+++ cancelling edit of payload fields in channel.')
                             break
-                        self.channels[channel_index] = current_channel.add_payload_fields(*new_fields)
+                        current_channel = current_channel.add_payload_fields(*new_fields)
 
                     elif action == 'delete':
                         field_options = [{'label': f, 'value': f} for f in current_channel.payload_fields]
@@ -314,11 +308,12 @@ class EavesdropCLI(Cmd):
                         if not field:
                             print('+++ cancelling edit of payload fields in channel.')
                             break
-                        self.channels[channel_index] = current_channel.delete_payload_field(field)
+                        current_channel = current_channel.delete_payload_field(field)
 
                     print('+++ channel "%s" now contains payload fields:' % current_channel.name)
                     print('\n'.join(['-%s' % f for f in current_channel.payload_fields]))
 
+            self.channels.put(current_channel)
             should_continue = cli.InputPrompt('edit another event channel property (Y/n)?',
                                               'y').show()
             if should_continue == 'y':
@@ -327,21 +322,7 @@ class EavesdropCLI(Cmd):
 
 
     def find_service_object(self, name):
-        result = None
-        for so in self.service_objects:
-            if so.name == name:
-                result = so
-                break
-        return result
-
-
-    def get_service_object_index(self, name):
-        result = -1
-        for i in range(0, len(self.service_objects)):
-            if self.service_objects[i].name == name:
-                result = i
-                break
-        return result
+        return self.service_objects.get(name)
 
 
     def select_service_object(self):
@@ -383,7 +364,7 @@ class EavesdropCLI(Cmd):
         print('+++ updating eavesdrop settings...')
         settings_menu = []
         defaults = self.global_settings.current_values
-        for key, value in defaults.iteritems():
+        for key, value in defaults.items():
             settings_menu.append({'label': key, 'value': key})
 
         while True:
@@ -391,10 +372,7 @@ class EavesdropCLI(Cmd):
             if not setting_name:
                 break
             setting_value = cli.InputPrompt(setting_name, defaults[setting_name]).show()
-
-            attr_name = 'set_%s' % setting_name
-            setter_func = getattr(self.global_settings, attr_name)
-            self.global_settings = setter_func(setting_value)
+            self.global_settings = self.global_settings.set_value(setting_name, setting_value)
 
             should_continue = cli.InputPrompt('update another (Y/n)?', 'y').show()
             if should_continue.lower() != 'y':
@@ -409,9 +387,7 @@ class EavesdropCLI(Cmd):
 
         defaults = self.global_settings.current_values
         setting_value = cli.InputPrompt(setting_name, defaults[setting_name]).show()
-        attr_name = 'set_%s' % setting_name
-        setter_func = getattr(self.global_settings, attr_name)
-        self.global_settings = setter_func(setting_value)
+        self.global_settings = self.global_settings.set_value(setting_name, setting_value)
 
 
     def create_service_object_params(self):
@@ -443,41 +419,40 @@ class EavesdropCLI(Cmd):
 
 
     def show_svcobject(self, name):
-        index = self.get_service_object_index(name)
-        if index < 0:
+        so = self.find_service_object(name)
+        if so is None:
             print('> No service object registered under the name %s.' % name)
             return
-        print(common.jsonpretty(self.service_objects[index].data()))
+        print(common.jsonpretty(so.data()))
 
 
     def edit_svcobject(self, so_name):
         print('+++ Updating service object')
-        so_index = self.get_service_object_index(so_name)
-        if so_index < 0:
+        current_so = self.find_service_object(so_name)
+        if current_so is None:
             print('No service object registered under the name %s.' % so_name)
             return
 
-        current_so = self.service_objects[so_index]
-        so_name = cli.InputPrompt('change name to', current_so.name).show()
-        self.service_objects[so_index] = current_so.set_name(so_name)
-        current_so = self.service_objects[so_index]
+        new_name = cli.InputPrompt('change name to', current_so.name).show()
+        current_so = current_so.set_name(new_name)
+        self.service_objects.replace(so_name, current_so)
 
         so_classname = cli.InputPrompt('change class to', current_so.classname).show()
-        self.service_objects[so_index] = current_so.set_classname(so_classname)
-        current_so = self.service_objects[so_index]
+        current_so = current_so.set_classname(so_classname)
+        self.service_objects.put(current_so)
 
         operation = cli.MenuPrompt('select service object operation', CHSO_OPTIONS).show()
         if operation == 'add_params':
             new_params = self.create_service_object_params()
-            self.service_objects[so_index] = current_so.add_params(**new_params)
-            current_so = self.service_objects[so_index]
+            current_so = current_so.add_params(**new_params)
+            self.service_objects.put(current_so)
 
         if operation == 'remove_params':
             while True:
                 param_menu = [{'label': p['name'], 'value': p['name']} for p in current_so.init_params]
                 param_name = cli.MenuPrompt('select param to remove', param_menu).show()
-                self.service_objects[so_index] = current_so.remove_param(param_name)
-                current_so = self.service_objects[so_index]
+                current_so = current_so.remove_param(param_name)
+                self.service_objects.put(current_so)
 
                 should_continue = cli.InputPrompt('remove another (y/n)?', 'Y').show()
                 if should_continue.lower() != 'y':
@@ -493,6 +468,8 @@ class EavesdropCLI(Cmd):
         '''
 
         setting_name = arg.get('<setting_name>')
+        if self.batch_mode and (arg['update'] or (arg['set'] and arg.get('<setting_value>') is None)):
+            raise ConfigEditError('globals can only be changed with "globals set <setting_name> <setting_value>" in a batch.')
         if arg['update']:
             self.edit_global_settings()
         elif arg['set']:
@@ -506,9 +483,7 @@ class EavesdropCLI(Cmd):
                     print('\n'.join(['- %s' % (k) for k in self.global_settings.data().keys()]))
                     return
 
-                attr_name = 'set_%s' % setting_name
-                setter_func = getattr(self.global_settings, attr_name)
-                self.global_settings = setter_func(value)
+                self.global_settings = self.global_settings.set_value(setting_name, value)
 
         else:
             self.show_global_settings()
@@ -520,11 +495,11 @@ class EavesdropCLI(Cmd):
 
 
     def show_channel(self, name):
-        index = self.get_channel_index(name)
-        if index < 0:
+        channel = self.find_channel(name)
+        if channel is None:
             print('> No event channel registered under the name %s.' % name)
             return
-        print(common.jsonpretty(self.channels[index].data()))
+        print(common.jsonpretty(channel.data()))
 
 
     def list_svcobjects(self):
@@ -572,22 +547,45 @@ class EavesdropCLI(Cmd):
 
             channel_params['schema'] = cli.InputPrompt('db schema', 'public').show()
 
+            # with a catalog loaded, the key and payload fields default to the table's own
+            table_info = None
+            if self.catalog:
+                table_info = self.catalog.get_table(channel_params['schema'], channel_params['table_name'])
+                if table_info is None:
+                    print('!! table %s.%s is not in the loaded catalog.' \
+                          % (channel_params['schema'], channel_params['table_name']))
+
+            default_pk_field = 'id'
+            default_pk_type = 'bigint'
+            if table_info and len(table_info.primary_key) == 1:
+                default_pk_field = table_info.primary_key[0]
+                default_pk_type = table_info.column(default_pk_field).data_type
+
             channel_params['operation'] = cli.MenuPrompt('operation', OPERATION_OPTIONS).show()
             if channel_params['operation'] is None:
                 break
             missing_params -= 1
 
-            channel_params['primary_key_field'] = cli.InputPrompt('primary key field', 'id').show()
+            channel_params['primary_key_field'] = cli.InputPrompt('primary key field', default_pk_field).show()
             if channel_params['primary_key_field'] is None:
                 break
             missing_params -= 1
 
-            channel_params['primary_key_type'] = cli.InputPrompt('primary key type', 'bigint').show()
+            channel_params['primary_key_type'] = cli.InputPrompt('primary key type', default_pk_type).show()
             if channel_params['primary_key_type'] is None:
                 break
             missing_params -= 1
 
-            channel_params['payload_fields'] = self.prompt_for_payload_fields(channel_name)
+            if table_info:
+                columns = [c for c in table_info.column_names if c != channel_params['primary_key_field']]
+                print('+++ columns: %s' % ', '.join(columns))
+                use_all = cli.InputPrompt('use all columns as payload fields (Y/n)?', 'y').show()
+                if use_all.lower() == 'y':
+                    channel_params['payload_fields'] = columns
+                else:
+                    channel_params['payload_fields'] = self.prompt_for_payload_fields(channel_name)
+            else:
+                channel_params['payload_fields'] = self.prompt_for_payload_fields(channel_name)
 
             channel_params['handler_function'] = cli.InputPrompt('handler function').show()
             channel_params['procedure_name'] = cli.InputPrompt('stored procedure name',
@@ -607,6 +605,33 @@ class EavesdropCLI(Cmd):
             break
 
 
+    @docopt_cmd
+    def do_catalog(self, cmd_args):
+        '''Usage:
+                catalog read <schema>...
+                catalog load <cachefile>
+                catalog save <cachefile>
+        '''
+
+        if cmd_args['read']:
+            from eavesdroppr.catalog import read_catalog
+            from eavesdroppr.multiplex import database_targets, DEFAULT_DATABASE_TARGET
+            targets = database_targets({'globals': self.global_settings.data()})
+            self.catalog = read_catalog(targets[DEFAULT_DATABASE_TARGET], cmd_args['<schema>'])
+            print('+++ read %d tables into the catalog.' % len(self.catalog.tables))
+
+        elif cmd_args['load']:
+            from eavesdroppr.catalog import SchemaCatalog
+            self.catalog = SchemaCatalog.load(cmd_args['<cachefile>'])
+            print('+++ loaded %d tables into the catalog.' % len(self.catalog.tables))
+
+        elif cmd_args['save']:
+            if not self.catalog:
+                print('No catalog has been read or loaded yet.')
+                return
+            self.catalog.save(cmd_args['<cachefile>'])
+
+
     @docopt_cmd
     def do_make(self, cmd_args):
         '''Usage:
@@ -706,11 +731,10 @@ class EavesdropCLI(Cmd):
 
 
     def yaml_config(self):
-        cwriter = EavesdropConfigWriter()
-        config = cwriter.write(settings=self.global_settings,
-                               channels=self.channels,
-                               services=self.service_objects)
-        return config
+        return self._config_writer.write(settings=self.global_settings,
+                                         channels=self.channels,
+                                         services=self.service_objects,
+                                         sections=self.extra_sections)
 
 
     def do_preview(self, arg):
@@ -721,3 +745,182 @@ class EavesdropCLI(Cmd):
             print(self.yaml_config())
         else:
             print(message)
+
+
+    def onecmd(self, line):
+        if self.batch_mode:
+            return Cmd.onecmd(self, line)
+        try:
+            return Cmd.onecmd(self, line)
+        except ConfigEditError as e:
+            print('!! %s' % e)
+
+
+    def default(self, line):
+        raise ConfigEditError('unknown command: %s' % line)
+
+
+    def run_batch(self, edit_file):
+        '''Applies a file of CLI commands, one per line, without prompting.
+        Blank lines and lines starting with # are skipped. Stops at the first
+        command which fails, raising ConfigEditError.
+        '''
+        self.batch_mode = True
+        try:
+            with open(edit_file) as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    command = self.parseline(line)[0]
+                    try:
+                        if command not in BATCH_COMMANDS:
+                            raise ConfigEditError('"%s" prompts for input and cannot run in a batch.' % command)
+                        self.onecmd(line)
+                    except ConfigEditError as e:
+                        raise ConfigEditError('%s, line %d: %s' % (edit_file, line_number, e))
+        finally:
+            self.batch_mode = False
+
+
+    def require_channel(self, name):
+        channel = self.find_channel(name)
+        if channel is None:
+            raise ConfigEditError('no event channel registered under the name %s.' % name)
+        return channel
+
+
+    def require_service_object(self, name):
+        so = self.find_service_object(name)
+        if so is None:
+            raise ConfigEditError('no service object registered under the name %s.' % name)
+        return so
+
+
+    @docopt_cmd
+    def do_set(self, cmd_args):
+        '''Usage:
+                set channel <name> <property> <value>
+                set svcobj <name> class <classname>
+                set svcobj <name> param <param_name> <value>
+
+        Values are read as YAML, as they would be in the initfile.
+        '''
+
+        name = cmd_args['<name>']
+        if cmd_args['channel']:
+            channel = self.require_channel(name)
+            self.channels.put(channel.set_property(cmd_args['<property>'], yaml.safe_load(cmd_args['<value>'])))
+        elif cmd_args['class']:
+            so = self.require_service_object(name)
+            self.service_objects.put(so.set_classname(cmd_args['<classname>']))
+        elif cmd_args['param']:
+            so = self.require_service_object(name)
+            self.service_objects.put(so.add_param(cmd_args['<param_name>'], yaml.safe_load(cmd_args['<value>'])))
+
+
+    def default_schema(self, table_name):
+        '''Returns the schema of table_name if the loaded catalog has it in
+        exactly one schema, otherwise "public", as "make channel" defaults to.
+        '''
+        if self.catalog:
+            schemas = set([schema for schema, name in self.catalog.tables.keys() if name == table_name])
+            if len(schemas) == 1:
+                return schemas.pop()
+        return 'public'
+
+
+    @docopt_cmd
+    def do_add(self, cmd_args):
+        '''Usage:
+                add channel <name> <table_name> <operation> <pk_field> <pk_type> [<field>...] [--schema=<schema>]
+                add svcobj <name> <classname>
+                add fields <name> <field>...
+
+        Without --schema, a channel's table is looked up in the loaded
+        catalog, and otherwise taken to be in the public schema.
+        '''
+
+        name = cmd_args['<name>']
+        if cmd_args['channel']:
+            if name in self.channels:
+                raise ConfigEditError('an event channel named %s already exists.' % name)
+            table_name = cmd_args['<table_name>']
+            operation = cmd_args['<operation>'].upper()
+            if operation not in SUPPORTED_DB_OPS:
+                raise ConfigEditError(str(UnsupportedDBOperation(operation)))
+            self.channels.put(ChannelMeta.from_config(name,
+                                                      {'db_table_name': table_name,
+                                                       'db_operation': operation,
+                                                       'pk_field_name': cmd_args['<pk_field>'],
+                                                       'pk_field_type': cmd_args['<pk_type>'],
+                                                       'db_schema': cmd_args['--schema'] or self.default_schema(table_name),
+                                                       'db_proc_name': default_proc_name(table_name, operation),
+                                                       'db_trigger_name': default_trigger_name(table_name, operation),
+                                                       'payload_fields': cmd_args['<field>']}))
+        elif cmd_args['svcobj']:
+            if name in self.service_objects:
+                raise ConfigEditError('a service object named %s already exists.' % name)
+            self.service_objects.put(ServiceObjectMeta(name, cmd_args['<classname>']))
+        elif cmd_args['fields']:
+            channel = self.require_channel(name)
+            self.channels.put(channel.add_payload_fields(*cmd_args['<field>']))
+
+
+    @docopt_cmd
+    def do_remove(self, cmd_args):
+        '''Usage:
+                remove channel <name>
+                remove svcobj <name>
+                remove fields <name> <field>...
+                remove property <name> <property>
+                remove param <name> <param_name>
+        '''
+
+        name = cmd_args['<name>']
+        if cmd_args['channel']:
+            if self.channels.remove(name) is None:
+                raise ConfigEditError('no event channel registered under the name %s.' % name)
+        elif cmd_args['svcobj']:
+            if self.service_objects.remove(name) is None:
+                raise ConfigEditError('no service object registered under the name %s.' % name)
+        elif cmd_args['fields']:
+            channel = self.require_channel(name)
+            for field in cmd_args['<field>']:
+                channel = channel.delete_payload_field(field)
+            self.channels.put(channel)
+        elif cmd_args['property']:
+            channel = self.require_channel(name)
+            self.channels.put(channel.remove_property(cmd_args['<property>']))
+        elif cmd_args['param']:
+            so = self.require_service_object(name)
+            self.service_objects.put(so.remove_param(cmd_args['<param_name>']))
+
+
+    @docopt_cmd
+    def do_rename(self, cmd_args):
+        '''Usage: rename (channel | svcobj) <name> <new_name>'''
+
+        name = cmd_args['<name>']
+        new_name = cmd_args['<new_name>']
+        if cmd_args['channel']:
+            channel = self.require_channel(name)
+            if new_name in self.channels:
+                raise ConfigEditError('an event channel named %s already exists.' % new_name)
+            self.channels.replace(name, channel.rename(new_name))
+        else:
+            so = self.require_service_object(name)
+            if new_name in self.service_objects:
+                raise ConfigEditError('a service object named %s already exists.' % new_name)
+            self.service_objects.replace(name, so.set_name(new_name))
+
+
+    @docopt_cmd
+    def do_save(self, cmd_args):
+        '''Usage: save <initfile>'''
+
+        message = self.get_save_condition()
+        if message != 'ok':
+            raise ConfigEditError(message)
+        with open(cmd_args['<initfile>'], 'w') as f:
+            f.write(self.yaml_config())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import hashlib
+from collections import OrderedDict
+
+
+DEFAULT_DEDUP_CAPACITY = 10000
+
+
+class LRUKeyCache(object):
+    '''Fixed-capacity set of recently seen keys. When full, the least
+    recently seen key is evicted to make room for a new one.
+    '''
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('LRUKeyCache capacity must be a positive integer.')
+        self._capacity = capacity
+        self._keys = OrderedDict()
+
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def check_and_add(self, key):
+        '''Returns True if the key was already present (and refreshes it),
+        False if it is new (and records it).
+        '''
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+
+        self._keys[key] = None
+        if len(self._keys) > self._capacity:
+            self._keys.popitem(last=False)
+        return False
+
+
+
+def event_key(event):
+    data = event.data()
+    # a transaction may change the same row more than once, so the payload
+    # tells such events apart; txids are only unique within one database
+    payload_hash = hashlib.sha1(event.payload.encode('utf-8')).hexdigest()
+    return (event.source, event.channel, data.get('table'), data.get('primary_key'), data.get('txid'), payload_hash)
+
+
+
+class DedupFilter(object):
+    '''Drops events whose (channel, table, primary_key, txid) key and
+    payload hash were seen recently.
+    '''
+
+    def __init__(self, capacity=DEFAULT_DEDUP_CAPACITY):
+        self._seen = LRUKeyCache(capacity)
+        self.hits = 0
+        self.misses = 0
+
+
+    def accept(self, event):
+        if self._seen.check_and_add(event_key(event)):
+            self.hits += 1
+            return False
+
+        self.misses += 1
+        return True
+
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._seen),
+                'capacity': self._seen.capacity}
+
+
+
+def create_dedup_filter(channel_config):
+    '''Returns a DedupFilter if the channel enables deduplication in the
+    initfile, otherwise None. Either form is accepted:
+
+        dedup: True
+
+        dedup:
+            capacity: 50000
+    '''
+    dedup_config = channel_config.get('dedup')
+    if not dedup_config:
+        return None
+
+    if dedup_config is True:
+        return DedupFilter()
+
+    return DedupFilter(int(dedup_config.get('capacity') or DEFAULT_DEDUP_CAPACITY))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import logging
+import psycopg2
+from eavesdroppr import code_templates as code
+from eavesdroppr.codegen import CodeGenerator
+from eavesdroppr.multiplex import database_targets, channel_targets
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+# pg_trigger.tgtype bits
+TRIGGER_TYPE_ROW = 1
+TRIGGER_TYPE_BEFORE = 2
+TRIGGER_TYPE_OPS = {'INSERT': 4, 'DELETE': 8, 'UPDATE': 16}
+
+
+def normalize_sql(sql):
+    return ' '.join(sql.split())
+
+
+def expected_trigger_type(operation):
+    # AFTER triggers have the BEFORE bit clear
+    return TRIGGER_TYPE_ROW | TRIGGER_TYPE_OPS[operation]
+
+
+
+class CatalogState(object):
+    '''The eavesdrop-relevant slice of a database's catalog, read in two
+    set-based queries covering every schema used by the channels.
+    '''
+
+    def __init__(self, cursor, schemas):
+        self.tables = set()
+        cursor.execute(code.TABLE_CATALOG_QUERY, (list(schemas),))
+        for schema, table_name in cursor.fetchall():
+            self.tables.add((schema, table_name))
+
+        self.procedures = {}
+        cursor.execute(code.PROC_CATALOG_QUERY, (list(schemas),))
+        for schema, proc_name, proc_source in cursor.fetchall():
+            self.procedures[(schema, proc_name)] = proc_source
+
+        self.triggers = {}
+        cursor.execute(code.TRIGGER_CATALOG_QUERY, (list(schemas),))
+        for schema, table_name, trigger_name, proc_schema, proc_name, trigger_type in cursor.fetchall():
+            self.triggers[(schema, table_name, trigger_name)] = (proc_schema, proc_name, trigger_type)
+
+
+    def procedure_is_current(self, channel_code):
+        current_source = self.procedures.get((channel_code.schema, channel_code.procedure_name))
+        if current_source is None:
+            return False
+        return normalize_sql(current_source) == normalize_sql(channel_code.procedure_body)
+
+
+    def trigger_is_current(self, channel_code):
+        trigger = self.triggers.get((channel_code.schema, channel_code.table_name, channel_code.trigger_name))
+        if trigger is None:
+            return False
+        return trigger == (channel_code.schema,
+                           channel_code.procedure_name,
+                           expected_trigger_type(channel_code.operation))
+
+
+
+def plan_deployment(channel_codes, catalog):
+    '''Returns the list of SQL statements needed to bring the catalog in
+    line with the generated code; unchanged objects are left out.
+    '''
+    statements = []
+    control_tables = set([cc.control_table for cc in channel_codes if cc.control_table])
+    for schema, table_name in sorted(control_tables):
+        if (schema, table_name) not in catalog.tables:
+            statements.append(code.CONTROL_TABLE_TEMPLATE.format(schema=schema, table_name=table_name))
+    for cc in channel_codes:
+        if not catalog.procedure_is_current(cc):
+            statements.append(cc.procedure_sql)
+        if not catalog.trigger_is_current(cc):
+            statements.append(cc.trigger_sql)
+    return statements
+
+
+def deploy(yaml_config, dry_run=False):
+    '''Generates the procedure and trigger for every channel in the initfile,
+    compares them against pg_proc/pg_trigger, and applies what changed in a
+    single transaction per database target. With dry_run the SQL is printed
+    and nothing is applied.
+    '''
+    generator = CodeGenerator()
+    channels_by_target = {}
+    for channel_id, channel_config in yaml_config['channels'].items():
+        channel_code = generator.generate(channel_id, channel_config)
+        for target_name in channel_targets(channel_config):
+            channels_by_target.setdefault(target_name, []).append(channel_code)
+
+    targets = database_targets(yaml_config)
+    for target_name, channel_codes in channels_by_target.items():
+        conn = psycopg2.connect(**targets[target_name])
+        try:
+            cursor = conn.cursor()
+            schemas = set([cc.schema for cc in channel_codes])
+            schemas.update([cc.control_table[0] for cc in channel_codes if cc.control_table])
+            catalog = CatalogState(cursor, schemas)
+            statements = plan_deployment(channel_codes, catalog)
+
+            logger.info('database "%s": %d of %d channel objects need deploying' \
+                        % (target_name, len(statements), 2 * len(channel_codes)))
+            if dry_run or not statements:
+                for sql in statements:
+                    print(sql)
+                conn.rollback()
+                continue
+
+            for sql in statements:
+                cursor.execute(sql)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
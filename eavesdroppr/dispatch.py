@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+
+class ChannelDispatch(object):
+    '''Everything the listener does with an event arriving on one channel:
+    filters (each with an accept(event) method) decide whether the event
+    is delivered at all; sinks (each with a receive(event) method) see
+    every accepted event ahead of the handler function. Buffers and worker
+    pools which belong to the channel's handler chain are listed so that
+    the channel can be drained before it is replaced. A load shedder, if
+    any, thins out batches of received events before they are dispatched.
+    '''
+
+    def __init__(self, channel_id, handler_function, **kwargs):
+        self.channel_id = channel_id
+        self.handler_function = handler_function
+        self.filters = kwargs.get('filters') or []
+        self.sinks = kwargs.get('sinks') or []
+        self.buffers = kwargs.get('buffers') or []
+        self.pools = kwargs.get('pools') or []
+        self.shedder = kwargs.get('shedder')
+
+
+    def backlog(self):
+        '''Events accepted but still waiting for a worker.'''
+        return sum([pool.queue_depth for pool in self.pools])
+
+
+    def accept(self, event):
+        for f in self.filters:
+            if not f.accept(event):
+                return False
+        return True
+
+
+    def drain(self, svc_object_registry):
+        '''Delivers everything the channel's handler chain is holding: buffers
+        first, since they feed the worker pools, then the pools.
+        '''
+        for b in self.buffers:
+            getattr(b, 'drain', b.flush)(svc_object_registry)
+        for pool in self.pools:
+            pool.drain()
+
+
+
+class EventDispatcher(object):
+    '''Routes events to their channel. Buffers -- stages which hold events
+    back and deliver them in groups, such as the TransactionGrouper -- must
+    provide has_pending, flush_interval (how long a pending buffer may wait
+    for more input), expired(now) and flush(svc_object_registry).
+
+    An enabled profiler (a DispatchProfiler) is handed the events it
+    chooses to sample; every other event takes the plain path.
+    '''
+
+    def __init__(self, svc_object_registry, tx_grouper=None):
+        self._services = svc_object_registry
+        self._tx_grouper = tx_grouper
+        self._channels = {}
+        self._buffers = []
+        self.profiler = None
+        # set from a signal handler; the event loop calls profile_toggle
+        self.profile_toggle = None
+        self.profile_toggle_requested = False
+        if tx_grouper:
+            self._buffers.append(tx_grouper)
+
+
+    @property
+    def channel_ids(self):
+        return list(self._channels.keys())
+
+
+    @property
+    def has_pending(self):
+        return any([b.has_pending for b in self._buffers])
+
+
+    @property
+    def has_shedders(self):
+        return any([c.shedder for c in self._channels.values()])
+
+
+    def shedding_stats(self):
+        '''Drop counts of every channel with a load shedder, by channel.'''
+        return dict([(c.channel_id, c.shedder.stats()) for c in self._channels.values() if c.shedder])
+
+
+    def select_timeout(self, default_timeout):
+        intervals = [b.flush_interval for b in self._buffers if b.has_pending]
+        if not intervals:
+            return default_timeout
+        return min(intervals + [default_timeout])
+
+
+    def add_channel(self, channel_dispatch):
+        self._channels[channel_dispatch.channel_id] = channel_dispatch
+        self._buffers.extend(channel_dispatch.buffers)
+
+
+    def replace_channels(self, channel_dispatches, tx_grouper=None):
+        '''Drains every current channel, and the transaction grouper, through
+        the handlers they were built with, then swaps in the new channels in
+        one step. Buffers added with add_buffer() are kept.
+        '''
+        old_channels = list(self._channels.values())
+        for channel in old_channels:
+            channel.drain(self._services)
+        if self._tx_grouper:
+            self._tx_grouper.flush(self._services)
+
+        owned = set([id(b) for c in old_channels for b in c.buffers] + [id(self._tx_grouper)])
+        buffers = [b for b in self._buffers if id(b) not in owned]
+        if tx_grouper:
+            buffers.insert(0, tx_grouper)
+        channels = {}
+        for channel in channel_dispatches:
+            channels[channel.channel_id] = channel
+            buffers.extend(channel.buffers)
+
+        self._channels, self._buffers, self._tx_grouper = channels, buffers, tx_grouper
+
+
+    def add_buffer(self, buffer):
+        self._buffers.append(buffer)
+
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+
+    def dispatch(self, event):
+        if self.profiler and self.profiler.enabled and self.profiler.sample(event):
+            return self._dispatch_profiled(event)
+
+        channel = self._channels.get(event.channel)
+        if channel is None or not channel.accept(event):
+            return False
+
+        for sink in channel.sinks:
+            sink.receive(event)
+
+        if channel.handler_function:
+            channel.handler_function(event, self._services)
+        if self._tx_grouper:
+            self._tx_grouper.add(event, self._services)
+        return True
+
+
+    def shed(self, events, scheduler=None):
+        '''Applies each channel's load shedder to its share of a batch of
+        received events, and returns the events to dispatch, in order. A
+        channel's backlog is its part of the batch plus what is waiting in
+        the scheduler and in its worker pools.
+        '''
+        by_channel = {}
+        for event in events:
+            by_channel.setdefault(event.channel, []).append(event)
+
+        dropped = False
+        for channel_id, channel_events in by_channel.items():
+            channel = self._channels.get(channel_id)
+            if channel is None or channel.shedder is None:
+                by_channel[channel_id] = None
+                continue
+            backlog = len(channel_events) + channel.backlog()
+            if scheduler:
+                backlog += scheduler.queue_depth(channel_id)
+            kept = channel.shedder.shed(channel_events, backlog)
+            if len(kept) < len(channel_events):
+                by_channel[channel_id] = set([id(e) for e in kept])
+                dropped = True
+            else:
+                by_channel[channel_id] = None
+
+        if not dropped:
+            return events
+        return [e for e in events if not by_channel.get(e.channel) or id(e) in by_channel[e.channel]]
+
+
+    def _dispatch_profiled(self, event):
+        channel = self._channels.get(event.channel)
+        if channel is None:
+            return False
+
+        profiler = self.profiler
+        profiler.run(channel.channel_id, 'decode', channel.handler_function, event.data)
+        if not profiler.run(channel.channel_id, 'dispatch', channel.handler_function,
+                            self._accept_and_sink, channel, event):
+            return False
+
+        if channel.handler_function:
+            profiler.run(channel.channel_id, 'handler', channel.handler_function,
+                         channel.handler_function, event, self._services)
+        if self._tx_grouper:
+            self._tx_grouper.add(event, self._services)
+        return True
+
+
+    def _accept_and_sink(self, channel, event):
+        if not channel.accept(event):
+            return False
+        for sink in channel.sinks:
+            sink.receive(event)
+        return True
+
+
+    def tick(self, now):
+        for b in self._buffers:
+            if b.expired(now):
+                b.flush(self._services)
+
+
+    def flush(self):
+        for b in self._buffers:
+            b.flush(self._services)
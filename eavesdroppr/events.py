@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import json
+import time
+
+
+class ChannelEvent(object):
+    '''Wraps a raw LISTEN/NOTIFY notification. The JSON payload is decoded
+    at most once, on first access to data(), and shared by every stage
+    in the dispatch path. The channel, payload and pid attributes mirror
+    the underlying notification so that existing handlers keep working;
+    source names the database target the notification came from, and
+    received is when the listener read it.
+    '''
+
+    def __init__(self, channel, payload, pid=None, **kwargs):
+        self.channel = channel
+        self.payload = payload
+        self.pid = pid
+        self.source = kwargs.get('source')
+        self.received = kwargs.get('received')
+        self._data = kwargs.get('data')
+
+
+    @classmethod
+    def from_notify(cls, notify, source=None):
+        return ChannelEvent(notify.channel, notify.payload, notify.pid, source=source, received=time.time())
+
+
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.payload)
+        return self._data
+
+
+    @property
+    def table(self):
+        return self.data().get('table')
+
+
+    @property
+    def primary_key(self):
+        return self.data().get('primary_key')
+
+
+    @property
+    def operation(self):
+        return self.data().get('type')
+
+
+    @property
+    def txid(self):
+        return self.data().get('txid')
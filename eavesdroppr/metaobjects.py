@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 from snap import common
-import copy
 
 
 REQUIRED_CHANNEL_FIELDS = ['handler_function',
@@ -19,14 +18,114 @@ REQUIRED_GLOBAL_FIELDS = ['project_directory',
                           'handler_module']
 
 
+GLOBAL_SETTING_NAMES = ['debug',
+                        'database_host',
+                        'database_name',
+                        'service_module',
+                        'handler_module',
+                        'project_directory',
+                        'logfile']
+
+
+# initfile channel keys and the ChannelMeta properties they hold
+INITFILE_CHANNEL_KEYS = {'handler_function': 'handler_function',
+                         'db_table_name': 'table_name',
+                         'db_operation': 'operation',
+                         'pk_field_name': 'primary_key_field',
+                         'pk_field_type': 'primary_key_type',
+                         'db_schema': 'schema',
+                         'db_proc_name': 'procedure_name',
+                         'db_trigger_name': 'trigger_name',
+                         'payload_fields': 'payload_fields'}
+
+CHANNEL_PROPERTIES = set(INITFILE_CHANNEL_KEYS.values())
+
+
+
+class MetaIndex(object):
+    '''Named meta objects (channels or service objects), kept in the order
+    they were added and looked up by name in constant time. Meta objects
+    are immutable, so an edit replaces the entry under its name.
+    '''
+
+    def __init__(self, items=None):
+        self._items = {}
+        for item in items or []:
+            self.put(item)
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+
+    def __contains__(self, name):
+        return name in self._items
+
+
+    def names(self):
+        return list(self._items.keys())
+
+
+    def get(self, name):
+        return self._items.get(name)
+
+
+    def put(self, item):
+        '''Adds the item, or replaces the one of the same name in place.'''
+        self._items[item.name] = item
+
+
+    append = put
+
+
+    def remove(self, name):
+        return self._items.pop(name, None)
+
+
+    def replace(self, name, item):
+        '''Replaces the entry under name with item, which may carry a new
+        name; the entry keeps its position.
+        '''
+        if item.name == name:
+            self._items[name] = item
+            return
+        items = {}
+        for key, value in self._items.items():
+            if key == name:
+                items[item.name] = item
+            elif key != item.name:
+                items[key] = value
+        self._items = items
+
+
 
 class ServiceObjectMeta(object):
     def __init__(self, name, class_name, **kwargs):
         self._name = name
         self._classname = class_name
-        self._init_params = []
-        for param_name, param_value in kwargs.iteritems():
-            self._init_params.append({'name': param_name, 'value': param_value})
+        self._init_params = tuple([{'name': param_name, 'value': param_value}
+                                   for param_name, param_value in kwargs.items()])
+
+
+    @classmethod
+    def _derive(cls, name, class_name, init_params):
+        # the param dicts are never modified, so derived objects share them
+        so = cls.__new__(cls)
+        so._name = name
+        so._classname = class_name
+        so._init_params = tuple(init_params)
+        return so
+
+
+    @classmethod
+    def from_config(cls, name, so_config):
+        '''Builds the meta object for a service_objects entry of an initfile.'''
+        params = [{'name': p['name'], 'value': p.get('value')} for p in so_config.get('init_params') or []]
+        return cls._derive(name, so_config.get('class'), params)
 
 
     @property
@@ -61,24 +160,25 @@ class ServiceObjectMeta(object):
 
 
     def set_name(self, name):
-        return ServiceObjectMeta(name, self._classname, **self._params_to_dict(self._init_params))
+        return ServiceObjectMeta._derive(name, self._classname, self._init_params)
 
 
     def set_classname(self, classname):
-        return ServiceObjectMeta(self._name, classname, **self._params_to_dict(self._init_params))
+        return ServiceObjectMeta._derive(self._name, classname, self._init_params)
 
 
     def add_param(self, name, value):
-        new_param_list = copy.deepcopy(self._init_params)
-        new_param_list.append({'name': name, 'value': value})
-        params = self._params_to_dict(new_param_list)
-
-        return ServiceObjectMeta(self._name, self._classname, **params)
+        '''Adds the param, or replaces the value of an existing one.'''
+        new_param = {'name': name, 'value': value}
+        if self.find_param_by_name(name) is None:
+            return ServiceObjectMeta._derive(self._name, self._classname, self._init_params + (new_param,))
+        params = [new_param if p['name'] == name else p for p in self._init_params]
+        return ServiceObjectMeta._derive(self._name, self._classname, params)
 
 
     def add_params(self, **kwargs):
         updated_so = self
-        for name, value in kwargs.iteritems():
+        for name, value in kwargs.items():
             updated_so = updated_so.add_param(name, value)
         return updated_so
 
@@ -87,20 +187,14 @@ class ServiceObjectMeta(object):
         param = self.find_param_by_name(name)
         if not param:
             return self
-
-        new_param_list = copy.deepcopy(self._init_params)
-        new_param_list.remove(param)
-        params = {}
-        for p in new_param_list:
-            params[p['name']] = p['value']
-
-        return ServiceObjectMeta(self._name, self._classname, **params)
+        params = [p for p in self._init_params if p is not param]
+        return ServiceObjectMeta._derive(self._name, self._classname, params)
 
 
     def data(self):
         result = {'name': self._name,
                   'class': self._classname,
-                  'init_params': self._init_params}
+                  'init_params': [dict(p) for p in self._init_params]}
         return result
 
 
@@ -115,6 +209,8 @@ class GlobalSettingsMeta(object):
         self._handler_module = kwargs.get('handler_module') or '%s_handlers' % self._app_name
         self._project_directory = kwargs.get('project_directory') or  '$%s_HOME' % self._app_name.upper()
         self._logfile = kwargs.get('logfile') or '%s.log' % self._app_name
+        # settings the CLI has no property for, such as profiling
+        self._extra_settings = dict([(k, v) for k, v in kwargs.items() if k not in GLOBAL_SETTING_NAMES])
 
 
     @property
@@ -122,11 +218,23 @@ class GlobalSettingsMeta(object):
         original_attrs = self.__dict__
         attrs = {}
         for key in original_attrs:
-            if key != '_app_name':
+            if key not in ('_app_name', '_extra_settings'):
                 attrs[key.lstrip('_')] = original_attrs[key]
         return attrs
 
 
+    @property
+    def extra_settings(self):
+        return self._extra_settings
+
+
+    def set_value(self, name, value):
+        values = dict(self._extra_settings)
+        values.update(self.current_values)
+        values[name] = value
+        return GlobalSettingsMeta(**values)
+
+
     def data(self):
         return self.current_values
 
@@ -134,30 +242,86 @@ class GlobalSettingsMeta(object):
 
 
 class ChannelMeta(object):
+    '''An immutable event channel. Edits return a new ChannelMeta which
+    shares every unchanged value with this one, so an edit costs the size
+    of the channel's property dict rather than of its contents. Initfile
+    settings the CLI has no property for are kept in extras and written
+    back as they were.
+    '''
+
     def __init__(self, name, **kwargs):
         kwreader = common.KeywordArgReader(*REQUIRED_CHANNEL_FIELDS)
         kwreader.read(**kwargs)
         self.name = name
         self._data = {}
-        for key, value in kwargs.iteritems():
+        self._extras = {}
+        for key, value in kwargs.items():
             if key == 'payload_fields':
-                self._data[key] = set()
                 # here we know that value is actually a collection
-                for field in value:
-                    self._data[key].add(field)
+                self._data[key] = unique_fields(value)
             else:
                 self._data[key] = value
 
 
+    @classmethod
+    def _derive(cls, name, data, extras):
+        channel = cls.__new__(cls)
+        channel.name = name
+        channel._data = data
+        channel._extras = extras
+        return channel
+
+
+    @classmethod
+    def from_config(cls, name, channel_config):
+        '''Builds the meta object for a channels entry of an initfile.'''
+        data = {}
+        extras = {}
+        for key, value in channel_config.items():
+            if key in INITFILE_CHANNEL_KEYS:
+                data[INITFILE_CHANNEL_KEYS[key]] = value
+            else:
+                extras[key] = value
+        for prop in CHANNEL_PROPERTIES:
+            data.setdefault(prop, None)
+        data['payload_fields'] = unique_fields(data['payload_fields'] or [])
+        return cls._derive(name, data, extras)
+
+
+    @property
+    def extras(self):
+        return self._extras
+
+
     def rename(self, new_name):
-        new_data = copy.deepcopy(self._data)
-        return ChannelMeta(new_name, **new_data)
+        return ChannelMeta._derive(new_name, self._data, self._extras)
 
 
     def set_property(self, name, value):
-        new_data = copy.deepcopy(self._data)
-        new_data[name] = value
-        return ChannelMeta(self.name, **new_data)
+        '''Sets a property, given its name or its initfile key; any other
+        name sets an extra initfile setting.
+        '''
+        name = INITFILE_CHANNEL_KEYS.get(name, name)
+        if name not in CHANNEL_PROPERTIES:
+            new_extras = dict(self._extras)
+            new_extras[name] = value
+            return ChannelMeta._derive(self.name, self._data, new_extras)
+
+        new_data = dict(self._data)
+        new_data[name] = unique_fields(value) if name == 'payload_fields' else value
+        return ChannelMeta._derive(self.name, new_data, self._extras)
+
+
+    def remove_property(self, name):
+        '''Removes an extra initfile setting; properties are set to None.'''
+        name = INITFILE_CHANNEL_KEYS.get(name, name)
+        if name in CHANNEL_PROPERTIES:
+            return self.set_property(name, [] if name == 'payload_fields' else None)
+        if name not in self._extras:
+            return self
+        new_extras = dict(self._extras)
+        del new_extras[name]
+        return ChannelMeta._derive(self.name, self._data, new_extras)
 
 
     def property_names(self):
@@ -195,7 +359,7 @@ class ChannelMeta(object):
 
     @property
     def procedure_name(self):
-        return self._data['procedure_name']
+        return self._data.get('procedure_name')
 
 
     @property
@@ -209,26 +373,33 @@ class ChannelMeta(object):
 
 
     def add_payload_fields(self, *fields):
-        new_data = copy.deepcopy(self._data)
-        for field in fields:
-            new_data['payload_fields'].add(field)
-        return ChannelMeta(self.name, **new_data)
+        return self.set_property('payload_fields', self.payload_fields + tuple(fields))
 
 
     def delete_payload_field(self, field):
-        new_data = copy.deepcopy(self._data)
-        new_data['payload_fields'].discard(field)
-        return ChannelMeta(self.name, **new_data)
+        if field not in self.payload_fields:
+            return self
+        return self.set_property('payload_fields', [f for f in self.payload_fields if f != field])
 
 
     def data(self):
         result = {}
-        for key, value in self._data.iteritems():
+        for key, value in self._data.items():
             if key == 'payload_fields':
-                result[key] = []
-                for f in value:
-                    result[key].append(f)
+                result[key] = list(value)
             else:
                 result[key] = value
-
+        result.update(self._extras)
         return result
+
+
+
+def unique_fields(fields):
+    '''The fields as a tuple, in order, without repeats.'''
+    seen = set()
+    result = []
+    for field in fields:
+        if field not in seen:
+            seen.add(field)
+            result.append(field)
+    return tuple(result)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import selectors
+import pgpubsub
+from eavesdroppr import config
+
+
+DEFAULT_DATABASE_TARGET = 'default'
+
+
+class NoSuchDatabaseTarget(Exception):
+    def __init__(self, target_name):
+        Exception.__init__(self,
+                           'No database target registered under the name "%s". Please check your initfile.' \
+                           % target_name)
+
+
+def database_targets(yaml_config):
+    '''Returns a dict of connection parameters keyed by database target name.
+    The globals database_host/database_name pair is always available as the
+    "default" target; further targets are declared in a "databases" section:
+
+        databases:
+            shard01:
+                host: 10.0.0.11
+                name: orders
+                user: $SHARD_USER         # optional, defaults to PGSQL_USER
+                password: $SHARD_PASSWORD # optional, defaults to PGSQL_PASSWORD
+    '''
+    credentials = config.environment_variables('PGSQL_USER', 'PGSQL_PASSWORD')
+    pgsql_user = credentials['PGSQL_USER']
+    pgsql_password = credentials['PGSQL_PASSWORD']
+
+    targets = {}
+    targets[DEFAULT_DATABASE_TARGET] = {'host': yaml_config['globals']['database_host'],
+                                        'user': pgsql_user,
+                                        'password': pgsql_password,
+                                        'database': yaml_config['globals']['database_name']}
+
+    for name, target_config in (yaml_config.get('databases') or {}).items():
+        user = target_config.get('user')
+        password = target_config.get('password')
+        targets[name] = {'host': target_config['host'],
+                         'user': config.load_config_var(user) if user else pgsql_user,
+                         'password': config.load_config_var(password) if password else pgsql_password,
+                         'database': target_config['name']}
+    return targets
+
+
+def channel_targets(channel_config):
+    '''A channel names one database target or a list of them under
+    "database"; channels which name none use the default target.
+    '''
+    target = channel_config.get('database') or DEFAULT_DATABASE_TARGET
+    if isinstance(target, (list, tuple)):
+        return list(target)
+    return [target]
+
+
+
+class ListenerMultiplexer(object):
+    '''Holds one LISTEN connection per database target and waits on all of
+    their sockets at once with a selector.
+    '''
+
+    def __init__(self, targets):
+        self._targets = targets
+        self._pubsubs = {}
+        self._listening = set()
+        self._selector = selectors.DefaultSelector()
+
+
+    @property
+    def target_names(self):
+        return list(self._pubsubs.keys())
+
+
+    @property
+    def listening(self):
+        '''The (target_name, channel_id) pairs currently LISTENed to.'''
+        return set(self._listening)
+
+
+    def add_targets(self, targets):
+        '''Registers database targets not already known. The connection
+        parameters of a known target are not changed while it is connected.
+        '''
+        for name, params in targets.items():
+            if name not in self._targets:
+                self._targets[name] = params
+
+
+    def fileno(self):
+        '''The selector's own descriptor, readable whenever any registered
+        LISTEN connection is, so that the multiplexer can itself be waited
+        on by another event loop.
+        '''
+        return self._selector.fileno()
+
+
+    def connection_params(self, target_name):
+        if target_name not in self._targets:
+            raise NoSuchDatabaseTarget(target_name)
+        return self._targets[target_name]
+
+
+    def connect(self, target_name):
+        pubsub = self._pubsubs.get(target_name)
+        if pubsub is None:
+            pubsub = pgpubsub.connect(**self.connection_params(target_name))
+            self._pubsubs[target_name] = pubsub
+            self._selector.register(pubsub.conn, selectors.EVENT_READ, target_name)
+        return pubsub
+
+
+    def listen(self, target_name, channel_id):
+        self.connect(target_name).listen(channel_id)
+        self._listening.add((target_name, channel_id))
+
+
+    def unlisten(self, target_name, channel_id):
+        pubsub = self._pubsubs.get(target_name)
+        if pubsub is not None:
+            pubsub.unlisten(channel_id)
+        self._listening.discard((target_name, channel_id))
+
+
+    def update_listens(self, pairs):
+        '''LISTENs to the (target_name, channel_id) pairs not yet listened
+        to and UNLISTENs from those no longer wanted, leaving the rest (and
+        every connection) alone. Returns (added, removed).
+        '''
+        pairs = set(pairs)
+        added = pairs - self._listening
+        removed = self._listening - pairs
+        for target_name, channel_id in sorted(removed):
+            self.unlisten(target_name, channel_id)
+        for target_name, channel_id in sorted(added):
+            self.listen(target_name, channel_id)
+        return (added, removed)
+
+
+    def next_notifications(self, select_timeout):
+        '''Waits up to select_timeout seconds for any LISTEN socket to become
+        readable and returns (target_name, notification) pairs for everything
+        received, or an empty list on timeout.
+        '''
+        results = []
+        for key, mask in self._selector.select(select_timeout):
+            target_name = key.data
+            conn = self._pubsubs[target_name].conn
+            conn.poll()
+            for notify in conn.notifies:
+                results.append((target_name, notify))
+            del conn.notifies[:]
+        return results
+
+
+    def close(self):
+        for target_name, pubsub in self._pubsubs.items():
+            self._selector.unregister(pubsub.conn)
+            pubsub.conn.close()
+        self._pubsubs = {}
+        self._listening = set()
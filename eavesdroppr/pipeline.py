@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+STAGE_TYPES = ['inline', 'thread', 'process']
+
+DEFAULT_STAGE_WORKERS = 1
+DEFAULT_STAGE_QUEUE_SIZE = 1000
+DEFAULT_REPORT_INTERVAL = 60
+DRAIN_POLL_INTERVAL = 0.05
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class UnsupportedStageType(Exception):
+    def __init__(self, stage_type):
+        Exception.__init__(self,
+                           'The pipeline stage type "%s" is not supported. Supported types are: %s' \
+                           % (stage_type, ', '.join(STAGE_TYPES)))
+
+
+class InvalidPipeline(Exception):
+    def __init__(self, channel_id, reason):
+        Exception.__init__(self, 'Invalid pipeline on channel "%s": %s' % (channel_id, reason))
+
+
+
+class StageStats(object):
+    '''Counters for one stage, reset at every report.'''
+
+    def __init__(self):
+        self.started = time.time()
+        self.processed = 0
+        self.errors = 0
+        self.wait_time = 0.0
+        self.busy_time = 0.0
+
+
+    def record(self, wait, busy, failed=False):
+        self.processed += 1
+        self.wait_time += wait
+        self.busy_time += busy
+        if failed:
+            self.errors += 1
+
+
+
+class Stage(object):
+    '''One step of a Pipeline. An inline stage runs in the thread which hands
+    it an item; a thread stage runs its function on its own worker threads;
+    a process stage hands each item to a process pool, through as many
+    feeder threads as it has workers. Thread and process stages take their
+    input from a bounded queue, so a slow stage holds back the stages which
+    feed it instead of accumulating unbounded work.
+
+    Stage functions are called as function(item, svc_object_registry) and
+    return the item for the next stage, or None to stop processing it.
+    Process stages receive None for the registry, which cannot leave this
+    process, and their functions and items must be picklable.
+    '''
+
+    def __init__(self, name, function, stage_type='inline', **kwargs):
+        if stage_type not in STAGE_TYPES:
+            raise UnsupportedStageType(stage_type)
+        self.name = name
+        self.function = function
+        self.stage_type = stage_type
+        self.workers = int(kwargs.get('workers') or DEFAULT_STAGE_WORKERS)
+        self.next_stage = None
+        self.output = None
+        self.stats = StageStats()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._executor = None
+        self._queue = None
+        if stage_type == 'inline':
+            return
+
+        self._queue = queue.Queue(int(kwargs.get('queue_size') or DEFAULT_STAGE_QUEUE_SIZE))
+        if stage_type == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._work, name='%s-%d' % (name, i))
+            worker.daemon = True
+            worker.start()
+
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+
+    @property
+    def busy(self):
+        return self._busy
+
+
+    def put(self, item, svc_object_registry):
+        if self._queue is None:
+            self._run(time.time(), item, svc_object_registry)
+        else:
+            self._queue.put((time.time(), item, svc_object_registry))
+
+
+    def _work(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                self._queue.task_done()
+                return
+            submitted, item, svc_object_registry = entry
+            try:
+                self._run(submitted, item, svc_object_registry)
+            finally:
+                self._queue.task_done()
+
+
+    def _run(self, submitted, item, svc_object_registry):
+        with self._lock:
+            self._busy += 1
+        started = time.time()
+        result = None
+        failed = False
+        try:
+            if self._executor:
+                result = self._executor.submit(self.function, item, None).result()
+            else:
+                result = self.function(item, svc_object_registry)
+        except Exception:
+            failed = True
+            logger.exception('pipeline stage "%s" failed' % self.name)
+        with self._lock:
+            self._busy -= 1
+            self.stats.record(started - submitted, time.time() - started, failed)
+
+        if result is None:
+            return
+        try:
+            if self.next_stage:
+                self.next_stage.put(result, svc_object_registry)
+            elif self.output:
+                self.output(result, svc_object_registry)
+        except Exception:
+            # a worker must survive this, or its queue fills and submit() blocks forever
+            logger.exception('pipeline stage "%s" failed handing on its output' % self.name)
+
+
+    def join(self):
+        '''Waits until every item queued so far has been processed.'''
+        if self._queue is not None:
+            self._queue.join()
+
+
+    def shutdown(self):
+        if self._queue is not None:
+            for i in range(self.workers):
+                self._queue.put(None)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+
+    def report(self):
+        '''Returns this stage's figures since the last report and resets them.'''
+        with self._lock:
+            stats = self.stats
+            self.stats = StageStats()
+            busy = self._busy
+        elapsed = max(time.time() - stats.started, 1e-9)
+        return {'stage': self.name,
+                'type': self.stage_type,
+                'workers': self.workers,
+                'processed': stats.processed,
+                'errors': stats.errors,
+                'rate': stats.processed / elapsed,
+                'mean_wait': stats.wait_time / stats.processed if stats.processed else 0.0,
+                'mean_service': stats.busy_time / stats.processed if stats.processed else 0.0,
+                'utilization': stats.busy_time / (elapsed * self.workers),
+                'queue_depth': self.queue_depth,
+                'busy': busy}
+
+
+
+class Pipeline(object):
+    '''An ordered chain of Stages run for each event on a channel; the
+    result of the last stage, if any, goes to output. Usable wherever a
+    worker pool is: submit(event, svc_object_registry) feeds the first
+    stage, and drain() waits for everything in flight. Every
+    report_interval seconds the stages' throughput, queueing and
+    utilization are logged, and the busiest stage is named as the
+    bottleneck.
+    '''
+
+    def __init__(self, name, stages, output=None, report_interval=DEFAULT_REPORT_INTERVAL):
+        self.name = name
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        stages[-1].output = output
+        self._running = True
+
+        if report_interval:
+            reporter = threading.Thread(target=self._report_loop,
+                                        args=(float(report_interval),),
+                                        name='%s-reporter' % name)
+            reporter.daemon = True
+            reporter.start()
+
+
+    @property
+    def queue_depth(self):
+        return sum([s.queue_depth for s in self.stages])
+
+
+    def submit(self, event, svc_object_registry):
+        self.stages[0].put(event, svc_object_registry)
+
+
+    def drain(self):
+        '''Waits until no stage holds any item, then stops the stages.'''
+        while True:
+            for stage in self.stages:
+                stage.join()
+            if not self.queue_depth and not any([s.busy for s in self.stages]):
+                break
+            time.sleep(DRAIN_POLL_INTERVAL)
+        self._running = False
+        for stage in self.stages:
+            stage.shutdown()
+
+
+    def report(self):
+        reports = [s.report() for s in self.stages]
+        bottleneck = max(reports, key=lambda r: r['utilization'])
+        for r in reports:
+            logger.info('pipeline "%s" stage "%s" (%s x%d): %.1f/s, wait %.4fs, service %.4fs, '
+                        'utilization %.0f%%, queued %d, errors %d%s' \
+                        % (self.name, r['stage'], r['type'], r['workers'], r['rate'],
+                           r['mean_wait'], r['mean_service'], r['utilization'] * 100,
+                           r['queue_depth'], r['errors'],
+                           ' <- bottleneck' if r is bottleneck and r['processed'] else ''))
+        return reports
+
+
+    def _report_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            if not self._running:
+                return
+            self.report()
+
+
+
+def create_pipeline(channel_id, channel_config, loader, output=None):
+    '''Returns a Pipeline if the channel declares a "pipeline" section in
+    the initfile, otherwise None. Stage functions are looked up by name in
+    the handler module through loader. If the channel also names a
+    handler_function, it receives the output of the last stage.
+
+        pipeline:
+            report_interval: 60
+            stages:
+                - function: enrich_instructor   # I/O bound: many threads
+                  type: thread
+                  workers: 16
+                  queue_size: 1000
+                - function: score_instructor    # CPU bound: processes
+                  type: process
+                  workers: 4
+                - function: publish_instructor
+                  type: thread
+                  workers: 2
+    '''
+    pipeline_config = channel_config.get('pipeline')
+    if not pipeline_config:
+        return None
+    stage_configs = pipeline_config.get('stages') or []
+    if not stage_configs:
+        raise InvalidPipeline(channel_id, 'no stages are declared.')
+
+    stages = []
+    try:
+        for i, stage_config in enumerate(stage_configs):
+            if not stage_config.get('function'):
+                raise InvalidPipeline(channel_id, 'stage %d names no function.' % (i + 1))
+            stages.append(Stage('%s.%s' % (channel_id, stage_config['function']),
+                                loader(stage_config['function']),
+                                (stage_config.get('type') or 'inline').lower(),
+                                workers=stage_config.get('workers'),
+                                queue_size=stage_config.get('queue_size')))
+    except Exception:
+        # the stages built so far already have running workers and process pools
+        for stage in stages:
+            stage.shutdown()
+        raise
+
+    report_interval = pipeline_config.get('report_interval', DEFAULT_REPORT_INTERVAL)
+    return Pipeline(channel_id, stages, output, report_interval)
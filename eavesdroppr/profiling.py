@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+'''Sampled profiling of the dispatch path.
+
+While a DispatchProfiler is enabled, one event in every sample_every on
+each channel is run under cProfile, split into three steps -- decode (the
+JSON payload), dispatch (filters and sinks) and handler -- with a separate
+profile per (channel, step, handler function). A sampler thread meanwhile
+records the stack of the listener thread sample_hz times a second, labelled
+with the channel and step it was in ("loop" when it was waiting on the
+sockets). Every write_interval seconds, and on shutdown, the profiler
+writes to output_dir:
+
+    <channel>.<step>.<handler>.pstats   cProfile data, for pstats/snakeviz
+    stacks.folded                        folded stacks, for flamegraph.pl
+
+While the profiler is disabled the dispatcher pays one attribute check per
+event, and no sampler thread runs.
+'''
+
+import os
+import sys
+import time
+import cProfile
+import logging
+import threading
+
+
+DEFAULT_PROFILE_DIR = 'eavesdrop-profile'
+DEFAULT_SAMPLE_EVERY = 100
+DEFAULT_SAMPLE_HZ = 100
+DEFAULT_WRITE_INTERVAL = 60
+
+IDLE_LABEL = 'loop'
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+def function_name(function):
+    '''A readable name for a handler: module.qualname for functions,
+    the qualified method name for bound methods such as pool.submit.
+    '''
+    if function is None:
+        return 'none'
+    name = getattr(function, '__qualname__', None) or getattr(function, '__name__', None)
+    if name is None:
+        return type(function).__name__
+    module = getattr(function, '__module__', None)
+    if module and module not in ('__main__', 'builtins'):
+        return '%s.%s' % (module, name)
+    return name
+
+
+def fold_stack(frame, label):
+    '''Renders a frame and its callers as one folded-stack line prefix,
+    outermost frame first.
+    '''
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        name = '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+        names.append(name.replace(';', ','))
+        frame = frame.f_back
+    names.append(label)
+    names.reverse()
+    return ';'.join(names)
+
+
+
+class StepTimer(object):
+    '''Count and total wall time of the sampled runs of one profile key.'''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+
+class StackSampler(object):
+    '''Samples the stack of one thread at a fixed rate from a daemon
+    thread, counting identical folded stacks.
+    '''
+
+    def __init__(self, thread_id, label_function, sample_hz=DEFAULT_SAMPLE_HZ):
+        self._thread_id = thread_id
+        self._label = label_function
+        self._interval = 1.0 / float(sample_hz)
+        self._lock = threading.Lock()
+        self._stopped = None
+        self.counts = {}
+
+
+    def start(self):
+        if self._stopped is not None:
+            return
+        self._stopped = threading.Event()
+        sampler_thread = threading.Thread(target=self._run,
+                                          args=(self._stopped,),
+                                          name='eavesdrop-stack-sampler')
+        sampler_thread.daemon = True
+        sampler_thread.start()
+
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+            self._stopped = None
+
+
+    def _run(self, stopped):
+        while not stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                stack = fold_stack(frame, self._label())
+                with self._lock:
+                    self.counts[stack] = self.counts.get(stack, 0) + 1
+            frame = None
+
+
+    def folded_lines(self):
+        with self._lock:
+            return ['%s %d' % (stack, count) for stack, count in sorted(self.counts.items())]
+
+
+
+class DispatchProfiler(object):
+    '''Profiles sampled events through an EventDispatcher (see the module
+    docstring). Must be created on the thread which runs the event loop.
+    '''
+
+    def __init__(self, **kwargs):
+        self.output_dir = kwargs.get('output_dir') or DEFAULT_PROFILE_DIR
+        self.sample_every = int(kwargs.get('sample_every') or DEFAULT_SAMPLE_EVERY)
+        self.write_interval = float(kwargs.get('write_interval') or DEFAULT_WRITE_INTERVAL)
+        self.enabled = False
+        self._profiles = {}
+        self._timers = {}
+        self._event_counts = {}
+        self._label = IDLE_LABEL
+        self._next_write = None
+        self._sampler = StackSampler(threading.get_ident(),
+                                     lambda: self._label,
+                                     kwargs.get('sample_hz') or DEFAULT_SAMPLE_HZ)
+
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self._next_write = time.time() + self.write_interval
+        self._sampler.start()
+        logger.info('profiling enabled: 1 in %d events per channel, writing to %s every %ds' \
+                    % (self.sample_every, self.output_dir, self.write_interval))
+
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._sampler.stop()
+        self.write()
+        logger.info('profiling disabled')
+
+
+    def toggle(self, signum=None, frame=None):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+
+    def sample(self, event):
+        '''True if this event should be profiled.'''
+        count = self._event_counts.get(event.channel, 0)
+        self._event_counts[event.channel] = count + 1
+        return count % self.sample_every == 0
+
+
+    def run(self, channel_id, step, handler_function, function, *args):
+        '''Calls function(*args) under the profile for its channel, step
+        and handler, and returns its result.
+        '''
+        key = (channel_id, step, function_name(handler_function))
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = self._profiles[key] = cProfile.Profile()
+            self._timers[key] = StepTimer()
+
+        self._label = '%s;%s' % (channel_id, step)
+        started = time.perf_counter()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            self._timers[key].record(time.perf_counter() - started)
+            self._label = IDLE_LABEL
+
+
+    def tick(self, now):
+        if self.enabled and now >= self._next_write:
+            self.write()
+            self._next_write = now + self.write_interval
+
+
+    def summary(self):
+        '''(channel, step, handler, sampled events, mean seconds), slowest first.'''
+        rows = [key + (t.count, t.mean) for key, t in self._timers.items()]
+        return sorted(rows, key=lambda r: r[4], reverse=True)
+
+
+    def write(self):
+        if not self._profiles and not self._sampler.counts:
+            return
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        for (channel_id, step, handler_name), profile in list(self._profiles.items()):
+            filename = '%s.%s.%s.pstats' % (channel_id, step, handler_name)
+            profile.dump_stats(os.path.join(self.output_dir, filename))
+
+        with open(os.path.join(self.output_dir, 'stacks.folded'), 'w') as f:
+            for line in self._sampler.folded_lines():
+                f.write(line + '\n')
+
+        for channel_id, step, handler_name, count, mean in self.summary():
+            logger.info('profile: channel "%s" %s %s: %d sampled, mean %.3f ms' \
+                        % (channel_id, step, handler_name, count, mean * 1000))
+
+
+
+def create_profiler(yaml_config):
+    '''A DispatchProfiler configured from the optional "profiling" section
+    of the initfile globals:
+
+        profiling:
+            output_dir: /tmp/eavesdrop-profile
+            sample_every: 100      # profile 1 in N events per channel
+            sample_hz: 100         # stack samples per second
+            write_interval: 60     # seconds between writes
+    '''
+    profile_config = yaml_config['globals'].get('profiling') or {}
+    return DispatchProfiler(**profile_config)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+import sys
+import threading
+from collections import OrderedDict
+
+
+EVENT_META_FIELDS = ['table', 'primary_key', 'type', 'txid', 'snapshot']
+
+EVICTION_POLICIES = ['lru', 'fifo']
+
+
+class UnsupportedEvictionPolicy(Exception):
+    def __init__(self, policy):
+        Exception.__init__(self,
+                           'The eviction policy "%s" is not supported. Supported policies are: %s' \
+                           % (policy, ', '.join(EVICTION_POLICIES)))
+
+
+class NoSuchReplicaIndex(Exception):
+    def __init__(self, field_name):
+        Exception.__init__(self, 'No secondary index has been declared on field "%s".' % field_name)
+
+
+def split_param(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [v.strip() for v in str(value).split(',') if v.strip()]
+
+
+def estimate_row_size(row):
+    size = sys.getsizeof(row)
+    for key, value in row.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class TableReplica(object):
+    '''In-memory, primary-key-indexed copy of the payload fields of a watched
+    table, kept current by the INSERT and UPDATE events of one or more
+    channels. Declare it as a service object and list it under the
+    channel's "sinks" in the initfile:
+
+        service_objects:
+            instructor_cache:
+                class: TableReplica
+                init_params:
+                    - name: table
+                      value: instructors
+                    - name: max_rows
+                      value: 100000
+                    - name: eviction
+                      value: lru
+                    - name: indexes
+                      value: email,last_name
+
+    Either max_rows or max_bytes (an estimate based on sys.getsizeof) caps
+    the replica; when the cap is exceeded, rows are evicted least recently
+    used first ("lru") or least recently written first ("fifo").
+    '''
+
+    def __init__(self, log=None, **kwargs):
+        self._log = log
+        self._table = kwargs.get('table')
+        self._max_rows = int(kwargs.get('max_rows') or 0)
+        self._max_bytes = int(kwargs.get('max_bytes') or 0)
+        self._eviction = (kwargs.get('eviction') or 'lru').lower()
+        if self._eviction not in EVICTION_POLICIES:
+            raise UnsupportedEvictionPolicy(self._eviction)
+
+        self._rows = OrderedDict()
+        self._row_sizes = {}
+        self._total_bytes = 0
+        self._indexes = {}
+        for field_name in split_param(kwargs.get('indexes')):
+            self._indexes[field_name] = {}
+
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+
+    def __len__(self):
+        return len(self._rows)
+
+
+    def __bool__(self):
+        # an empty replica is still a registered service object; snap's
+        # registry lookup rejects falsy ones
+        return True
+
+
+    @property
+    def size_bytes(self):
+        return self._total_bytes
+
+
+    def receive(self, event):
+        data = event.data()
+        if self._table and data.get('table') != self._table:
+            return
+        if data.get('type') not in ('INSERT', 'UPDATE'):
+            return
+
+        row = {}
+        for key, value in data.items():
+            if key not in EVENT_META_FIELDS:
+                row[key] = value
+        self.put(data.get('primary_key'), row)
+
+
+    def put(self, primary_key, row):
+        with self._lock:
+            if primary_key in self._rows:
+                self._remove(primary_key)
+
+            self._rows[primary_key] = row
+            row_size = estimate_row_size(row)
+            self._row_sizes[primary_key] = row_size
+            self._total_bytes += row_size
+            for field_name, index in self._indexes.items():
+                index.setdefault(row.get(field_name), set()).add(primary_key)
+
+            self._enforce_cap()
+
+
+    def get(self, primary_key, default=None):
+        with self._lock:
+            row = self._rows.get(primary_key)
+            if row is None:
+                return default
+            if self._eviction == 'lru':
+                self._rows.move_to_end(primary_key)
+            return row
+
+
+    def find(self, field_name, value):
+        if field_name not in self._indexes:
+            raise NoSuchReplicaIndex(field_name)
+
+        with self._lock:
+            keys = self._indexes[field_name].get(value) or set()
+            return [self._rows[k] for k in keys]
+
+
+    def evict(self, primary_key):
+        with self._lock:
+            if primary_key in self._rows:
+                self._remove(primary_key)
+
+
+    def _remove(self, primary_key):
+        row = self._rows.pop(primary_key)
+        self._total_bytes -= self._row_sizes.pop(primary_key)
+        for field_name, index in self._indexes.items():
+            value = row.get(field_name)
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(primary_key)
+                if not keys:
+                    del index[value]
+
+
+    def _over_cap(self):
+        if self._max_rows and len(self._rows) > self._max_rows:
+            return True
+        if self._max_bytes and self._total_bytes > self._max_bytes:
+            return True
+        return False
+
+
+    def _enforce_cap(self):
+        while self._rows and self._over_cap():
+            oldest_key = next(iter(self._rows))
+            self._remove(oldest_key)
+            self.evictions += 1
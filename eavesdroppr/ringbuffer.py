@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+'''Single-writer, multi-reader ring buffer of events in shared memory.
+
+One receiver process (eavesdrop --fanout <ring_name>) holds the LISTEN
+connection and writes every event into the ring; any number of local
+consumer processes attach a RingReader by name and follow it with their
+own cursor. Neither side takes a lock.
+
+Layout (little-endian). The ring header occupies the first 64 bytes:
+
+    magic       4s   b'EVRB'
+    version     I
+    slots       I    number of records in the ring
+    record_size I    bytes per record, header included
+    write_seq   Q    number of records ever written
+
+followed by slots records of record_size bytes, each starting with a
+96-byte record header:
+
+    seq         Q    write sequence number + 1; 0 while being written
+    txid        q    txid of the event, -1 if none
+    primary_key q    primary key if it is an integer which fits, else 0
+    op          B    1 INSERT, 2 UPDATE, 3 DELETE, 0 other
+    flags       B    bit 0: primary_key is valid, bit 1: snapshot event
+    channel     64s  channel name, NUL padded (Postgres names are at most 63 bytes)
+    payload_len H
+
+and the raw JSON payload after it. The default record size of 8192 bytes
+holds any NOTIFY payload, which Postgres limits to 8000 bytes; with a
+smaller record_size, events too large for a record are dropped and counted.
+
+Overrun policy: the writer never waits for readers, because the listener
+cannot push back on Postgres. A reader that falls more than slots records
+behind has lost the records in between; it skips forward to the oldest
+record still in the ring, and counts what it skipped in "lost". A record
+that is overwritten while a reader holds it fails RingRecord.valid().
+
+Sizing: the segment takes slots * record_size bytes of /dev/shm, which is
+usually capped at half of RAM, and far less in a container (Docker gives
+64 MiB unless --shm-size says otherwise). The defaults, 4096 slots of
+8192 bytes, take 32 MiB. The ring should hold what the slowest reader can
+fall behind by: peak events per second times the longest pause expected of
+a reader. Lower record_size rather than slots when payloads are known to be
+small, since oversized events are dropped but a short ring loses events
+for every reader that lags.
+'''
+
+import json
+import struct
+import logging
+from multiprocessing import shared_memory
+
+
+RING_MAGIC = b'EVRB'
+RING_VERSION = 2
+RING_HEADER = struct.Struct('<4sIIIQ')
+RING_HEADER_SIZE = 64
+WRITE_SEQ_OFFSET = 16
+RECORD_HEADER = struct.Struct('<QqqBB64sH')
+RECORD_HEADER_SIZE = 96
+CHANNEL_NAME_SIZE = 64
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+DEFAULT_RING_SLOTS = 4096
+DEFAULT_RECORD_SIZE = 8192
+
+OPERATION_CODES = {'INSERT': 1, 'UPDATE': 2, 'DELETE': 3}
+OPERATION_NAMES = {1: 'INSERT', 2: 'UPDATE', 3: 'DELETE'}
+
+FLAG_PK_VALID = 1
+FLAG_SNAPSHOT = 2
+
+SEQ = struct.Struct('<Q')
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class InvalidRingBuffer(Exception):
+    def __init__(self, name):
+        Exception.__init__(self, 'Shared memory segment "%s" is not an eavesdrop ring buffer.' % name)
+
+
+def fits_int64(value):
+    return isinstance(value, int) and not isinstance(value, bool) and INT64_MIN <= value <= INT64_MAX
+
+
+
+class RingBufferWriter(object):
+    '''Creates the shared memory ring and appends events to it. Usable as
+    a channel sink: receive(event) writes one record, or drops and counts
+    an event which does not fit one. A segment of the same name left behind
+    by a writer which did not close is replaced.
+    '''
+
+    def __init__(self, name, slots=DEFAULT_RING_SLOTS, record_size=DEFAULT_RECORD_SIZE):
+        self.name = name
+        self.slots = int(slots)
+        self.record_size = int(record_size)
+        self._max_payload = self.record_size - RECORD_HEADER_SIZE
+        self.dropped = 0
+        size = RING_HEADER_SIZE + self.slots * self.record_size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            logger.warning('replacing the existing shared memory segment "%s"' % name)
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._buf = self._shm.buf
+        RING_HEADER.pack_into(self._buf, 0, RING_MAGIC, RING_VERSION, self.slots, self.record_size, 0)
+        self._write_seq = 0
+
+
+    def receive(self, event):
+        payload = event.payload.encode('utf-8')
+        if len(payload) > self._max_payload:
+            self.dropped += 1
+            logger.warning('dropped an event of %d bytes on channel "%s": ring "%s" records hold at most %d '
+                           '(%d dropped so far)' % (len(payload), event.channel, self.name,
+                                                    self._max_payload, self.dropped))
+            return
+
+        data = event.data()
+        txid = data.get('txid')
+        if not fits_int64(txid):
+            txid = None
+        pk = data.get('primary_key')
+        flags = 0
+        if fits_int64(pk):
+            flags |= FLAG_PK_VALID
+        else:
+            pk = 0
+        if data.get('snapshot'):
+            flags |= FLAG_SNAPSHOT
+
+        seq = self._write_seq
+        offset = RING_HEADER_SIZE + (seq % self.slots) * self.record_size
+        # mark the slot as being written, fill it, then publish the sequence
+        SEQ.pack_into(self._buf, offset, 0)
+        RECORD_HEADER.pack_into(self._buf, offset, 0,
+                                -1 if txid is None else txid,
+                                pk,
+                                OPERATION_CODES.get(data.get('type'), 0),
+                                flags,
+                                event.channel.encode('utf-8')[:CHANNEL_NAME_SIZE],
+                                len(payload))
+        start = offset + RECORD_HEADER_SIZE
+        self._buf[start:start + len(payload)] = payload
+        SEQ.pack_into(self._buf, offset, seq + 1)
+
+        self._write_seq = seq + 1
+        SEQ.pack_into(self._buf, WRITE_SEQ_OFFSET, self._write_seq)
+
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+
+class RingRecord(object):
+    '''A view of one record. payload is a memoryview into shared memory; it
+    stays valid only until the writer laps the ring, so check valid() after
+    using it (or copy it with bytes()).
+    '''
+
+    def __init__(self, buf, offset, seq, header):
+        self._buf = buf
+        self._offset = offset
+        self.seq = seq
+        _, txid, pk, op, flags, channel, payload_len = header
+        self.txid = None if txid < 0 else txid
+        self.primary_key = pk if flags & FLAG_PK_VALID else None
+        self.operation = OPERATION_NAMES.get(op)
+        self.snapshot = bool(flags & FLAG_SNAPSHOT)
+        self.channel = channel.rstrip(b'\0').decode('utf-8')
+        start = offset + RECORD_HEADER_SIZE
+        self.payload = buf[start:start + payload_len]
+
+
+    def valid(self):
+        return SEQ.unpack_from(self._buf, self._offset)[0] == self.seq + 1
+
+
+    def data(self):
+        return json.loads(bytes(self.payload).decode('utf-8'))
+
+
+
+class RingReader(object):
+    '''Attaches to an existing ring by name and reads it through a private
+    cursor. A new reader starts at the current end of the ring, or at the
+    oldest retained record if from_start is True.
+    '''
+
+    def __init__(self, name, from_start=False):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 always registers the segment with the resource
+            # tracker, which would unlink it when this reader exits
+            from multiprocessing import resource_tracker
+            self._shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+        self._buf = self._shm.buf
+        magic, version, slots, record_size, write_seq = RING_HEADER.unpack_from(self._buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            raise InvalidRingBuffer(name)
+
+        self.slots = slots
+        self.record_size = record_size
+        self.lost = 0
+        if from_start:
+            self.cursor = max(0, write_seq - slots)
+        else:
+            self.cursor = write_seq
+
+
+    def write_seq(self):
+        return SEQ.unpack_from(self._buf, WRITE_SEQ_OFFSET)[0]
+
+
+    def lag(self):
+        return self.write_seq() - self.cursor
+
+
+    def poll(self, max_records=1000):
+        '''Returns up to max_records new RingRecords, oldest first.'''
+        records = []
+        write_seq = self.write_seq()
+        while self.cursor < write_seq and len(records) < max_records:
+            oldest = write_seq - self.slots
+            if self.cursor < oldest:
+                self.lost += oldest - self.cursor
+                self.cursor = oldest
+
+            offset = RING_HEADER_SIZE + (self.cursor % self.slots) * self.record_size
+            header = RECORD_HEADER.unpack_from(self._buf, offset)
+            if header[0] != self.cursor + 1:
+                # lapped (or being rewritten) since we read write_seq
+                self.lost += 1
+                self.cursor += 1
+                continue
+
+            records.append(RingRecord(self._buf, offset, self.cursor, header))
+            self.cursor += 1
+        return records
+
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+
+class InvalidRoute(Exception):
+    def __init__(self, channel_id, route):
+        Exception.__init__(self,
+                           'Route %s on channel "%s" must name a handler.' % (route, channel_id))
+
+
+def compile_field_test(field_name, expected):
+    if isinstance(expected, (list, tuple, set)):
+        allowed = set(expected)
+        return lambda data: data.get(field_name) in allowed
+    return lambda data: data.get(field_name) == expected
+
+
+def value_set(value):
+    '''None for no condition, otherwise the set of accepted values.'''
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return set(value)
+    return set([value])
+
+
+def compile_predicate(field_conditions):
+    '''Returns a closure which tests a decoded payload against every
+    field condition, or None if there are no field conditions.
+    '''
+    tests = [compile_field_test(name, value) for name, value in field_conditions.items()]
+    if not tests:
+        return None
+    if len(tests) == 1:
+        return tests[0]
+
+    def predicate(data):
+        for t in tests:
+            if not t(data):
+                return False
+        return True
+
+    return predicate
+
+
+
+class Route(object):
+    '''A handler and the events it receives: table and operation may each be
+    one value or a list of them, and predicate tests the payload fields.
+    '''
+
+    def __init__(self, handler_function, table=None, operation=None, predicate=None):
+        self.handler_function = handler_function
+        self.tables = value_set(table)
+        self.operations = value_set(operation)
+        self.predicate = predicate
+
+
+    def matches_key(self, table, operation):
+        if self.tables is not None and table not in self.tables:
+            return False
+        if self.operations is not None and operation not in self.operations:
+            return False
+        return True
+
+
+
+class RouteTable(object):
+    '''Fans a channel's events out to every route whose predicate matches.
+    Routes are indexed on (table, operation); the candidate list for a key
+    is computed the first time the key is seen and cached, so dispatch is a
+    dict lookup followed by the field predicates of the candidates only.
+    Events matching no route go to the default handler, if there is one.
+    '''
+
+    def __init__(self, routes, default_handler=None):
+        self._routes = routes
+        self._default_handler = default_handler
+        self._index = {}
+
+
+    def candidates(self, table, operation):
+        key = (table, operation)
+        routes = self._index.get(key)
+        if routes is None:
+            routes = [r for r in self._routes if r.matches_key(table, operation)]
+            self._index[key] = routes
+        return routes
+
+
+    def dispatch(self, event, svc_object_registry):
+        data = event.data()
+        matched = False
+        for route in self.candidates(data.get('table'), data.get('type')):
+            if route.predicate is None or route.predicate(data):
+                route.handler_function(event, svc_object_registry)
+                matched = True
+
+        if not matched and self._default_handler:
+            self._default_handler(event, svc_object_registry)
+
+
+
+def create_route_table(channel_id, channel_config, handler_loader, default_handler=None):
+    '''Compiles the channel's "routes" section, if any, into a RouteTable.
+    handler_loader resolves a handler function name. Each route names a
+    handler and, optionally, conditions on table, type and payload fields;
+    a list of values means any of them:
+
+        routes:
+            - handler: on_new_instructor
+              type: INSERT
+            - handler: on_instructor_moved
+              type: UPDATE
+              fields:
+                  region: [east, west]
+    '''
+    route_configs = channel_config.get('routes')
+    if not route_configs:
+        return None
+
+    routes = []
+    for rc in route_configs:
+        if not rc.get('handler'):
+            raise InvalidRoute(channel_id, rc)
+        routes.append(Route(handler_loader(rc['handler']),
+                            table=rc.get('table'),
+                            operation=rc.get('type'),
+                            predicate=compile_predicate(rc.get('fields') or {})))
+
+    return RouteTable(routes, default_handler)
@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+
+'''The listener runtime: everything "eavesdrop -c <channel>" needs to receive
+and dispatch events, and nothing the authoring CLI needs (docopt, jinja2,
+cmd, the config metaobjects). Optional features are imported only when a
+channel's configuration asks for them, so a listener process starts with
+the smallest import set the initfile allows.
+'''
+
+import sys
+import time
+import signal
+import logging
+import importlib
+import importlib.util
+from collections import deque
+from eavesdroppr import config
+from eavesdroppr.events import ChannelEvent
+from eavesdroppr.dedup import DedupFilter, create_dedup_filter
+from eavesdroppr.txgroup import TransactionGrouper
+from eavesdroppr.multiplex import ListenerMultiplexer, database_targets, channel_targets
+from eavesdroppr.dispatch import EventDispatcher, ChannelDispatch
+
+
+DEFAULT_SELECT_TIMEOUT = 5
+DEFAULT_POLL_BATCH = 100
+
+PROFILE_TOGGLE_SIGNAL = signal.SIGUSR2
+RELOAD_SIGNAL = signal.SIGHUP
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class NoSuchEventChannel(Exception):
+    def __init__(self, channel_id):
+        Exception.__init__(self,
+                           'No event channel registered under the name "%s". Please check your initfile.' \
+                           % channel_id)
+
+
+class NoSuchEventHandler(Exception):
+    def __init__(self, handler_func_name, handler_module):
+        Exception.__init__(self,
+                           'No event handler function "%s" exists in event handler module "%s".' \
+                           % (handler_func_name, handler_module))
+
+
+
+def load_handler_module(yaml_config, reload=False):
+    '''Imports the handler module named in the initfile globals. With reload,
+    executes the module's current source as a new module object, leaving
+    the loaded one -- and the globals its functions see -- untouched until
+    the caller installs the new one in sys.modules.
+    '''
+    project_dir = config.load_config_var(yaml_config['globals']['project_directory'])
+    if project_dir not in sys.path:
+        sys.path.append(project_dir)
+
+    handler_module_name = yaml_config['globals']['handler_module']
+    current = sys.modules.get(handler_module_name)
+    if not reload or current is None or not getattr(current, '__file__', None):
+        return importlib.import_module(handler_module_name)
+
+    spec = importlib.util.spec_from_file_location(handler_module_name, current.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_service_registry(yaml_config):
+    # initializing services pulls in the service object classes; skip it
+    # entirely for initfiles which declare none
+    if yaml_config.get('service_objects'):
+        from snap import snap
+        return config.ServiceObjectRegistry(snap.initialize_services(yaml_config))
+    return config.ServiceObjectRegistry({})
+
+
+def default_event_handler(event, svc_object_registry):
+    print(config.jsonpretty(event.data()))
+
+
+def load_event_handler(handlers, handler_function_name, handler_module_name):
+    if not handler_function_name or handler_function_name == 'default_handler':
+        return default_event_handler
+
+    if not hasattr(handlers, handler_function_name):
+        raise NoSuchEventHandler(handler_function_name, handler_module_name)
+
+    return getattr(handlers, handler_function_name)
+
+
+def bootstrap(dispatcher, multiplexer, channel_ids, yaml_config, **kwargs):
+    '''Feeds the current rows of each channel's table, on every database
+    target the channel listens to, through the dispatcher as synthetic INSERT
+    events, then installs a filter which drops the live events already
+    covered by the snapshot. Must be called after LISTEN.
+    '''
+    from eavesdroppr.bootstrap import read_snapshot, SnapshotFilter, DEFAULT_BOOTSTRAP_CHUNK_SIZE
+
+    chunk_size = int(kwargs.get('chunk_size') or DEFAULT_BOOTSTRAP_CHUNK_SIZE)
+    for channel_id in channel_ids:
+        channel_config = yaml_config['channels'][channel_id]
+        for target_name in channel_targets(channel_config):
+            snapshot, chunks = read_snapshot(channel_id,
+                                             channel_config,
+                                             multiplexer.connection_params(target_name),
+                                             chunk_size,
+                                             source=target_name)
+            num_rows = 0
+            for chunk in chunks:
+                for event in chunk:
+                    dispatcher.dispatch(event)
+                dispatcher.flush()
+                num_rows += len(chunk)
+
+            dispatcher.get_channel(channel_id).filters.append(SnapshotFilter(snapshot, target_name))
+            logger.info('bootstrapped %d rows on channel "%s" from database "%s" (snapshot xmin %d, xmax %d)' \
+                        % (num_rows, channel_id, target_name, snapshot.xmin, snapshot.xmax))
+
+
+def install_profile_toggle(dispatcher, yaml_config, enabled=False):
+    '''Makes PROFILE_TOGGLE_SIGNAL (SIGUSR2) switch sampled profiling of the
+    dispatcher on and off. The profiler is only created, and its module
+    only imported, the first time it is switched on. The signal handler
+    only flags the request; process_events acts on it.
+    '''
+    def toggle():
+        if dispatcher.profiler is None:
+            from eavesdroppr.profiling import create_profiler
+            dispatcher.profiler = create_profiler(yaml_config)
+        dispatcher.profiler.toggle()
+
+    def request_toggle(signum, frame):
+        dispatcher.profile_toggle_requested = True
+
+    dispatcher.profile_toggle = toggle
+    signal.signal(PROFILE_TOGGLE_SIGNAL, request_toggle)
+    if enabled:
+        toggle()
+
+
+def process_events(multiplexer, dispatcher, scheduler=None, timeout=None):
+    '''One pass of the event loop: waits for notifications on any LISTEN
+    connection, dispatches them (or one scheduling quantum of them) and
+    flushes expired buffers. Returns the number of events dispatched.
+
+    By default the wait lasts until the next buffer is due to be flushed;
+    a caller which passes its own timeout (0 to poll) gets expired buffers
+    flushed, but never pending ones flushed early.
+    '''
+    if timeout is None:
+        select_timeout = dispatcher.select_timeout(DEFAULT_SELECT_TIMEOUT)
+        if scheduler:
+            select_timeout = scheduler.select_timeout(select_timeout)
+    else:
+        select_timeout = timeout
+
+    if dispatcher.profile_toggle_requested:
+        dispatcher.profile_toggle_requested = False
+        dispatcher.profile_toggle()
+
+    notifications = multiplexer.next_notifications(select_timeout)
+    events = [ChannelEvent.from_notify(notify, target_name) for target_name, notify in notifications]
+    if dispatcher.has_shedders:
+        events = dispatcher.shed(events, scheduler)
+    for event in events:
+        if scheduler:
+            scheduler.enqueue(event)
+        else:
+            dispatcher.dispatch(event)
+
+    num_dispatched = len(events)
+    if scheduler:
+        # serve one quantum, then go back to the sockets so that newly
+        # arrived events on other channels get their fair share
+        num_dispatched = scheduler.run(dispatcher.dispatch)
+
+    now = time.time()
+    if not num_dispatched and timeout is None:
+        dispatcher.flush()
+    else:
+        dispatcher.tick(now)
+    if dispatcher.profiler:
+        dispatcher.profiler.tick(now)
+    return num_dispatched
+
+
+def run_event_loop(multiplexer, dispatcher, scheduler=None):
+    while True:
+        process_events(multiplexer, dispatcher, scheduler)
+
+
+
+class Listener(object):
+    '''The LISTEN connections, service objects and dispatch table for a set
+    of event channels. reload() re-reads the initfile and re-imports the
+    handler module, then swaps in a new dispatch table -- after draining
+    what the old one holds -- while the connections and the service object
+    registry stay up. Only channels added or removed since the last load
+    are LISTENed or UNLISTENed.
+    '''
+
+    def __init__(self, channel_ids, yaml_config, **kwargs):
+        if isinstance(channel_ids, str):
+            channel_ids = channel_ids.split(',')
+        self.channel_ids = list(channel_ids)
+        self.yaml_config = yaml_config
+        self.initfile = kwargs.get('<initfile>')
+        self.multiplexer = ListenerMultiplexer(database_targets(yaml_config))
+        self.handlers = self.load_handlers(yaml_config)
+        self.service_objects = create_service_registry(yaml_config)
+        self.dispatcher = EventDispatcher(self.service_objects)
+        self.scheduler = None
+        self.watcher = None
+        self._reload_requested = False
+
+        # in fanout mode this process only receives: events go to a shared memory
+        # ring buffer, and local consumer processes run the handlers
+        self.fanout_writer = None
+        if kwargs.get('--fanout'):
+            from eavesdroppr.ringbuffer import RingBufferWriter, DEFAULT_RING_SLOTS, DEFAULT_RECORD_SIZE
+            fanout_config = yaml_config['globals'].get('fanout') or {}
+            self.fanout_writer = RingBufferWriter(kwargs['<ring_name>'],
+                                                  slots=fanout_config.get('slots') or DEFAULT_RING_SLOTS,
+                                                  record_size=fanout_config.get('record_size') or DEFAULT_RECORD_SIZE)
+
+        for channel_id in self.channel_ids:
+            if not yaml_config['channels'].get(channel_id):
+                raise NoSuchEventChannel(channel_id)
+
+        channels, tx_grouper = self.build_channels(yaml_config, self.handlers)
+        self.dispatcher.replace_channels(channels, tx_grouper)
+        self.scheduler = self.build_scheduler(yaml_config, tx_grouper)
+        self.multiplexer.update_listens(self.listen_pairs(yaml_config))
+
+
+    def listen_pairs(self, yaml_config):
+        pairs = set()
+        for channel_id in self.channel_ids:
+            channel_config = yaml_config['channels'].get(channel_id)
+            if channel_config:
+                for target_name in channel_targets(channel_config):
+                    pairs.add((target_name, channel_id))
+        return pairs
+
+
+    def build_channels(self, yaml_config, handlers):
+        '''Returns a ChannelDispatch for each listened channel defined in
+        yaml_config, and the TransactionGrouper if one is configured.
+        '''
+        handler_module_name = yaml_config['globals'].get('handler_module')
+        tx_grouper = self.transaction_grouper(yaml_config, handlers)
+        channels = []
+        try:
+            for channel_id in self.channel_ids:
+                channel_config = yaml_config['channels'].get(channel_id)
+                if not channel_config:
+                    continue
+                channels.append(self.build_channel(channel_id,
+                                                   channel_config,
+                                                   handlers,
+                                                   handler_module_name,
+                                                   tx_grouper))
+        except Exception:
+            # stop the worker threads and processes of the channels built so far
+            for channel in channels:
+                stop_pools(channel.pools)
+            raise
+
+        # without a queue in front of the handler the backlog is only the
+        # batch just received, which rarely reaches a lag threshold
+        if not any([yaml_config['channels'][c.channel_id].get('scheduling') for c in channels]):
+            for channel in channels:
+                if channel.shedder and channel.shedder.lag_threshold and not channel.pools:
+                    logger.warning('channel "%s": shedding at a backlog of %s events needs a worker pool, '
+                                   'pipeline or scheduler to queue events; its backlog is one batch at most' \
+                                   % (channel.channel_id, channel.shedder.lag_threshold))
+        return (channels, tx_grouper)
+
+
+    def load_handlers(self, yaml_config, reload=False):
+        return load_handler_module(yaml_config, reload)
+
+
+    def transaction_grouper(self, yaml_config, handlers):
+        # a transaction handler receives every row of a committed transaction
+        # in a single call, across all of the channels we are listening on
+        tx_handler_name = yaml_config['globals'].get('transaction_handler')
+        if not tx_handler_name:
+            return None
+        if not hasattr(handlers, tx_handler_name):
+            raise NoSuchEventHandler(tx_handler_name, yaml_config['globals']['handler_module'])
+        return TransactionGrouper(getattr(handlers, tx_handler_name))
+
+
+    def channel_handler(self, channel_id, channel_config, handlers, handler_module_name, tx_grouper):
+        '''The function which receives the channel's events (with a pipeline,
+        the output of its last stage), before any worker pool or batching is
+        wrapped around it.
+        '''
+        handler_function_name = channel_config.get('handler_function')
+        if channel_config.get('routes'):
+            # with routes, a named handler_function only sees unrouted events
+            default_handler = None
+            if handler_function_name:
+                default_handler = load_event_handler(handlers,
+                                                     handler_function_name,
+                                                     handler_module_name)
+            from eavesdroppr.routing import create_route_table
+            loader = lambda name: load_event_handler(handlers, name, handler_module_name)
+            route_table = create_route_table(channel_id, channel_config, loader, default_handler)
+            return route_table.dispatch
+        if (tx_grouper or channel_config.get('pipeline')) and not handler_function_name:
+            # transaction-only channel, or a pipeline whose last stage has no
+            # further handler
+            return None
+        return load_event_handler(handlers, handler_function_name, handler_module_name)
+
+
+    def build_channel(self, channel_id, channel_config, handlers, handler_module_name, tx_grouper):
+        # filters describe the event stream rather than its handling, so a
+        # channel whose dedup settings are unchanged keeps its filters (and
+        # their state) across a reload
+        current = self.dispatcher.get_channel(channel_id)
+        previous_config = self.yaml_config['channels'].get(channel_id) or {}
+        if current and previous_config.get('dedup') == channel_config.get('dedup'):
+            filters = list(current.filters)
+        else:
+            dedup_filter = create_dedup_filter(channel_config)
+            filters = [dedup_filter] if dedup_filter else []
+            if current:
+                # a bootstrap SnapshotFilter still has to screen out rows the snapshot covered
+                filters.extend([f for f in current.filters if not isinstance(f, DedupFilter)])
+
+        # likewise a shedder keeps its drop counts unless its policy changed
+        shedder = None
+        if current and previous_config.get('shedding') == channel_config.get('shedding'):
+            shedder = current.shedder
+        elif channel_config.get('shedding'):
+            from eavesdroppr.shedding import create_load_shedder
+            shedder = create_load_shedder(channel_id, channel_config)
+
+        if self.fanout_writer:
+            return ChannelDispatch(channel_id,
+                                   None,
+                                   filters=filters,
+                                   sinks=[self.fanout_writer],
+                                   shedder=shedder)
+
+        handler_function = self.channel_handler(channel_id,
+                                                channel_config,
+                                                handlers,
+                                                handler_module_name,
+                                                tx_grouper)
+        pools, handler_function = self.build_pools(channel_id,
+                                                   channel_config,
+                                                   handlers,
+                                                   handler_module_name,
+                                                   handler_function)
+
+        try:
+            # windowed aggregation and columnar batches both replace single events
+            # with a summary of many, so a channel gets one or the other
+            buffers = []
+            if handler_function and channel_config.get('aggregate'):
+                from eavesdroppr.aggregation import create_window_aggregator
+                buffers.append(create_window_aggregator(channel_id, channel_config, handler_function))
+            elif handler_function and channel_config.get('columnar'):
+                from eavesdroppr.columnar import create_columnar_batcher
+                buffers.append(create_columnar_batcher(channel_id, channel_config, handler_function))
+            if buffers:
+                handler_function = buffers[-1].add
+
+            # sinks are service objects (such as a TableReplica) which receive every
+            # accepted event on a channel ahead of its handler
+            sink_names = channel_config.get('sinks') or []
+            sinks = [self.service_objects.lookup(name) for name in sink_names]
+        except Exception:
+            stop_pools(pools)
+            raise
+
+        return ChannelDispatch(channel_id,
+                               handler_function,
+                               filters=filters,
+                               sinks=sinks,
+                               buffers=buffers,
+                               pools=pools,
+                               shedder=shedder)
+
+
+    def build_pools(self, channel_id, channel_config, handlers, handler_module_name, handler_function):
+        '''Returns the channel's pipeline or worker pool (as a list) and the
+        function which feeds it, or no pools and handler_function.
+        '''
+        if channel_config.get('pipeline'):
+            from eavesdroppr.pipeline import create_pipeline
+            loader = lambda name: load_event_handler(handlers, name, handler_module_name)
+            pipeline = create_pipeline(channel_id, channel_config, loader, handler_function)
+            return ([pipeline], pipeline.submit)
+        if handler_function and channel_config.get('concurrency'):
+            from eavesdroppr.concurrency import create_worker_pool
+            pool = create_worker_pool(channel_id, channel_config, handler_function)
+            return ([pool], pool.submit)
+        return ([], handler_function)
+
+
+    def build_scheduler(self, yaml_config, tx_grouper):
+        # per-channel queues with weighted fair scheduling, only when asked for:
+        # interleaving channels breaks the arrival order transaction grouping needs
+        channel_ids = [c for c in self.channel_ids if yaml_config['channels'].get(c)]
+        if not any([yaml_config['channels'][c].get('scheduling') for c in channel_ids]):
+            return None
+
+        if tx_grouper:
+            logger.warning('transaction grouping across scheduled channels may split transactions.')
+        from eavesdroppr.scheduling import FairScheduler, create_channel_queue
+        scheduler = FairScheduler()
+        for channel_id in channel_ids:
+            scheduler.add_channel(create_channel_queue(channel_id, yaml_config['channels'][channel_id]))
+        return scheduler
+
+
+    def watch_files(self, interval=None):
+        '''Reloads whenever the initfile or the handler module changes on disk.'''
+        from eavesdroppr.watch import FileWatcher, DEFAULT_WATCH_INTERVAL
+        self.watcher = FileWatcher(self.watched_files(), interval or DEFAULT_WATCH_INTERVAL)
+
+
+    def watched_files(self):
+        return [self.initfile, getattr(self.handlers, '__file__', None)]
+
+
+    def request_reload(self, signum=None, frame=None):
+        '''Signal-safe: the reload itself runs on the next pass of the loop.'''
+        self._reload_requested = True
+
+
+    def reload(self, yaml_config=None):
+        '''Rebuilds from yaml_config if given, otherwise from the initfile
+        (or, without one, the current configuration). Returns True if the new
+        configuration was swapped in; on any error in the configuration or
+        the handler module the current one stays in place.
+        '''
+        try:
+            if yaml_config is None and self.initfile:
+                yaml_config = config.read_config_file(self.initfile)
+            elif yaml_config is None:
+                yaml_config = self.yaml_config
+            self.multiplexer.add_targets(database_targets(yaml_config))
+            pairs = self.listen_pairs(yaml_config)
+            for target_name, channel_id in pairs:
+                self.multiplexer.connection_params(target_name)
+            handlers = self.load_handlers(yaml_config, reload=True)
+            channels, tx_grouper = self.build_channels(yaml_config, handlers)
+        except Exception:
+            logger.exception('reload failed; the current handlers and channels stay in place')
+            return False
+
+        # everything already received is handled by the handlers it arrived under
+        if self.scheduler:
+            self.scheduler.drain(self.dispatcher.dispatch)
+        self.dispatcher.replace_channels(channels, tx_grouper)
+        if handlers is not None:
+            sys.modules[handlers.__name__] = handlers
+        self.scheduler = self.build_scheduler(yaml_config, tx_grouper)
+        added, removed = self.multiplexer.update_listens(pairs)
+
+        for channel_id in self.channel_ids:
+            if not yaml_config['channels'].get(channel_id):
+                logger.warning('channel "%s" is no longer in the initfile; not listening to it' % channel_id)
+        self.yaml_config = yaml_config
+        self.handlers = handlers
+        if self.watcher:
+            self.watcher.watch(self.watched_files())
+        logger.info('reloaded %d channel(s); LISTEN %s, UNLISTEN %s' \
+                    % (len(channels),
+                       ', '.join(['%s/%s' % p for p in sorted(added)]) or 'none',
+                       ', '.join(['%s/%s' % p for p in sorted(removed)]) or 'none'))
+        return True
+
+
+    def run(self):
+        while True:
+            if self.watcher and self.watcher.changed(time.time()):
+                self._reload_requested = True
+            if self._reload_requested:
+                self._reload_requested = False
+                self.reload()
+            process_events(self.multiplexer, self.dispatcher, self.scheduler)
+
+
+    def close(self):
+        self.multiplexer.close()
+        if self.dispatcher.profiler:
+            self.dispatcher.profiler.disable()
+        if self.fanout_writer:
+            self.fanout_writer.close()
+        for channel_id in self.dispatcher.channel_ids:
+            channel = self.dispatcher.get_channel(channel_id)
+            for f in channel.filters:
+                if isinstance(f, DedupFilter):
+                    logger.info('dedup stats for channel "%s": %s' % (channel_id, f.stats()))
+            if channel.shedder:
+                logger.info('load shedding stats for channel "%s": %s' % (channel_id, channel.shedder.stats()))
+
+
+
+def stop_pools(pools):
+    '''Stops the workers of pools (or pipelines) which were never used.'''
+    for pool in pools:
+        try:
+            pool.drain()
+        except Exception:
+            logger.exception('failed to stop a worker pool')
+
+
+
+def listen(channel_ids, yaml_config, **kwargs):
+    listener = Listener(channel_ids, yaml_config, **kwargs)
+    install_profile_toggle(listener.dispatcher, yaml_config, enabled=kwargs.get('--profile'))
+    signal.signal(RELOAD_SIGNAL, listener.request_reload)
+    if kwargs.get('--watch'):
+        listener.watch_files()
+
+    if kwargs.get('--bootstrap'):
+        bootstrap(listener.dispatcher, listener.multiplexer, listener.channel_ids, yaml_config)
+
+    print('listening on channel(s) %s in database(s) %s...' \
+          % (', '.join(['"%s"' % c for c in listener.channel_ids]),
+             ', '.join(['"%s"' % t for t in listener.multiplexer.target_names])))
+    try:
+        listener.run()
+    finally:
+        listener.close()
+
+
+
+class EmbeddedListener(Listener):
+    '''A listener for use inside a host application's own event loop. It
+    runs no handler module: every event which passes a channel's filters
+    and load shedding (and has reached its sinks, such as an in-process
+    TableReplica) is queued for the host to collect with poll().
+
+    Register fileno() for readability with the host's loop (selectors,
+    asyncio's add_reader, gevent...) and call poll() when it is readable.
+    poll() never blocks. A batch of max_events may leave more events
+    queued, so keep polling while has_pending is True.
+
+    Channels with aggregate or columnar sections deliver their window or
+    batch dicts instead of events. Everything which would call into a
+    handler module -- handler_function, routes, pipeline, concurrency and
+    the transaction handler -- is ignored, since the host handles the
+    events itself.
+    '''
+
+    def __init__(self, yaml_config, channel_ids=None, **kwargs):
+        self._ready = deque()
+        if channel_ids is None:
+            channel_ids = list(yaml_config['channels'].keys())
+        Listener.__init__(self, channel_ids, yaml_config, **kwargs)
+
+
+    def load_handlers(self, yaml_config, reload=False):
+        return None
+
+
+    def transaction_grouper(self, yaml_config, handlers):
+        return None
+
+
+    def channel_handler(self, channel_id, channel_config, handlers, handler_module_name, tx_grouper):
+        return self._collect
+
+
+    def build_pools(self, channel_id, channel_config, handlers, handler_module_name, handler_function):
+        for section in ('routes', 'pipeline', 'concurrency'):
+            if channel_config.get(section):
+                logger.info('channel "%s": ignoring its %s section in an embedded listener' % (channel_id, section))
+        return ([], handler_function)
+
+
+    def _collect(self, item, svc_object_registry):
+        self._ready.append(item)
+
+
+    def fileno(self):
+        '''A descriptor which is readable whenever any of the listener's
+        database connections has notifications waiting. It stays the same
+        across reloads, even if these add database targets.
+        '''
+        return self.multiplexer.fileno()
+
+
+    @property
+    def has_pending(self):
+        return len(self._ready) > 0
+
+
+    def poll(self, max_events=DEFAULT_POLL_BATCH):
+        '''Returns up to max_events received events (oldest first), or an
+        empty list if there are none, without waiting.
+        '''
+        if self._reload_requested:
+            self._reload_requested = False
+            self.reload()
+        if len(self._ready) < max_events:
+            process_events(self.multiplexer, self.dispatcher, self.scheduler, timeout=0)
+
+        batch = []
+        while self._ready and len(batch) < max_events:
+            batch.append(self._ready.popleft())
+        return batch
+
+
+    def flush(self):
+        '''Delivers whatever aggregation windows and batches are pending, so
+        that the next poll() returns them.
+        '''
+        self.dispatcher.flush()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
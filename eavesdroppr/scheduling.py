@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+import time
+import logging
+from collections import deque
+
+
+DEFAULT_CHANNEL_WEIGHT = 1.0
+DEFAULT_DISPATCH_QUANTUM = 100
+DEFAULT_MAX_QUEUE_DEPTH = 100000
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self._tokens = self.capacity
+        self._last_refill = time.time()
+
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+
+    def available(self, now):
+        self._refill(now)
+        return self._tokens >= 1.0
+
+
+    def take(self, now):
+        self._refill(now)
+        self._tokens -= 1.0
+
+
+    def wait_time(self, now):
+        '''Seconds until a token will be available.'''
+        self._refill(now)
+        if self._tokens >= 1.0:
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+
+
+class ChannelQueue(object):
+    '''One channel's queue in a FairScheduler. It holds at most max_depth
+    events; when a rate-limited or starved channel overflows it, the oldest
+    events are dropped and counted in dropped.
+    '''
+
+    def __init__(self, channel_id, weight=DEFAULT_CHANNEL_WEIGHT, bucket=None, max_depth=DEFAULT_MAX_QUEUE_DEPTH):
+        self.channel_id = channel_id
+        self.weight = float(weight)
+        self.bucket = bucket
+        self.max_depth = int(max_depth)
+        self.events = deque()
+        self.last_tag = 0.0
+        self.served = 0
+        self.dropped = 0
+        self.overflowing = False
+
+
+    def __len__(self):
+        return len(self.events)
+
+
+    def head_tag(self):
+        return self.events[0][0]
+
+
+    def eligible(self, now):
+        return len(self.events) > 0 and (self.bucket is None or self.bucket.available(now))
+
+
+
+class FairScheduler(object):
+    '''Weighted fair queueing across per-channel queues. Each queued event
+    is stamped with a virtual finish time which advances by 1/weight per
+    event on its channel, and the scheduler always serves the eligible
+    queue whose head event has the smallest stamp. A burst on one channel
+    therefore only lengthens that channel's own queue. A channel with a
+    token bucket is ineligible while its bucket is empty.
+    '''
+
+    def __init__(self):
+        self._queues = {}
+        self._virtual_time = 0.0
+
+
+    def add_channel(self, channel_queue):
+        self._queues[channel_queue.channel_id] = channel_queue
+
+
+    def queue_depth(self, channel_id=None):
+        if channel_id is not None:
+            return len(self._queues[channel_id])
+        return sum([len(q) for q in self._queues.values()])
+
+
+    def enqueue(self, event):
+        q = self._queues.get(event.channel)
+        if q is None:
+            # a channel dropped by a reload, with notifications still in flight
+            return False
+        if len(q.events) >= q.max_depth:
+            q.events.popleft()
+            q.dropped += 1
+            if not q.overflowing:
+                q.overflowing = True
+                logger.warning('channel "%s": scheduling queue full at %d events, dropping the oldest' \
+                               % (q.channel_id, q.max_depth))
+
+        tag = max(self._virtual_time, q.last_tag) + 1.0 / q.weight
+        q.last_tag = tag
+        q.events.append((tag, event))
+        return True
+
+
+    def next_event(self, now):
+        selected = None
+        for q in self._queues.values():
+            if q.eligible(now) and (selected is None or q.head_tag() < selected.head_tag()):
+                selected = q
+        if selected is None:
+            return None
+
+        tag, event = selected.events.popleft()
+        self._virtual_time = tag
+        if selected.overflowing and len(selected.events) <= selected.max_depth // 2:
+            selected.overflowing = False
+            logger.warning('channel "%s": scheduling queue recovered; %d events dropped so far' \
+                           % (selected.channel_id, selected.dropped))
+        if selected.bucket:
+            selected.bucket.take(now)
+        selected.served += 1
+        return event
+
+
+    def run(self, dispatch_function, max_events=DEFAULT_DISPATCH_QUANTUM):
+        '''Dispatches up to max_events queued events and returns the number
+        dispatched, so the caller can go back to its sockets between quanta.
+        '''
+        count = 0
+        now = time.time()
+        while count < max_events:
+            event = self.next_event(now)
+            if event is None:
+                break
+            dispatch_function(event)
+            count += 1
+            now = time.time()
+        return count
+
+
+    def drain(self, dispatch_function):
+        '''Dispatches every queued event in stamp order, ignoring rate
+        limits, and returns the number dispatched.
+        '''
+        events = []
+        for q in self._queues.values():
+            events.extend(q.events)
+            q.events.clear()
+        events.sort(key=lambda tagged: tagged[0])
+        for tag, event in events:
+            dispatch_function(event)
+        return len(events)
+
+
+    def select_timeout(self, default_timeout):
+        '''0 if an event can be dispatched right now; otherwise the time until
+        the next rate-limited queue earns a token, capped at default_timeout.
+        '''
+        now = time.time()
+        timeout = default_timeout
+        for q in self._queues.values():
+            if not len(q):
+                continue
+            if q.bucket is None:
+                return 0
+            timeout = min(timeout, q.bucket.wait_time(now))
+        return timeout
+
+
+
+def create_channel_queue(channel_id, channel_config):
+    '''Builds the scheduling queue for a channel from its optional
+    "scheduling" section:
+
+        scheduling:
+            weight: 4      # relative share of dispatch time
+            rate: 500      # token bucket: events per second
+            burst: 1000    # token bucket capacity, defaults to rate
+            max_depth: 100000  # oldest events are dropped beyond this
+
+    A channel whose shedding lag_threshold is below max_depth sheds by its
+    own policy before the queue ever overflows.
+    '''
+    sched_config = channel_config.get('scheduling') or {}
+    bucket = None
+    if sched_config.get('rate'):
+        bucket = TokenBucket(sched_config['rate'], sched_config.get('burst'))
+
+    return ChannelQueue(channel_id,
+                        weight=sched_config.get('weight') or DEFAULT_CHANNEL_WEIGHT,
+                        bucket=bucket,
+                        max_depth=sched_config.get('max_depth') or DEFAULT_MAX_QUEUE_DEPTH)
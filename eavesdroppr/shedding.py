@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import re
+import json
+import time
+import logging
+
+
+DEFAULT_REPORT_INTERVAL = 10
+
+# the generated json_build_object payload starts with the table and the
+# primary key, and ends with the operation and the txid, so both can be
+# read without decoding the payload fields in between
+PRIMARY_KEY_PATTERN = re.compile(r'^\{\s*"table"\s*:\s*"([^"]*)"\s*,\s*"primary_key"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}]+)')
+OPERATION_PATTERN = re.compile(r'"type"\s*:\s*"(\w+)"\s*,\s*"txid"\s*:\s*[-\d]+\s*\}\s*$')
+PAYLOAD_TAIL = 64
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+def peek_operation(event):
+    '''The event's operation, read from the end of the raw payload if it has
+    the generated layout, otherwise from the decoded payload.
+    '''
+    match = OPERATION_PATTERN.search(event.payload[-PAYLOAD_TAIL:])
+    if match:
+        return match.group(1)
+    return event.data().get('type')
+
+
+def peek_row_key(event):
+    '''A key identifying the event's row. Read from the start of the raw
+    payload when possible, in which case the primary key is the raw JSON text.
+    '''
+    match = PRIMARY_KEY_PATTERN.match(event.payload)
+    if match:
+        return (event.source, match.group(1), match.group(2))
+    data = event.data()
+    return (event.source, data.get('table'), json.dumps(data.get('primary_key')))
+
+
+
+class LoadShedder(object):
+    '''Drops events on one channel according to its shedding policy, looking
+    at a batch of received events at a time:
+
+    - sample: keep one event in every N
+    - latest_per_key: of several events for the same row, keep the last
+    - drop_types: drop these operations, in order of priority -- the first
+      listed type once the backlog reaches lag_threshold, the first two at
+      twice the threshold, and so on
+
+    With a lag_threshold, policies only apply while the channel's backlog
+    (events received but not yet handled) is at or above it; without one
+    they always apply. Every drop is counted, by reason.
+
+    The backlog is the batch just read from the connections plus what waits
+    in the channel's worker pool or pipeline and in the scheduler. A channel
+    with neither handles each batch as it arrives, so its backlog never
+    exceeds one batch and a lag_threshold needs a concurrency, pipeline or
+    scheduling section to mean anything.
+    '''
+
+    def __init__(self, channel_id, **kwargs):
+        self.channel_id = channel_id
+        self.sample = int(kwargs.get('sample') or 1)
+        self.lag_threshold = kwargs.get('lag_threshold')
+        self.latest_per_key = bool(kwargs.get('latest_per_key'))
+        self.drop_types = list(kwargs.get('drop_types') or [])
+        self.report_interval = float(kwargs.get('report_interval') or DEFAULT_REPORT_INTERVAL)
+        self.received = 0
+        self.dropped = {'sampled': 0, 'superseded': 0, 'type': 0}
+        self.shedding = False
+        self._sample_count = 0
+        self._next_report = None
+
+
+    def overloaded(self, backlog):
+        return self.lag_threshold is None or backlog >= self.lag_threshold
+
+
+    def shed(self, events, backlog):
+        '''Returns the events to keep, in their original order.'''
+        self.received += len(events)
+        overloaded = self.overloaded(backlog)
+        self._note_state(overloaded, backlog)
+        if not overloaded:
+            return events
+
+        if self.sample > 1:
+            kept = []
+            for event in events:
+                if self._sample_count % self.sample == 0:
+                    kept.append(event)
+                self._sample_count += 1
+            self.dropped['sampled'] += len(events) - len(kept)
+            events = kept
+
+        if self.drop_types:
+            if self.lag_threshold:
+                num_types = min(len(self.drop_types), int(backlog // self.lag_threshold))
+            else:
+                num_types = len(self.drop_types)
+            dropped_types = set(self.drop_types[:num_types])
+            kept = [e for e in events if peek_operation(e) not in dropped_types]
+            self.dropped['type'] += len(events) - len(kept)
+            events = kept
+
+        if self.latest_per_key and len(events) > 1:
+            keys = [peek_row_key(e) for e in events]
+            last_index = dict([(key, i) for i, key in enumerate(keys)])
+            kept = [e for i, e in enumerate(events) if last_index[keys[i]] == i]
+            self.dropped['superseded'] += len(events) - len(kept)
+            events = kept
+
+        self._report()
+        return events
+
+
+    def _note_state(self, overloaded, backlog):
+        if self.lag_threshold is None or overloaded == self.shedding:
+            return
+        self.shedding = overloaded
+        if overloaded:
+            logger.warning('channel "%s": backlog of %d events, shedding load' % (self.channel_id, backlog))
+            self._next_report = time.time() + self.report_interval
+        else:
+            logger.warning('channel "%s": backlog cleared, stopped shedding; %s' \
+                           % (self.channel_id, self.stats()))
+
+
+    def _report(self):
+        now = time.time()
+        if self._next_report is None:
+            self._next_report = now + self.report_interval
+        elif now >= self._next_report and self.total_dropped:
+            logger.warning('channel "%s": shedding load; %s' % (self.channel_id, self.stats()))
+            self._next_report = now + self.report_interval
+
+
+    @property
+    def total_dropped(self):
+        return sum(self.dropped.values())
+
+
+    def stats(self):
+        stats = {'received': self.received, 'dropped': self.total_dropped}
+        for reason, count in self.dropped.items():
+            stats['dropped_%s' % reason] = count
+        return stats
+
+
+
+def create_load_shedder(channel_id, channel_config):
+    '''Returns a LoadShedder if the channel declares a "shedding" section in
+    the initfile, otherwise None:
+
+        shedding:
+            lag_threshold: 1000      # optional; shed only above this backlog,
+                                     # which needs a pool or scheduler
+            sample: 10               # keep 1 in 10 events
+            latest_per_key: True     # keep only the newest event per row
+            drop_types: [UPDATE, INSERT]
+            report_interval: 10      # seconds between drop count reports
+    '''
+    shed_config = channel_config.get('shedding')
+    if not shed_config:
+        return None
+    return LoadShedder(channel_id, **shed_config)
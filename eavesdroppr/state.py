@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+'''Checkpointed key/value state for handlers.
+
+A StateStore keeps its data in memory and snapshots it to a local file:
+every snapshot_interval seconds (and at exit) the entries changed since
+the previous snapshot are appended to the file as one segment, and when
+the file has grown to compact_ratio times the size of a full snapshot it
+is rewritten as a single full segment. Each segment is:
+
+    magic    4s   b'EVSG'
+    length   I    length of the body
+    crc32    I    of the body
+    body          pickle of {'puts': {...}, 'deletes': [...], 'positions': {...}}
+
+On startup the segments are replayed in order; a segment which is
+truncated or fails its checksum -- the tail of a write interrupted by a
+crash -- ends the replay, so the store comes back as of the last complete
+snapshot, and is cut off so that later snapshots follow the last good one.
+'''
+
+import os
+import time
+import zlib
+import atexit
+import pickle
+import struct
+import logging
+import threading
+
+
+SEGMENT_HEADER = struct.Struct('<4sII')
+SEGMENT_MAGIC = b'EVSG'
+
+DEFAULT_SNAPSHOT_INTERVAL = 10.0
+DEFAULT_COMPACT_RATIO = 4
+
+DEFAULT_SOURCE = 'default'
+
+
+logger = logging.getLogger('eavesdroppr')
+
+
+def read_segments(path):
+    '''Yields (body, end_offset) for every complete segment in the file,
+    decoding the body; end_offset is where the segment ends.
+    '''
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(SEGMENT_HEADER.size)
+            if len(header) < SEGMENT_HEADER.size:
+                return
+            magic, length, crc = SEGMENT_HEADER.unpack(header)
+            if magic != SEGMENT_MAGIC:
+                return
+            body = f.read(length)
+            if len(body) < length or zlib.crc32(body) & 0xffffffff != crc:
+                return
+            yield (pickle.loads(body), f.tell())
+
+
+def encode_segment(segment):
+    body = pickle.dumps(segment, pickle.HIGHEST_PROTOCOL)
+    return SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(body), zlib.crc32(body) & 0xffffffff) + body
+
+
+
+class StateStore(object):
+    '''Keyed state which survives restarts. Declare it as a service object
+    and look it up from the registry passed to handlers:
+
+        service_objects:
+            state:
+                class: StateStore
+                init_params:
+                    - name: path
+                      value: /var/lib/eavesdrop/orders.state
+                    - name: snapshot_interval
+                      value: 10
+
+        def handle_order(event, svc_object_registry):
+            state = svc_object_registry.lookup('state')
+            state.incr(('orders', event.data()['customer_id']))
+            state.mark(event)
+
+    Values are snapshotted when put(), so replace a value rather than
+    mutating it in place. mark(event) records the event's txid as the last
+    one processed from its database; after a restart, position() reports
+    where the restored state was taken.
+    '''
+
+    def __init__(self, log=None, **kwargs):
+        self._log = log or logger
+        self.path = kwargs['path']
+        self.snapshot_interval = float(kwargs.get('snapshot_interval') or DEFAULT_SNAPSHOT_INTERVAL)
+        self.compact_ratio = float(kwargs.get('compact_ratio') or DEFAULT_COMPACT_RATIO)
+
+        self._data = {}
+        self._positions = {}
+        self._dirty = set()
+        self._deleted = set()
+        self._positions_dirty = False
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._full_size = 0
+        self._running = True
+
+        self.restore()
+
+        snapshot_thread = threading.Thread(target=self._snapshot_loop, name='eavesdrop-state-snapshots')
+        snapshot_thread.daemon = True
+        snapshot_thread.start()
+        atexit.register(self.close)
+
+
+    def __len__(self):
+        return len(self._data)
+
+
+    def __bool__(self):
+        # an empty store is still a registered service object; snap's
+        # registry lookup rejects falsy ones
+        return True
+
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._dirty.add(key)
+            self._deleted.discard(key)
+
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self._dirty.discard(key)
+                self._deleted.add(key)
+
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = self._data.get(key, 0) + amount
+            self.put(key, value)
+            return value
+
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+
+    def mark(self, event):
+        '''Records the event's txid as the last processed from its source.'''
+        txid = event.txid
+        if txid is None:
+            return
+        with self._lock:
+            self._positions[event.source or DEFAULT_SOURCE] = txid
+            self._positions_dirty = True
+
+
+    def position(self, source=None):
+        '''The last txid marked for a database target, as of the latest snapshot
+        or later; None if none has been marked.
+        '''
+        return self._positions.get(source or DEFAULT_SOURCE)
+
+
+    def restore(self):
+        if not os.path.exists(self.path):
+            return
+        num_segments = 0
+        valid_size = 0
+        for segment, valid_size in read_segments(self.path):
+            num_segments += 1
+            self._data.update(segment['puts'])
+            for key in segment['deletes']:
+                self._data.pop(key, None)
+            self._positions.update(segment['positions'])
+
+        # cut off a torn tail, or later segments appended after it could
+        # never be replayed
+        file_size = os.path.getsize(self.path)
+        if file_size > valid_size:
+            self._log.warning('discarding %d bytes of incomplete snapshot at the end of %s' \
+                              % (file_size - valid_size, self.path))
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_size)
+                f.flush()
+                os.fsync(f.fileno())
+        self._full_size = valid_size
+        self._log.info('restored %d state keys from %s (%d segments), positions %s' \
+                       % (len(self._data), self.path, num_segments, self._positions))
+
+
+    def snapshot(self):
+        '''Appends the changes since the last snapshot, or rewrites the whole
+        file if it has grown past compact_ratio times its compacted size.
+        '''
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty and not self._deleted and not self._positions_dirty:
+                    return
+                file_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                compact = file_size == 0 or file_size > self._full_size * self.compact_ratio
+                if compact:
+                    segment = {'puts': dict(self._data), 'deletes': []}
+                else:
+                    segment = {'puts': dict([(k, self._data[k]) for k in self._dirty]),
+                               'deletes': list(self._deleted)}
+                segment['positions'] = dict(self._positions)
+                data = encode_segment(segment)
+                self._dirty = set()
+                self._deleted = set()
+                self._positions_dirty = False
+
+            try:
+                if compact:
+                    self._write_full(data)
+                else:
+                    with open(self.path, 'ab') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+            except Exception:
+                # the changes in this segment are no longer tracked as dirty,
+                # so the next snapshot must be a full one
+                self._full_size = 0
+                raise
+
+
+    def _write_full(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._full_size = len(data)
+
+
+    def _snapshot_loop(self):
+        while self._running:
+            time.sleep(self.snapshot_interval)
+            if not self._running:
+                return
+            try:
+                self.snapshot()
+            except Exception:
+                self._log.exception('state snapshot to %s failed' % self.path)
+
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        self.snapshot()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+
+DEFAULT_TX_FLUSH_INTERVAL = 0.05
+
+SNAPSHOT_GROUP_KEY = 'snapshot'
+
+
+class Transaction(object):
+    def __init__(self, txid, source=None):
+        self.txid = txid
+        self.source = source
+        self.events = []
+
+
+    @property
+    def channels(self):
+        return set([e.channel for e in self.events])
+
+
+    @property
+    def tables(self):
+        return set([e.table for e in self.events])
+
+
+
+class TransactionGrouper(object):
+    '''Groups consecutive events carrying the same txid into a single
+    Transaction. Postgres delivers the notifications of a transaction
+    together and in order when it commits, so a change of txid -- or a
+    quiet socket -- means the pending transaction is complete. Events
+    without a txid (procedures generated before txid was added to the
+    payload) each form a transaction of their own.
+    '''
+
+    def __init__(self, transaction_handler):
+        self._handler = transaction_handler
+        self._pending = None
+        self._pending_key = None
+
+
+    @property
+    def has_pending(self):
+        return self._pending is not None
+
+
+    @property
+    def flush_interval(self):
+        return DEFAULT_TX_FLUSH_INTERVAL
+
+
+    def expired(self, now):
+        # a transaction is only known to be complete once the txid changes
+        # or the socket goes quiet
+        return False
+
+
+    def add(self, event, svc_object_registry):
+        # bootstrap snapshot rows carry no txid; they are grouped until the
+        # bootstrap flushes at the end of each chunk
+        if event.data().get('snapshot'):
+            group_key = (event.source, SNAPSHOT_GROUP_KEY)
+        elif event.txid is None:
+            group_key = None
+        else:
+            group_key = (event.source, event.txid)
+
+        if self._pending is not None:
+            if group_key is None or group_key != self._pending_key:
+                self.flush(svc_object_registry)
+
+        if self._pending is None:
+            self._pending = Transaction(event.txid, event.source)
+            self._pending_key = group_key
+        self._pending.events.append(event)
+
+        if group_key is None:
+            self.flush(svc_object_registry)
+
+
+    def flush(self, svc_object_registry):
+        if self._pending is None:
+            return
+        tx = self._pending
+        self._pending = None
+        self._handler(tx.txid, tx.events, svc_object_registry)
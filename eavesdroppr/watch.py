@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+import os
+
+
+DEFAULT_WATCH_INTERVAL = 2.0
+
+
+class FileWatcher(object):
+    '''Polls the modification times of a set of files, at most once every
+    interval seconds. Cheap enough to call on every pass of the event loop.
+    '''
+
+    def __init__(self, paths, interval=DEFAULT_WATCH_INTERVAL):
+        self.interval = float(interval)
+        self._mtimes = {}
+        self._next_check = 0
+        self.watch(paths)
+
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+
+    def watch(self, paths):
+        '''Replaces the watched set, taking the files' current state as seen.'''
+        self._mtimes = dict([(p, self._mtime(p)) for p in paths if p])
+
+
+    def changed(self, now):
+        '''Returns the watched files modified since the last check.'''
+        if now < self._next_check:
+            return []
+        self._next_check = now + self.interval
+
+        changed = []
+        for path, mtime in self._mtimes.items():
+            current = self._mtime(path)
+            if current != mtime:
+                self._mtimes[path] = current
+                changed.append(path)
+        return changed
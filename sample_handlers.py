@@ -5,4 +5,8 @@ from snap import common
 
 
 def handle_instructors_insert(event, svc_object_registry):
-    print 'calling stub event handler function [event data: %s]' % event.payload
+    print('calling stub event handler function [event data: %s]' % event.payload)
+
+
+def handle_instructors_transaction(txid, events, svc_object_registry):
+    print('calling stub transaction handler [txid: %s, %d events]' % (txid, len(events)))
@@ -22,6 +22,9 @@ DEPENDENCIES=['docopt',
               'snap-micro',
               'teamcity-messages']
 
+OPTIONAL_DEPENDENCIES = {'columnar': ['numpy'],
+                         'zstd': ['zstandard']}
+
 def read(fname):
     return open(os.path.join(os.path.dirname(__file__), fname)).read()
 
@@ -32,9 +35,10 @@ setup(
     author='Dexter Taylor',
     author_email='binarymachineshop@gmail.com',
     platforms=['any'],
-    scripts=['scripts/eavesdrop'],
+    scripts=['scripts/eavesdrop', 'scripts/eavesdrop-listen'],
     packages=find_packages(),
     install_requires=DEPENDENCIES,
+    extras_require=OPTIONAL_DEPENDENCIES,
     test_suite='tests',
     description=('Eavesdroppr: Eavesdrop on Postgres Records'),
     license='MIT',
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+
+import json
+from eavesdroppr.events import ChannelEvent
+
+
+def make_event(pk=1, operation='INSERT', txid=1, table='t', channel='ch', source=None, **fields):
+    '''A ChannelEvent whose payload has the layout of the generated procedures:
+    table and primary key first, the payload fields, then type and txid.
+    '''
+    payload = {'table': table, 'primary_key': pk}
+    payload.update(fields)
+    payload.update({'type': operation, 'txid': txid})
+    return ChannelEvent(channel, json.dumps(payload), source=source)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest import mock
+from eavesdroppr.aggregation import WindowAggregator, Pane, OVERFLOW_GROUP, parse_metrics, \
+    create_window_aggregator, UnsupportedAggregateMetric, InvalidAggregateWindow
+from tests.helpers import make_event
+
+
+
+class AggregationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('eavesdroppr.aggregation.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.windows = []
+
+
+    def aggregator(self, **kwargs):
+        return WindowAggregator('ch', lambda window, registry: self.windows.append(window), **kwargs)
+
+
+    def test_tumbling_window_groups_and_metrics(self):
+        agg = self.aggregator(group_by=['region'], metrics=['count', {'sum': 'amount'}, {'max': 'amount'}], window=10)
+        for region, amount in [('eu', 5), ('eu', 7), ('us', 1), ('us', 'n/a')]:
+            agg.add(make_event(region=region, amount=amount), None)
+
+        agg.flush(None)
+        self.assertEqual(self.windows, [])
+        self.now = 1010.0
+        agg.flush(None)
+        self.assertEqual(len(self.windows), 1)
+        window = self.windows[0]
+        self.assertEqual((window['start'], window['end']), (1000.0, 1010.0))
+        self.assertEqual(window['groups'][('eu',)], {'count': 2, 'sum_amount': 12, 'max_amount': 7})
+        self.assertEqual(window['groups'][('us',)], {'count': 2, 'sum_amount': 1, 'max_amount': 1})
+        self.assertFalse(agg.has_pending)
+
+
+    def test_sliding_windows_share_panes(self):
+        agg = self.aggregator(window=20, slide=10)
+        agg.add(make_event(), None)
+        self.now = 1010.0
+        agg.add(make_event(), None)
+        self.now = 1030.0
+        agg.flush(None)
+        self.assertEqual([(w['end'], w['groups'][()]['count']) for w in self.windows],
+                         [(1010.0, 1), (1020.0, 2), (1030.0, 1)])
+
+
+    def test_drain_delivers_open_windows_as_partial(self):
+        agg = self.aggregator(window=60)
+        agg.add(make_event(), None)
+        agg.drain(None)
+        self.assertEqual(len(self.windows), 1)
+        self.assertTrue(self.windows[0]['partial'])
+        self.assertFalse(agg.has_pending)
+
+
+    def test_groups_beyond_max_groups_overflow(self):
+        pane = Pane(0, 2)
+        metrics = parse_metrics(None)
+        for key in ['a', 'b', 'c', 'd']:
+            pane.add((key,), {}, metrics)
+        self.assertEqual(pane.groups[OVERFLOW_GROUP], {'count': 2})
+
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(UnsupportedAggregateMetric):
+            parse_metrics(['median'])
+        with self.assertRaises(InvalidAggregateWindow):
+            self.aggregator(window=10, slide=3)
+        self.assertIsNone(create_window_aggregator('ch', {}, None))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import os
+import gzip
+import time
+import shutil
+import tempfile
+import unittest
+from eavesdroppr.events import ChannelEvent
+from eavesdroppr.archive import EventArchive, UnsupportedCompression, IN_PROGRESS_SUFFIX
+from tests.helpers import make_event
+
+
+def archived_files(directory):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        paths.extend([os.path.join(dirpath, f) for f in filenames])
+    return sorted(paths)
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return [line for line in f.read().split('\n') if line]
+
+
+
+class EventArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_events_are_partitioned_by_table(self):
+        archive = EventArchive(directory=self.directory, flush_interval=0.01)
+        for i in range(10):
+            archive.receive(make_event(i, table='orders' if i % 2 else 'customers'))
+        archive.close()
+
+        paths = archived_files(self.directory)
+        self.assertEqual(len(paths), 2)
+        self.assertFalse([p for p in paths if p.endswith(IN_PROGRESS_SUFFIX)])
+        self.assertEqual(sorted([p.split(os.sep)[-4] for p in paths]), ['customers', 'orders'])
+        self.assertEqual(sum([len(read_lines(p)) for p in paths]), 10)
+        self.assertEqual(archive.stats()['events_written'], 10)
+
+
+    def test_file_names_carry_host_and_pid(self):
+        archive = EventArchive(directory=self.directory, flush_interval=0.01)
+        archive.receive(make_event(1, table='orders'))
+        archive.close()
+        filename = os.path.basename(archived_files(self.directory)[0])
+        self.assertIn('-%d-' % os.getpid(), filename)
+
+
+    def test_rotation_by_size(self):
+        archive = EventArchive(directory=self.directory, flush_interval=0.01, max_file_bytes=1)
+        for i in range(3):
+            archive.receive(make_event(i, table='orders'))
+            deadline = time.time() + 5
+            while archive.stats()['files_closed'] < i + 1 and time.time() < deadline:
+                time.sleep(0.01)
+        archive.close()
+        paths = archived_files(self.directory)
+        self.assertEqual(len(paths), 3)
+        self.assertEqual([len(read_lines(p)) for p in paths], [1, 1, 1])
+
+
+    def test_gzip_compression(self):
+        archive = EventArchive(directory=self.directory, compression='gzip', flush_interval=0.01)
+        for i in range(5):
+            archive.receive(make_event(i, table='orders'))
+        archive.close()
+        paths = archived_files(self.directory)
+        self.assertTrue(paths[0].endswith('.ndjson.gz'))
+        self.assertEqual(len(read_lines(paths[0])), 5)
+
+
+    def test_bad_payload_does_not_drop_the_batch(self):
+        archive = EventArchive(directory=self.directory, flush_interval=0.01)
+        archive.receive(make_event(1, table='orders'))
+        archive.receive(ChannelEvent('orders', 'not json'))
+        archive.receive(ChannelEvent('orders', None))
+        archive.receive(make_event(2, table='orders'))
+        archive.close()
+
+        lines = []
+        for path in archived_files(self.directory):
+            lines.extend(read_lines(path))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('not json', lines)
+        self.assertEqual(archive.stats()['events_failed'], 1)
+
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(UnsupportedCompression):
+            EventArchive(directory=self.directory, compression='lz4')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
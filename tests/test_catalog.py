@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import io
+import unittest
+from eavesdroppr.catalog import SchemaCatalog, TableInfo, ColumnInfo, validate_channel, report_problems
+
+
+def make_catalog():
+    table = TableInfo('public', 'orders')
+    table.columns = [ColumnInfo('id', 'bigint'), ColumnInfo('status', 'character varying', max_length=20)]
+    table.primary_key = ['id']
+    catalog = SchemaCatalog()
+    catalog.tables[('public', 'orders')] = table
+    return catalog
+
+
+def channel_config(**overrides):
+    config = {'db_table_name': 'orders',
+              'pk_field_name': 'id',
+              'pk_field_type': 'bigint',
+              'payload_fields': ['status']}
+    config.update(overrides)
+    return config
+
+
+
+class ValidateTest(unittest.TestCase):
+
+    def test_valid_channel_has_no_problems(self):
+        self.assertEqual(validate_channel('ch', channel_config(), make_catalog()), [])
+
+
+    def test_errors_give_a_failing_exit_status(self):
+        problems = validate_channel('ch', channel_config(payload_fields=['missing']), make_catalog())
+        self.assertEqual([p[0] for p in problems], ['error'])
+        out = io.StringIO()
+        self.assertEqual(report_problems(problems, out), 1)
+        self.assertIn('column "missing" does not exist', out.getvalue())
+
+
+    def test_warnings_alone_pass(self):
+        problems = validate_channel('ch', channel_config(pk_field_type='integer'), make_catalog())
+        self.assertEqual([p[0] for p in problems], ['warning'])
+        self.assertEqual(report_problems(problems, io.StringIO()), 0)
+
+
+    def test_missing_table_is_an_error(self):
+        problems = validate_channel('ch', channel_config(db_table_name='gone'), make_catalog())
+        self.assertEqual(report_problems(problems, io.StringIO()), 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
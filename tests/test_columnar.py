@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.columnar import build_columns, create_columnar_batcher
+from tests.helpers import make_event
+
+
+
+class BuildColumnsTest(unittest.TestCase):
+
+    def test_numeric_fields_become_masked_arrays(self):
+        events = [make_event(1, price=1.5, name='a'), make_event(2, price=None, name='b')]
+        columns = build_columns(events, ['price', 'name'])
+        self.assertEqual(sorted(columns.keys()), ['price', 'primary_key'])
+        self.assertEqual(columns['primary_key'].tolist(), [1.0, 2.0])
+        self.assertEqual(columns['price'].tolist(), [1.5, None])
+
+
+    def test_bad_value_is_masked_not_the_whole_column(self):
+        events = [make_event(1, price=1.5), make_event(2, price='n/a'), make_event(3, price='2.5')]
+        with self.assertLogs('eavesdroppr', 'WARNING') as logged:
+            columns = build_columns(events, ['price'], 'ch')
+        self.assertEqual(columns['price'].tolist(), [1.5, None, 2.5])
+        self.assertIn('n/a', logged.output[0])
+
+
+    def test_all_null_field_is_kept_masked(self):
+        columns = build_columns([make_event(1, price=None)], ['price'])
+        self.assertEqual(columns['price'].tolist(), [None])
+
+
+
+class ColumnarBatcherTest(unittest.TestCase):
+
+    def test_flushes_at_batch_size(self):
+        batches = []
+        batcher = create_columnar_batcher('ch',
+                                          {'columnar': {'batch_size': 2}, 'payload_fields': ['price']},
+                                          lambda columns, registry: batches.append(columns))
+        batcher.add(make_event(1, price=1), None)
+        self.assertTrue(batcher.has_pending)
+        batcher.add(make_event(2, price=2), None)
+        self.assertFalse(batcher.has_pending)
+        self.assertEqual(batches[0]['price'].tolist(), [1.0, 2.0])
+
+        batcher.add(make_event(3, price=3), None)
+        batcher.flush(None)
+        self.assertEqual(len(batches), 2)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import time
+import unittest
+import threading
+from eavesdroppr.concurrency import AIMDController, AdaptiveWorkerPool, WindowStats, create_worker_pool
+from tests.helpers import make_event
+
+
+class RecordingController(AIMDController):
+    def __init__(self, *args, **kwargs):
+        AIMDController.__init__(self, *args, **kwargs)
+        self.ages = []
+
+
+    def adjust(self, limit, queue_depth, busy_workers, stats, oldest_age=0.0):
+        if stats.completed:
+            self.ages.append(stats.mean_age)
+        return AIMDController.adjust(self, limit, queue_depth, busy_workers, stats, oldest_age)
+
+
+def window(*samples):
+    stats = WindowStats()
+    for age, latency in samples:
+        stats.record(age, latency)
+    return stats
+
+
+
+class AIMDControllerTest(unittest.TestCase):
+
+    def test_grows_while_queued_work_waits(self):
+        controller = AIMDController(1, 4, target_age=0.5)
+        new_limit, reason = controller.adjust(2, 10, 2, window((1.0, 0.01)))
+        self.assertEqual(new_limit, 3)
+        self.assertIsNotNone(reason)
+
+
+    def test_grows_with_no_completions_when_the_queue_is_old(self):
+        controller = AIMDController(1, 4, target_age=0.5)
+        self.assertEqual(controller.adjust(2, 10, 2, WindowStats()), (2, None))
+        new_limit, reason = controller.adjust(2, 10, 2, WindowStats(), oldest_age=3.0)
+        self.assertEqual(new_limit, 3)
+
+
+    def test_never_exceeds_max(self):
+        controller = AIMDController(1, 2, target_age=0.5)
+        self.assertEqual(controller.adjust(2, 10, 2, WindowStats(), oldest_age=3.0), (2, None))
+
+
+    def test_cuts_on_rising_latency(self):
+        controller = AIMDController(1, 16, latency_tolerance=2.0, decrease_factor=0.5)
+        controller.adjust(8, 0, 8, window((0.0, 0.01)))
+        new_limit, reason = controller.adjust(8, 5, 8, window((1.0, 0.1)))
+        self.assertEqual(new_limit, 4)
+
+
+    def test_shrinks_when_idle(self):
+        controller = AIMDController(1, 8)
+        self.assertEqual(controller.adjust(4, 0, 1, WindowStats())[0], 3)
+        self.assertEqual(controller.adjust(1, 0, 0, WindowStats()), (1, None))
+
+
+
+class AdaptiveWorkerPoolTest(unittest.TestCase):
+
+    def test_handles_every_item(self):
+        handled = []
+        lock = threading.Lock()
+
+        def handler(item, registry):
+            with lock:
+                handled.append(item)
+
+        pool = AdaptiveWorkerPool('test', handler, AIMDController(2, 4), adjust_interval=60)
+        for i in range(50):
+            pool.submit(i, None)
+        pool.drain()
+        self.assertEqual(sorted(handled), list(range(50)))
+
+
+    def test_stalled_pool_grows(self):
+        release = threading.Event()
+
+        def handler(item, registry):
+            release.wait(10)
+
+        pool = AdaptiveWorkerPool('test', handler,
+                                  AIMDController(1, 3, target_age=0.01),
+                                  adjust_interval=0.05)
+        try:
+            for i in range(5):
+                pool.submit(i, None)
+            deadline = time.time() + 5
+            while pool.limit < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(pool.limit, 3)
+        finally:
+            release.set()
+            pool.drain()
+
+
+    def test_submit_blocks_while_the_queue_is_full(self):
+        release = threading.Event()
+        pool = AdaptiveWorkerPool('test', lambda item, registry: release.wait(10),
+                                  AIMDController(1, 1), adjust_interval=60, max_queue=2)
+        submitted = []
+
+        def submit_all():
+            for i in range(5):
+                pool.submit(i, None)
+                submitted.append(i)
+
+        submitter = threading.Thread(target=submit_all)
+        submitter.daemon = True
+        submitter.start()
+        time.sleep(0.2)
+        # one item with the worker, two queued, the fourth waiting for room
+        self.assertEqual(len(submitted), 3)
+        self.assertEqual(pool.queue_depth, 2)
+
+        release.set()
+        submitter.join(5)
+        self.assertEqual(len(submitted), 5)
+        pool.drain()
+
+
+    def test_age_counts_from_when_the_event_was_received(self):
+        controller = RecordingController(1, 1)
+        pool = AdaptiveWorkerPool('test', lambda item, registry: None, controller, adjust_interval=0.05)
+        event = make_event()
+        event.received = time.time() - 10
+        pool.submit(event, None)
+        deadline = time.time() + 5
+        while not controller.ages and time.time() < deadline:
+            time.sleep(0.01)
+        pool.drain()
+        self.assertGreaterEqual(controller.ages[0], 10)
+
+
+    def test_create_worker_pool_from_config(self):
+        self.assertIsNone(create_worker_pool('ch', {}, None))
+        pool = create_worker_pool('ch', {'concurrency': {'min': 2, 'max': 5, 'max_queue': 7}},
+                                  lambda item, registry: None)
+        self.assertEqual(pool.limit, 2)
+        pool.drain()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
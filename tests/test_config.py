@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import os
+import unittest
+from eavesdroppr import config
+
+
+class ConfigTest(unittest.TestCase):
+
+    def test_load_config_var(self):
+        os.environ['EAVESDROP_TEST_VAR'] = 'secret'
+        self.assertEqual(config.load_config_var('$EAVESDROP_TEST_VAR'), 'secret')
+        self.assertEqual(config.load_config_var('~/project'), os.path.join(os.path.expanduser('~'), 'project'))
+        self.assertEqual(config.load_config_var('plain'), 'plain')
+        self.assertIsNone(config.load_config_var(''))
+        with self.assertRaises(config.MissingEnvironmentVarException):
+            config.load_config_var('$EAVESDROP_TEST_UNSET_VAR')
+
+
+    def test_registry_lookup(self):
+        registry = config.ServiceObjectRegistry({'cache': {}})
+        self.assertEqual(registry.lookup('cache'), {})
+        with self.assertRaises(config.UnregisteredServiceObjectException):
+            registry.lookup('missing')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.control import parse_sample_rate, parse_predicates, InvalidControlSetting
+
+
+
+class ParseSettingsTest(unittest.TestCase):
+
+    def test_sample_rate(self):
+        self.assertIsNone(parse_sample_rate(None))
+        self.assertEqual(parse_sample_rate('0.25'), 0.25)
+        self.assertEqual(parse_sample_rate('0'), 0.0)
+        self.assertEqual(parse_sample_rate('1'), 1.0)
+
+
+    def test_sample_rate_out_of_range(self):
+        for value in ('-0.1', '1.5', 'abc'):
+            with self.assertRaises(InvalidControlSetting):
+                parse_sample_rate(value)
+
+
+    def test_sample_rate_must_be_finite(self):
+        for value in ('nan', 'NaN', 'inf', '-inf'):
+            with self.assertRaises(InvalidControlSetting):
+                parse_sample_rate(value)
+
+
+    def test_predicates(self):
+        self.assertEqual(parse_predicates('{"state": "NY"}'), {'state': 'NY'})
+        for value in ('[1, 2]', '{bad'):
+            with self.assertRaises(InvalidControlSetting):
+                parse_predicates(value)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.dedup import LRUKeyCache, DedupFilter, create_dedup_filter
+from tests.helpers import make_event
+
+
+
+class LRUKeyCacheTest(unittest.TestCase):
+
+    def test_evicts_the_least_recently_seen_key(self):
+        cache = LRUKeyCache(2)
+        self.assertFalse(cache.check_and_add('a'))
+        self.assertFalse(cache.check_and_add('b'))
+        self.assertTrue(cache.check_and_add('a'))
+        self.assertFalse(cache.check_and_add('c'))
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.check_and_add('a'))
+        self.assertFalse(cache.check_and_add('b'))
+
+
+    def test_capacity_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            LRUKeyCache(0)
+
+
+
+class DedupFilterTest(unittest.TestCase):
+
+    def test_drops_repeats_of_the_same_row_and_transaction(self):
+        dedup = DedupFilter(10)
+        self.assertTrue(dedup.accept(make_event(1)))
+        self.assertFalse(dedup.accept(make_event(1)))
+        self.assertTrue(dedup.accept(make_event(1, txid=2)))
+        self.assertTrue(dedup.accept(make_event(2)))
+        self.assertEqual(dedup.stats(), {'hits': 1, 'misses': 3, 'size': 3, 'capacity': 10})
+
+
+    def test_different_updates_in_one_transaction_are_kept(self):
+        dedup = DedupFilter(10)
+        self.assertTrue(dedup.accept(make_event(1, 'UPDATE', txid=7, status='open')))
+        self.assertTrue(dedup.accept(make_event(1, 'UPDATE', txid=7, status='closed')))
+        self.assertFalse(dedup.accept(make_event(1, 'UPDATE', txid=7, status='closed')))
+
+
+    def test_txids_are_scoped_to_their_database(self):
+        dedup = DedupFilter(10)
+        self.assertTrue(dedup.accept(make_event(1, source='db1')))
+        self.assertTrue(dedup.accept(make_event(1, source='db2')))
+
+
+    def test_payload_hash_without_txid(self):
+        dedup = DedupFilter(10)
+        self.assertTrue(dedup.accept(make_event(1, txid=None, name='a')))
+        self.assertFalse(dedup.accept(make_event(1, txid=None, name='a')))
+        self.assertTrue(dedup.accept(make_event(1, txid=None, name='b')))
+
+
+    def test_create_dedup_filter(self):
+        self.assertIsNone(create_dedup_filter({}))
+        self.assertEqual(create_dedup_filter({'dedup': True}).stats()['capacity'], 10000)
+        self.assertEqual(create_dedup_filter({'dedup': {'capacity': 5}}).stats()['capacity'], 5)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
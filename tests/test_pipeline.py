@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import time
+import unittest
+import threading
+from eavesdroppr.pipeline import Stage, Pipeline, create_pipeline, InvalidPipeline, UnsupportedStageType
+
+
+def double(item, svc_object_registry):
+    return item * 2
+
+
+def drop_odd(item, svc_object_registry):
+    return item if item % 2 == 0 else None
+
+
+def stage_threads(prefix):
+    return [t for t in threading.enumerate() if t.name.startswith(prefix)]
+
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_stages_run_in_order_into_output(self):
+        results = []
+        pipeline = Pipeline('test',
+                            [Stage('double', double, 'thread', workers=2),
+                             Stage('drop_odd', drop_odd, 'inline')],
+                            output=lambda item, registry: results.append(item),
+                            report_interval=0)
+        for i in range(10):
+            pipeline.submit(i, None)
+        pipeline.drain()
+        self.assertEqual(sorted(results), [i * 2 for i in range(10)])
+
+
+    def test_stage_returning_none_stops_the_item(self):
+        results = []
+        pipeline = Pipeline('test', [Stage('drop_odd', drop_odd)],
+                            output=lambda item, registry: results.append(item),
+                            report_interval=0)
+        for i in range(5):
+            pipeline.submit(i, None)
+        pipeline.drain()
+        self.assertEqual(results, [0, 2, 4])
+
+
+    def test_failing_output_does_not_stall_the_pipeline(self):
+        def failing_output(item, registry):
+            raise ValueError('output failed')
+
+        pipeline = Pipeline('test',
+                            [Stage('double', double, 'thread', workers=1, queue_size=2)],
+                            output=failing_output,
+                            report_interval=0)
+
+        def submit_all():
+            for i in range(20):
+                pipeline.submit(i, None)
+            pipeline.drain()
+
+        submitter = threading.Thread(target=submit_all)
+        submitter.daemon = True
+        submitter.start()
+        submitter.join(10)
+        self.assertFalse(submitter.is_alive(), 'pipeline stalled after its output raised')
+        self.assertEqual(pipeline.stages[0].report()['processed'], 20)
+
+
+    def test_failing_stage_is_counted(self):
+        def fail(item, registry):
+            raise ValueError('stage failed')
+
+        stage = Stage('fail', fail, 'thread')
+        pipeline = Pipeline('test', [stage], report_interval=0)
+        pipeline.submit(1, None)
+        pipeline.drain()
+        self.assertEqual(stage.report()['errors'], 1)
+
+
+    def test_unsupported_stage_type(self):
+        with self.assertRaises(UnsupportedStageType):
+            Stage('bad', double, 'fiber')
+
+
+    def test_create_pipeline_from_config(self):
+        functions = {'double': double, 'drop_odd': drop_odd}
+        self.assertIsNone(create_pipeline('ch', {}, functions.get))
+        with self.assertRaises(InvalidPipeline):
+            create_pipeline('ch', {'pipeline': {'stages': []}}, functions.get)
+        with self.assertRaises(InvalidPipeline):
+            create_pipeline('ch', {'pipeline': {'stages': [{'type': 'thread'}]}}, functions.get)
+
+        pipeline = create_pipeline('ch',
+                                   {'pipeline': {'report_interval': 0,
+                                                 'stages': [{'function': 'double', 'type': 'thread'},
+                                                            {'function': 'drop_odd'}]}},
+                                   functions.get)
+        self.assertEqual([s.name for s in pipeline.stages], ['ch.double', 'ch.drop_odd'])
+        pipeline.drain()
+
+
+    def test_failed_create_pipeline_stops_the_stages_already_built(self):
+        def loader(name):
+            if name == 'missing':
+                raise AttributeError(name)
+            return double
+
+        config = {'pipeline': {'report_interval': 0,
+                               'stages': [{'function': 'double', 'type': 'thread', 'workers': 2},
+                                          {'function': 'missing', 'type': 'thread'}]}}
+        with self.assertRaises(AttributeError):
+            create_pipeline('leak', config, loader)
+
+        deadline = time.time() + 5
+        while stage_threads('leak.') and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(stage_threads('leak.'), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.config import ServiceObjectRegistry
+from eavesdroppr.replica import TableReplica, NoSuchReplicaIndex, UnsupportedEvictionPolicy
+from tests.helpers import make_event
+
+try:
+    from snap import common as snap_common
+except ImportError:
+    snap_common = None
+
+
+
+class TableReplicaTest(unittest.TestCase):
+
+    def test_empty_replica_can_be_looked_up(self):
+        replica = TableReplica(table='t')
+        self.assertEqual(len(replica), 0)
+        self.assertTrue(replica)
+        self.assertIs(ServiceObjectRegistry({'cache': replica}).lookup('cache'), replica)
+
+
+    @unittest.skipIf(snap_common is None, 'snap is not installed')
+    def test_empty_replica_can_be_looked_up_through_snap(self):
+        replica = TableReplica(table='t')
+        self.assertIs(snap_common.ServiceObjectRegistry({'cache': replica}).lookup('cache'), replica)
+
+
+    def test_inserts_and_updates_are_replicated(self):
+        replica = TableReplica(table='t', indexes='email')
+        replica.receive(make_event(1, 'INSERT', email='a@x', name='a'))
+        replica.receive(make_event(1, 'UPDATE', email='b@x', name='b'))
+        replica.receive(make_event(2, 'DELETE', email='c@x'))
+        replica.receive(make_event(3, 'INSERT', table='other'))
+        self.assertEqual(len(replica), 1)
+        self.assertEqual(replica.get(1), {'email': 'b@x', 'name': 'b'})
+        self.assertEqual(replica.find('email', 'b@x'), [{'email': 'b@x', 'name': 'b'}])
+        self.assertEqual(replica.find('email', 'a@x'), [])
+        with self.assertRaises(NoSuchReplicaIndex):
+            replica.find('name', 'b')
+
+
+    def test_lru_eviction(self):
+        replica = TableReplica(max_rows=2)
+        replica.put(1, {})
+        replica.put(2, {})
+        replica.get(1)
+        replica.put(3, {})
+        self.assertEqual(len(replica), 2)
+        self.assertIsNone(replica.get(2))
+        self.assertEqual(replica.evictions, 1)
+
+
+    def test_unsupported_eviction_policy(self):
+        with self.assertRaises(UnsupportedEvictionPolicy):
+            TableReplica(eviction='random')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+from multiprocessing import shared_memory, resource_tracker
+from eavesdroppr.ringbuffer import RingBufferWriter, RingReader, InvalidRingBuffer, RECORD_HEADER_SIZE
+from tests.helpers import make_event
+
+
+
+def attach(name):
+    '''A RingReader in the writer's own process. Before Python 3.13 the
+    reader unregisters the segment from the resource tracker, which the
+    writer registered; register it again so the writer's unlink balances.
+    '''
+    reader = RingReader(name)
+    if sys.version_info < (3, 13):
+        resource_tracker.register('/' + name, 'shared_memory')
+    return reader
+
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'eavesdrop_test_%d' % os.getpid()
+        self.writer = RingBufferWriter(self.name, slots=4, record_size=512)
+
+
+    def tearDown(self):
+        if self.writer._buf is not None:
+            self.writer.close()
+
+
+    def test_reader_receives_records(self):
+        reader = attach(self.name)
+        self.writer.receive(make_event(1))
+        self.writer.receive(make_event(2))
+        records = reader.poll()
+        self.assertEqual([r.primary_key for r in records], [1, 2])
+        self.assertEqual(records[0].operation, 'INSERT')
+        self.assertEqual(records[0].txid, 1)
+        self.assertEqual(records[0].channel, 'ch')
+        self.assertTrue(records[0].valid())
+        self.assertEqual(records[1].data()['primary_key'], 2)
+        del records
+        reader.close()
+
+
+    def test_overrun_reader_counts_lost_records(self):
+        reader = attach(self.name)
+        for i in range(10):
+            self.writer.receive(make_event(i))
+        records = reader.poll()
+        self.assertEqual([r.primary_key for r in records], [6, 7, 8, 9])
+        self.assertEqual(reader.lost, 6)
+        del records
+        reader.close()
+
+
+    def test_long_channel_names_stay_distinct(self):
+        reader = attach(self.name)
+        prefix = 'c' * 40
+        self.writer.receive(make_event(1, channel=prefix + '_orders_insert'))
+        self.writer.receive(make_event(2, channel=prefix + '_orders_update'))
+        self.assertEqual([r.channel for r in reader.poll()],
+                         [prefix + '_orders_insert', prefix + '_orders_update'])
+        reader.close()
+
+
+    def test_primary_key_out_of_range_is_not_valid(self):
+        reader = attach(self.name)
+        self.writer.receive(make_event(2 ** 64))
+        self.writer.receive(make_event('abc'))
+        records = reader.poll()
+        self.assertEqual([r.primary_key for r in records], [None, None])
+        self.assertEqual(records[0].data()['primary_key'], 2 ** 64)
+        del records
+        reader.close()
+
+
+    def test_oversized_event_is_dropped(self):
+        reader = attach(self.name)
+        self.writer.receive(make_event(1, note='x' * (512 - RECORD_HEADER_SIZE)))
+        self.writer.receive(make_event(2))
+        self.assertEqual([r.primary_key for r in reader.poll()], [2])
+        self.assertEqual(self.writer.dropped, 1)
+        reader.close()
+
+
+    def test_stale_segment_is_replaced(self):
+        # a writer which never closed leaves its segment behind
+        self.writer._buf = None
+        self.writer._shm.close()
+        self.writer = RingBufferWriter(self.name, slots=8, record_size=512)
+        reader = attach(self.name)
+        self.assertEqual(reader.slots, 8)
+        reader.close()
+
+
+    def test_reader_rejects_other_segments(self):
+        other = shared_memory.SharedMemory(name=self.name + '_other', create=True, size=128)
+        try:
+            with self.assertRaises(InvalidRingBuffer):
+                attach(self.name + '_other')
+            if sys.version_info < (3, 13):
+                resource_tracker.register(other._name, 'shared_memory')
+        finally:
+            other.close()
+            other.unlink()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.routing import Route, RouteTable, create_route_table, InvalidRoute
+from tests.helpers import make_event
+
+
+
+class RoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+
+    def handler(self, name):
+        return lambda event, registry: self.calls.append((name, event.primary_key))
+
+
+    def test_list_valued_table_and_type_match_any_value(self):
+        route = Route(None, table=['orders', 'refunds'], operation=['INSERT', 'UPDATE'])
+        self.assertTrue(route.matches_key('orders', 'INSERT'))
+        self.assertTrue(route.matches_key('refunds', 'UPDATE'))
+        self.assertFalse(route.matches_key('orders', 'DELETE'))
+        self.assertFalse(route.matches_key('customers', 'INSERT'))
+
+
+    def test_single_values_and_no_condition(self):
+        self.assertTrue(Route(None, table='orders').matches_key('orders', 'DELETE'))
+        self.assertFalse(Route(None, operation='INSERT').matches_key('orders', 'UPDATE'))
+        self.assertTrue(Route(None).matches_key('anything', 'INSERT'))
+
+
+    def test_route_table_fans_out_and_falls_back_to_the_default(self):
+        handlers = {'writes': self.handler('writes'), 'east': self.handler('east')}
+        table = create_route_table('ch',
+                                   {'routes': [{'handler': 'writes', 'type': ['INSERT', 'UPDATE']},
+                                               {'handler': 'east', 'fields': {'region': ['east', 'north']}}]},
+                                   handlers.get,
+                                   self.handler('default'))
+        table.dispatch(make_event(1, 'INSERT', region='east'), None)
+        table.dispatch(make_event(2, 'UPDATE', region='west'), None)
+        table.dispatch(make_event(3, 'DELETE', region='west'), None)
+        self.assertEqual(self.calls, [('writes', 1), ('east', 1), ('writes', 2), ('default', 3)])
+
+
+    def test_route_without_a_handler(self):
+        with self.assertRaises(InvalidRoute):
+            create_route_table('ch', {'routes': [{'type': 'INSERT'}]}, {}.get)
+        self.assertIsNone(create_route_table('ch', {}, {}.get))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import time
+import unittest
+from eavesdroppr.scheduling import TokenBucket, ChannelQueue, FairScheduler, create_channel_queue
+from tests.helpers import make_event
+
+
+def make_events(channel_id, count):
+    return [make_event(i, channel=channel_id) for i in range(count)]
+
+
+def make_scheduler(*queues):
+    scheduler = FairScheduler()
+    for q in queues:
+        scheduler.add_channel(q)
+    return scheduler
+
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(10, burst=2)
+        now = time.time()
+        for i in range(2):
+            self.assertTrue(bucket.available(now))
+            bucket.take(now)
+        self.assertFalse(bucket.available(now))
+        self.assertAlmostEqual(bucket.wait_time(now), 0.1, places=2)
+        self.assertTrue(bucket.available(now + 0.11))
+
+
+
+class FairSchedulerTest(unittest.TestCase):
+
+    def test_weights_share_dispatch_between_backlogged_channels(self):
+        scheduler = make_scheduler(ChannelQueue('heavy', weight=3), ChannelQueue('light'))
+        for event in make_events('heavy', 30) + make_events('light', 30):
+            scheduler.enqueue(event)
+
+        dispatched = []
+        scheduler.run(dispatched.append, max_events=20)
+        self.assertEqual(len(dispatched), 20)
+        self.assertEqual(len([e for e in dispatched if e.channel == 'heavy']), 15)
+        self.assertEqual(scheduler.queue_depth(), 40)
+
+
+    def test_burst_on_one_channel_does_not_delay_another(self):
+        scheduler = make_scheduler(ChannelQueue('busy'), ChannelQueue('quiet'))
+        for event in make_events('busy', 100):
+            scheduler.enqueue(event)
+        scheduler.enqueue(make_events('quiet', 1)[0])
+
+        dispatched = []
+        scheduler.run(dispatched.append, max_events=3)
+        self.assertIn('quiet', [e.channel for e in dispatched])
+
+
+    def test_rate_limited_channel_waits_for_tokens(self):
+        scheduler = make_scheduler(ChannelQueue('limited', bucket=TokenBucket(1, burst=2)))
+        for event in make_events('limited', 5):
+            scheduler.enqueue(event)
+
+        self.assertEqual(scheduler.select_timeout(5.0), 0)
+        self.assertEqual(scheduler.run(lambda e: None), 2)
+        self.assertGreater(scheduler.select_timeout(5.0), 0)
+        self.assertEqual(scheduler.drain(lambda e: None), 3)
+        self.assertEqual(scheduler.queue_depth('limited'), 0)
+
+
+    def test_full_queue_drops_its_oldest_events(self):
+        q = ChannelQueue('limited', bucket=TokenBucket(1, burst=1), max_depth=3)
+        scheduler = make_scheduler(q)
+        events = make_events('limited', 5)
+        with self.assertLogs('eavesdroppr', 'WARNING'):
+            for event in events:
+                scheduler.enqueue(event)
+        self.assertEqual(scheduler.queue_depth('limited'), 3)
+        self.assertEqual(q.dropped, 2)
+
+        dispatched = []
+        scheduler.drain(dispatched.append)
+        self.assertEqual(dispatched, events[2:])
+
+
+    def test_unknown_channel_is_not_queued(self):
+        scheduler = make_scheduler(ChannelQueue('known'))
+        self.assertFalse(scheduler.enqueue(make_events('gone', 1)[0]))
+        self.assertEqual(scheduler.queue_depth(), 0)
+
+
+    def test_create_channel_queue(self):
+        q = create_channel_queue('ch', {})
+        self.assertEqual((q.weight, q.bucket), (1.0, None))
+        q = create_channel_queue('ch', {'scheduling': {'weight': 4, 'rate': 500, 'max_depth': 50}})
+        self.assertEqual((q.weight, q.bucket.rate, q.bucket.capacity, q.max_depth), (4.0, 500.0, 500.0, 50))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.dispatch import EventDispatcher, ChannelDispatch
+from eavesdroppr.shedding import LoadShedder, create_load_shedder
+from tests.helpers import make_event
+
+
+
+class QueuedPool(object):
+    def __init__(self, queue_depth):
+        self.queue_depth = queue_depth
+
+
+
+class LoadShedderTest(unittest.TestCase):
+
+    def test_sample_keeps_one_in_n(self):
+        shedder = LoadShedder('ch', sample=3)
+        kept = shedder.shed([make_event(i) for i in range(9)], 0)
+        self.assertEqual([e.primary_key for e in kept], [0, 3, 6])
+        self.assertEqual(shedder.stats()['dropped_sampled'], 6)
+
+
+    def test_latest_per_key_keeps_the_last_event_of_each_row(self):
+        shedder = LoadShedder('ch', latest_per_key=True)
+        events = [make_event(1, 'INSERT'), make_event(2, 'UPDATE'), make_event(1, 'UPDATE')]
+        kept = shedder.shed(events, 0)
+        self.assertEqual([(e.primary_key, e.operation) for e in kept], [(2, 'UPDATE'), (1, 'UPDATE')])
+
+
+    def test_drop_types_escalate_with_the_backlog(self):
+        shedder = LoadShedder('ch', lag_threshold=10, drop_types=['UPDATE', 'INSERT'])
+        events = [make_event(1, 'UPDATE'), make_event(2, 'INSERT'), make_event(3, 'DELETE')]
+        self.assertEqual(len(shedder.shed(events, 5)), 3)
+        self.assertEqual([e.operation for e in shedder.shed(events, 10)], ['INSERT', 'DELETE'])
+        self.assertEqual([e.operation for e in shedder.shed(events, 25)], ['DELETE'])
+        self.assertEqual(shedder.stats()['dropped_type'], 3)
+
+
+    def test_create_load_shedder(self):
+        self.assertIsNone(create_load_shedder('ch', {}))
+        shedder = create_load_shedder('ch', {'shedding': {'sample': 2, 'lag_threshold': 100}})
+        self.assertEqual((shedder.sample, shedder.lag_threshold), (2, 100))
+
+
+
+class DispatcherSheddingTest(unittest.TestCase):
+
+    def test_backlog_counts_the_worker_pool_queue(self):
+        dispatcher = EventDispatcher(None)
+        channel = ChannelDispatch('ch', None,
+                                  pools=[QueuedPool(0)],
+                                  shedder=LoadShedder('ch', lag_threshold=100, sample=2))
+        dispatcher.replace_channels([channel], None)
+        events = [make_event(i) for i in range(4)]
+        self.assertEqual(len(dispatcher.shed(events)), 4)
+
+        channel.pools[0].queue_depth = 500
+        self.assertEqual(len(dispatcher.shed(events)), 2)
+
+
+    def test_other_channels_are_untouched(self):
+        dispatcher = EventDispatcher(None)
+        dispatcher.replace_channels([ChannelDispatch('ch', None, shedder=LoadShedder('ch', sample=2)),
+                                     ChannelDispatch('other', None)], None)
+        events = [make_event(i, channel=c) for i in range(4) for c in ('ch', 'other')]
+        kept = dispatcher.shed(events)
+        self.assertEqual(len([e for e in kept if e.channel == 'other']), 4)
+        self.assertEqual(len([e for e in kept if e.channel == 'ch']), 2)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
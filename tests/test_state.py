@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from eavesdroppr.config import ServiceObjectRegistry
+from eavesdroppr.state import StateStore, read_segments
+from tests.helpers import make_event
+
+try:
+    from snap import common as snap_common
+except ImportError:
+    snap_common = None
+
+
+
+class StateStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.state')
+        self.stores = []
+
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+
+    def open_store(self, **kwargs):
+        store = StateStore(path=self.path, snapshot_interval=3600, **kwargs)
+        self.stores.append(store)
+        return store
+
+
+    def test_empty_store_can_be_looked_up(self):
+        store = self.open_store()
+        self.assertEqual(len(store), 0)
+        self.assertTrue(store)
+        self.assertIs(ServiceObjectRegistry({'state': store}).lookup('state'), store)
+
+
+    @unittest.skipIf(snap_common is None, 'snap is not installed')
+    def test_empty_store_can_be_looked_up_through_snap(self):
+        store = self.open_store()
+        self.assertIs(snap_common.ServiceObjectRegistry({'state': store}).lookup('state'), store)
+
+
+    def test_state_survives_a_restart(self):
+        store = self.open_store()
+        store.put('a', {'total': 1})
+        store.incr('n', 5)
+        store.put('gone', 1)
+        store.snapshot()
+        store.delete('gone')
+        store.incr('n')
+        store.mark(make_event(txid=42, source='db'))
+        store.close()
+
+        restored = self.open_store()
+        self.assertEqual(restored.get('a'), {'total': 1})
+        self.assertEqual(restored.get('n'), 6)
+        self.assertNotIn('gone', restored)
+        self.assertEqual(restored.position('db'), 42)
+        self.assertIsNone(restored.position())
+
+
+    def test_snapshots_append_changes_only(self):
+        store = self.open_store(compact_ratio=100)
+        for i in range(10):
+            store.put(i, i)
+        store.snapshot()
+        store.put(0, 'changed')
+        store.snapshot()
+        segments = [segment for segment, end in read_segments(self.path)]
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(segments[1]['puts'], {0: 'changed'})
+
+
+    def test_file_is_compacted_when_it_grows(self):
+        store = self.open_store(compact_ratio=2)
+        store.put('k', 0)
+        store.snapshot()
+        for i in range(10):
+            store.put('k', i)
+            store.snapshot()
+        segments = [segment for segment, end in read_segments(self.path)]
+        self.assertLess(len(segments), 4)
+        store.close()
+        self.assertEqual(self.open_store().get('k'), 9)
+
+
+    def test_torn_tail_is_ignored(self):
+        store = self.open_store(compact_ratio=100)
+        store.put('a', 1)
+        store.snapshot()
+        store.put('a', 2)
+        store.snapshot()
+        store.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        self.assertEqual(self.open_store().get('a'), 1)
+
+
+    def test_writes_after_a_torn_tail_survive(self):
+        store = self.open_store(compact_ratio=100)
+        store.put('a', 1)
+        store.put('b', 2)
+        store.snapshot()
+        # a crash part way through appending a segment
+        store.put('lost', 3)
+        store.snapshot()
+        store.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        store = self.open_store(compact_ratio=100)
+        self.assertEqual(sorted(store.keys()), ['a', 'b'])
+        store.put('c', 4)
+        store.snapshot()
+        store.close()
+
+        store = self.open_store(compact_ratio=100)
+        self.assertEqual(sorted(store.keys()), ['a', 'b', 'c'])
+        store.put('d', 5)
+        store.close()
+        self.assertEqual(sorted(self.open_store(compact_ratio=100).keys()), ['a', 'b', 'c', 'd'])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
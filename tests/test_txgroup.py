@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import unittest
+from eavesdroppr.txgroup import TransactionGrouper
+from tests.helpers import make_event
+
+
+
+class TransactionGrouperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transactions = []
+        self.grouper = TransactionGrouper(
+            lambda txid, events, registry: self.transactions.append((txid, [e.primary_key for e in events])))
+
+
+    def test_groups_consecutive_events_of_a_transaction(self):
+        for pk, txid in [(1, 10), (2, 10), (3, 11)]:
+            self.grouper.add(make_event(pk, txid=txid), None)
+        self.assertEqual(self.transactions, [(10, [1, 2])])
+        self.assertTrue(self.grouper.has_pending)
+        self.grouper.flush(None)
+        self.assertEqual(self.transactions, [(10, [1, 2]), (11, [3])])
+        self.assertFalse(self.grouper.has_pending)
+
+
+    def test_same_txid_from_another_database_is_another_transaction(self):
+        self.grouper.add(make_event(1, txid=10, source='db1'), None)
+        self.grouper.add(make_event(2, txid=10, source='db2'), None)
+        self.grouper.flush(None)
+        self.assertEqual(self.transactions, [(10, [1]), (10, [2])])
+
+
+    def test_events_without_txid_stand_alone(self):
+        self.grouper.add(make_event(1, txid=10), None)
+        self.grouper.add(make_event(2, txid=None), None)
+        self.assertEqual(self.transactions, [(10, [1]), (None, [2])])
+        self.assertFalse(self.grouper.has_pending)
+
+
+    def test_snapshot_rows_are_grouped_until_flushed(self):
+        for pk in range(3):
+            self.grouper.add(make_event(pk, txid=None, snapshot=True), None)
+        self.assertEqual(self.transactions, [])
+        self.grouper.flush(None)
+        self.assertEqual(self.transactions, [(None, [0, 1, 2])])
+
+
+    def test_pending_transaction_never_expires(self):
+        self.grouper.add(make_event(1, txid=10), None)
+        self.assertFalse(self.grouper.expired(float('inf')))
+
+
+
+if __name__ == '__main__':
+    unittest.main()